@@ -0,0 +1,447 @@
+"""
+Local HTTP generation API.
+Lets other systems call the document generators without the web interface.
+Documents are generated as jobs on the shared job executor; the server
+admits a bounded number of them (overall and per client) and answers 429
+with a Retry-After header once it is saturated instead of queueing
+without limit.
+
+    python src/api_server.py --port 8765 --provider ollama --model llama3
+
+Endpoints (request bodies use the batch manifest fields: subject,
+grade_level, doc_type, topic and, optionally, provider, model, language,
+params or the generation parameters of the document type's form in the
+app; counts are clamped to the form's ranges and anything else is a 400;
+a model must be on the server's allow-list, and a local model can't be
+swapped at all):
+
+    POST   /v1/documents               generate and wait for the result
+                                       (?format=docx returns the file,
+                                       ?stream=1 streams NDJSON progress)
+    POST   /v1/jobs                    submit a job, 202 with its ID
+    GET    /v1/jobs/<id>               job status and, when done, content
+    GET    /v1/jobs/<id>/stream        NDJSON progress of a job
+    GET    /v1/jobs/<id>/files/<fmt>   docx, pptx, md or zip of a done job
+    DELETE /v1/jobs/<id>               cancel a job
+    GET    /v1/health                  load, job counts and provider queues
+
+Clients are told apart by their address; headers they send are not trusted for it.
+"""
+
+import argparse
+import asyncio
+from collections import deque
+import json
+import math
+import os
+import sys
+import threading
+from pathlib import Path
+
+# Add src directory to path for imports
+src_path = Path(__file__).parent
+sys.path.append(str(src_path))
+
+import tornado.ioloop
+import tornado.web
+from tornado.iostream import StreamClosedError
+
+from batch import DEFAULT_MODELS, DOC_TYPE_LABELS, add_llm_arguments, base_llm_config_from_args, build_params
+from components.generation_jobs import DONE, get_job_executor
+from generators.export_bundle import EXPORT_FORMATS, MIME_TYPES
+from llm_handlers import ollama_catalog
+from llm_handlers.rate_governor import get_governor_stats
+from llm_handlers.single_flight import get_single_flight
+
+# Jobs accepted and not yet finished, overall and per client
+API_MAX_PENDING = int(os.getenv("EDUADOCS_API_MAX_PENDING", "32"))
+API_CLIENT_LIMIT = int(os.getenv("EDUADOCS_API_CLIENT_LIMIT", "4"))
+
+# Retry-After for rejected requests until job durations are known
+API_RETRY_AFTER_SECONDS = int(os.getenv("EDUADOCS_API_RETRY_AFTER", "5"))
+
+# Seconds between progress events of a streamed response
+STREAM_INTERVAL_SECONDS = 0.2
+
+MAX_BODY_BYTES = 1024 * 1024
+
+# Request fields that are not generation parameters
+REQUEST_FIELDS = ("subject", "grade_level", "grade", "doc_type", "topic", "provider", "model", "language", "params")
+
+# Generation parameters a client may set per document type: their type,
+# or the (min, max) range a count is clamped to (the app's inputs)
+API_PARAMS = {
+    "lesson_plan": {"duration_minutes": (10, 240), "learning_objectives": str, "materials": str,
+                    "methodology": str, "assessment_strategy": str, "lesson_flow": str,
+                    "include_differentiation": bool, "outline_first": bool},
+    "lecture_notes": {"detail_level": str, "format_style": str, "include_examples": bool,
+                      "include_references": bool, "outline_first": bool},
+    "exercise": {"num_questions": (1, 100), "difficulty": str, "question_types": list,
+                 "include_answer_key": bool, "sharded_generation": bool, "difficulty_levels": list},
+    "mind_map": {"main_branches": (3, 12), "depth_levels": (2, 6), "include_examples": bool,
+                 "highlight_hierarchy": bool, "lazy_branches": bool},
+    "powerpoint": {"num_slides": (1, 50), "include_images": bool, "presentation_style": str},
+    "summary": {"summary_length": str, "format_style": str, "include_examples": bool},
+}
+
+LANGUAGES = ("en", "pt")
+
+# Models a client may ask for, besides the one the server was started with
+API_MODELS = [model.strip() for model in os.getenv("EDUADOCS_API_MODELS", "").split(",") if model.strip()] \
+    or list(DEFAULT_MODELS.values())
+
+
+class AdmissionControl:
+    """Bounds the jobs the API has accepted, overall and per client."""
+
+    def __init__(self, max_pending=API_MAX_PENDING, client_limit=API_CLIENT_LIMIT):
+        self.max_pending = max_pending
+        self.client_limit = client_limit
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._clients = {}
+        self._durations = deque(maxlen=20)
+        self._stats = {"admitted": 0, "rejected_busy": 0, "rejected_client": 0}
+
+    def acquire(self, client):
+        """Reserve a slot for a client's job; returns None or why it was refused"""
+        with self._lock:
+            if self._clients.get(client, 0) >= self.client_limit:
+                self._stats["rejected_client"] += 1
+                return f"Too many unfinished jobs for this client (limit {self.client_limit})"
+            if self._pending >= self.max_pending:
+                self._stats["rejected_busy"] += 1
+                return "Server busy, try again later"
+            self._pending += 1
+            self._clients[client] = self._clients.get(client, 0) + 1
+            self._stats["admitted"] += 1
+        return None
+
+    def release(self, client, seconds=None):
+        """Free a client's slot once its job has finished"""
+        with self._lock:
+            self._pending -= 1
+            self._clients[client] -= 1
+            if not self._clients[client]:
+                del self._clients[client]
+            if seconds is not None:
+                self._durations.append(seconds)
+
+    def retry_after(self):
+        """Seconds a refused client should wait: about one recent job's duration"""
+        with self._lock:
+            if not self._durations:
+                return API_RETRY_AFTER_SECONDS
+            return max(1, math.ceil(sum(self._durations) / len(self._durations)))
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, pending=self._pending, clients=len(self._clients),
+                        max_pending=self.max_pending, client_limit=self.client_limit)
+
+
+def _check_value(key, value, kind):
+    """Validate one client parameter; counts are clamped to their range"""
+    if isinstance(kind, tuple):
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"{key} must be an integer")
+        return min(max(value, kind[0]), kind[1])
+    if kind is list:
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            raise ValueError(f"{key} must be a list of strings")
+        return value
+    if not isinstance(value, kind):
+        raise ValueError(f"{key} must be a {'boolean' if kind is bool else 'string'}")
+    return value
+
+
+def _check_model(clean, base_llm_config):
+    """Refuse models the server doesn't offer (a local one would be downloaded)"""
+    model = clean.get("model", "").strip()
+    if not model or model == base_llm_config.get("model"):
+        return
+    provider = clean.get("provider", "").strip() or base_llm_config.get("provider")
+    if base_llm_config.get("use_local") and provider == base_llm_config.get("provider"):
+        raise ValueError("This server runs a local model; model can't be changed")
+    if model not in API_MODELS:
+        raise ValueError(f"Unsupported model: {model} (expected one of {', '.join(API_MODELS)})")
+
+
+def validate_request(row, base_llm_config):
+    """
+    Check a request body against what a client may set and return it as a
+    manifest row. Server-side settings (LLM config, cache bypass, template
+    paths, sessions) can't be set by clients, and models are limited to
+    API_MODELS.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("The request body must be a JSON object")
+    doc_type_key = str(row.get("doc_type") or "").strip().lower().replace(" ", "_")
+    if doc_type_key not in DOC_TYPE_LABELS:
+        raise ValueError(f"Unknown document type: {row.get('doc_type')}")
+    allowed = API_PARAMS[doc_type_key]
+
+    params = row.get("params") or {}
+    if not isinstance(params, dict):
+        raise ValueError("params must be a JSON object")
+    params = dict(params, **{key: value for key, value in row.items() if key not in REQUEST_FIELDS})
+    for key, value in params.items():
+        if key not in allowed:
+            raise ValueError(f"Unsupported parameter for {doc_type_key}: {key}")
+        params[key] = _check_value(key, value, allowed[key])
+
+    clean = {key: row[key] for key in REQUEST_FIELDS if key != "params" and row.get(key) is not None}
+    for key, value in clean.items():
+        _check_value(key, value, str)
+    if clean.get("language", "en") not in LANGUAGES:
+        raise ValueError(f"Unsupported language: {clean['language']}")
+    _check_model(clean, base_llm_config)
+    clean["params"] = params
+    return clean
+
+
+def _check_connection(params):
+    """Mark an Ollama config as connected the way the app does (blocking)"""
+    llm_config = params["llm_config"]
+    if llm_config.get("provider") == "ollama":
+        llm_config["connected"] = ollama_catalog.get_catalog(llm_config.get("host", ""))["connected"]
+
+
+def job_payload(job):
+    """JSON description of a job"""
+    payload = {
+        "id": job.id,
+        "status": job.status,
+        "doc_type": job.params.get("doc_type"),
+        "provider": job.provider,
+        "elapsed_seconds": round(job.elapsed(), 2)
+    }
+    if job.error:
+        payload["error"] = job.error
+    if job.status == DONE:
+        payload["content"] = job.result["content"]
+        payload["files"] = {fmt: f"/v1/jobs/{job.id}/files/{fmt}" for fmt in EXPORT_FORMATS}
+    return payload
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, executor, admission, base_llm_config):
+        self.executor = executor
+        self.admission = admission
+        self.base_llm_config = base_llm_config
+        self.connection_closed = False
+
+    def on_connection_close(self):
+        self.connection_closed = True
+
+    def client_id(self):
+        """Who a request counts against: the peer address, which the client can't pick"""
+        return self.request.remote_ip
+
+    def send_json(self, payload, status=200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps(payload, ensure_ascii=False))
+
+    def write_error(self, status_code, **kwargs):
+        message = self._reason
+        if "exc_info" in kwargs and isinstance(kwargs["exc_info"][1], tornado.web.HTTPError):
+            message = kwargs["exc_info"][1].log_message or message
+        self.send_json({"error": message}, status=status_code)
+
+    def get_job(self, job_id):
+        job = self.executor.get(job_id)
+        if job is None:
+            raise tornado.web.HTTPError(404, "Unknown or expired job")
+        return job
+
+    async def submit(self):
+        """Validate the request body and start its job, or answer 4xx/429 and return None"""
+        try:
+            row = validate_request(json.loads(self.request.body or b"{}"), self.base_llm_config)
+            params = build_params(row, self.base_llm_config)
+        except Exception as e:
+            raise tornado.web.HTTPError(400, str(e))
+
+        client = self.client_id()
+        refused = self.admission.acquire(client)
+        if refused:
+            self.set_header("Retry-After", str(self.admission.retry_after()))
+            self.send_json({"error": refused}, status=429)
+            return None
+
+        try:
+            # A client's files share one session's share of the artifact memory
+            params["session_id"] = f"api:{client}"
+            await tornado.ioloop.IOLoop.current().run_in_executor(None, _check_connection, params)
+            job = self.executor.submit(params)
+        except Exception:
+            self.admission.release(client)
+            raise
+        job.add_done_callback(lambda job: self.admission.release(
+            client, job.finished_at - job.started_at if job.started_at else None
+        ))
+        return job
+
+    async def wait_for(self, job):
+        """Wait without blocking the server until a job has finished"""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def _resolve():
+            if not finished.done():
+                finished.set_result(None)
+
+        job.add_done_callback(lambda _: loop.call_soon_threadsafe(_resolve))
+        await finished
+
+    async def stream(self, job):
+        """Write a job's progress as NDJSON events until it finishes"""
+        self.set_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        sent = ""
+        try:
+            self.write(json.dumps({"event": "accepted", "id": job.id}) + "\n")
+            await self.flush()
+            while True:
+                finished = job.finished
+                text = job.preview
+                if text != sent:
+                    if text.startswith(sent):
+                        event = {"event": "token", "text": text[len(sent):]}
+                    else:
+                        # A partial document replaced the streamed text
+                        event = {"event": "preview", "text": text}
+                    self.write(json.dumps(event, ensure_ascii=False) + "\n")
+                    sent = text
+                if finished:
+                    self.write(json.dumps(dict(job_payload(job), event="done"), ensure_ascii=False) + "\n")
+                    break
+                await self.flush()
+                await asyncio.sleep(STREAM_INTERVAL_SECONDS)
+            await self.finish()
+        except StreamClosedError:
+            pass
+
+
+class DocumentsHandler(BaseHandler):
+    job = None
+
+    async def post(self):
+        fmt = self.get_query_argument("format", None)
+        if fmt is not None and fmt not in EXPORT_FORMATS:
+            raise tornado.web.HTTPError(400, f"Unsupported export format: {fmt}")
+        self.job = job = await self.submit()
+        if job is None:
+            return
+
+        if self.get_query_argument("stream", "0") not in ("0", "false", ""):
+            await self.stream(job)
+            return
+
+        await self.wait_for(job)
+        if self.connection_closed:
+            return
+        if job.status != DONE:
+            self.send_json(job_payload(job), status=500)
+        elif fmt is not None:
+            await send_file(self, job, fmt)
+        else:
+            self.send_json(job_payload(job))
+
+    def on_connection_close(self):
+        super().on_connection_close()
+        # Nobody is waiting for the document any more
+        if self.job is not None:
+            self.job.cancel()
+
+
+class JobsHandler(BaseHandler):
+    async def post(self):
+        job = await self.submit()
+        if job is None:
+            return
+        self.set_header("Location", f"/v1/jobs/{job.id}")
+        self.send_json(job_payload(job), status=202)
+
+
+class JobHandler(BaseHandler):
+    def get(self, job_id):
+        self.send_json(job_payload(self.get_job(job_id)))
+
+    def delete(self, job_id):
+        job = self.get_job(job_id)
+        job.cancel()
+        self.send_json(job_payload(job), status=202)
+
+
+class JobStreamHandler(BaseHandler):
+    async def get(self, job_id):
+        await self.stream(self.get_job(job_id))
+
+
+async def send_file(handler, job, fmt):
+    """Answer with one exported format of a finished job"""
+    data = await tornado.ioloop.IOLoop.current().run_in_executor(None, job.bundle.get, fmt)
+    handler.set_header("Content-Type", MIME_TYPES[fmt])
+    handler.set_header("Content-Disposition", f'attachment; filename="{job.bundle.file_name(fmt)}"')
+    await handler.finish(data)
+
+
+class JobFileHandler(BaseHandler):
+    async def get(self, job_id, fmt):
+        job = self.get_job(job_id)
+        if fmt not in EXPORT_FORMATS:
+            raise tornado.web.HTTPError(404, f"Unsupported export format: {fmt}")
+        if job.status != DONE:
+            raise tornado.web.HTTPError(409, f"Job is {job.status}")
+        await send_file(self, job, fmt)
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.send_json({
+            "status": "ok",
+            "admission": self.admission.get_stats(),
+            "jobs": self.executor.get_stats(),
+            "governor": get_governor_stats(),
+            "single_flight": get_single_flight().get_stats()
+        })
+
+
+def make_app(base_llm_config, executor=None, admission=None):
+    """Build the Tornado application"""
+    settings = {
+        "executor": executor or get_job_executor(),
+        "admission": admission or AdmissionControl(),
+        "base_llm_config": base_llm_config
+    }
+    return tornado.web.Application([
+        (r"/v1/documents", DocumentsHandler, settings),
+        (r"/v1/jobs", JobsHandler, settings),
+        (r"/v1/jobs/([0-9a-f]+)", JobHandler, settings),
+        (r"/v1/jobs/([0-9a-f]+)/stream", JobStreamHandler, settings),
+        (r"/v1/jobs/([0-9a-f]+)/files/(\w+)", JobFileHandler, settings),
+        (r"/v1/health", HealthHandler, settings),
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the EduADocs generators over HTTP.")
+    parser.add_argument("--address", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765)
+    add_llm_arguments(parser)
+    args = parser.parse_args(argv)
+
+    app = make_app(base_llm_config_from_args(args))
+    app.listen(args.port, address=args.address, max_body_size=MAX_BODY_BYTES)
+    print(f"EduADocs API listening on http://{args.address}:{args.port}")
+    try:
+        tornado.ioloop.IOLoop.current().start()
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
+import copy
+import functools
 import streamlit as st
 import sys
+import uuid
 from pathlib import Path
 
 # Add src directory to path for imports
@@ -7,8 +10,110 @@ src_path = Path(__file__).parent
 sys.path.append(str(src_path))
 
 from components import llm_selector, document_generator, language_selector
+from components.generation_jobs import DONE, FAILED, QUEUED, get_job_executor
+from generators.export_bundle import EXPORT_FORMATS, MIME_TYPES
+from utils.artifact_store import get_artifact_store
 from utils.validation import validate_inputs
-from utils.language_manager import i18n, i18n_list
+from utils.markdown_parser import render_markdown
+from utils.language_manager import get_language_manager, i18n, i18n_list
+
+# Delay between polls of a background generation (redraws of its preview)
+JOB_POLL_SECONDS = 0.5
+
+DOWNLOAD_LABEL_KEYS = {
+    "docx": "generation.download_word_label",
+    "pptx": "generation.download_ppt_label",
+    "md": "generation.download_markdown_label",
+    "zip": "generation.download_zip_label"
+}
+
+def display_branch_expansion(last_document):
+    """Let the teacher expand the mind map branches that were left collapsed"""
+    tree = last_document["mind_map"]
+    pending = [index for index, branch in enumerate(tree.children) if not branch.expanded]
+    if not pending:
+        return
+    
+    st.subheader(i18n("mind_map.expand_header"))
+    branch_index = st.selectbox(
+        i18n("mind_map.expand_branch_label"),
+        pending,
+        format_func=lambda index: tree.children[index].text,
+        key="expand_branch"
+    )
+    running = bool(st.session_state.get("generation_job"))
+    if st.button(i18n("mind_map.expand_button"), key="expand_branch_button", disabled=running):
+        # Like a generation, the expansion runs in the background; the job
+        # works on its own copy of the map while this one is still shown
+        task = functools.partial(document_generator.expand_mind_map_branch, copy.deepcopy(tree), branch_index)
+        st.session_state["generation_job"] = get_job_executor().submit(last_document["params"], task=task).id
+        st.rerun()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def display_generation_job(job_id):
+    """Show a background generation's progress until it finishes"""
+    job = get_job_executor().get(job_id)
+    if job is None:
+        # Expired or from a restarted server
+        st.session_state.pop("generation_job", None)
+        return
+    
+    if job.finished:
+        st.session_state.pop("generation_job", None)
+        if job.status == DONE:
+            result = job.result
+            # Other formats are built from the same content on request
+            st.session_state["last_document"] = {
+                "content": result["content"],
+                "blocks": result.get("blocks"),
+                "bundle": job.bundle,
+                "params": job.params,
+                "mind_map": result.get("mind_map")
+            }
+            st.session_state["generation_notice"] = ("success", i18n("generation.success_message"))
+        elif job.status == FAILED:
+            st.session_state["generation_notice"] = ("error", i18n("generation.error_generating_template").format(error=job.error))
+        else:
+            st.session_state["generation_notice"] = ("info", i18n("generation.cancelled_message"))
+        st.rerun()
+    
+    # Preview is filled progressively while the LLM streams
+    st.header(i18n("generation.document_preview_header"))
+    with st.expander(i18n("generation.view_generated_content"), expanded=True):
+        st.markdown(job.preview + "▌")
+    
+    status = i18n("generation.queued_message") if job.status == QUEUED else i18n("generation.spinner_message")
+    st.caption(f"{status} ({job.elapsed():.0f} s)")
+    if job.cancel_requested:
+        st.caption(i18n("generation.cancelling_message"))
+    elif st.button(i18n("generation.cancel_button"), key="cancel_generation"):
+        job.cancel()
+        st.rerun(scope="fragment")
+
+def display_downloads(bundle):
+    """Download buttons for every export format, loaded only when asked for"""
+    st.header(i18n("generation.download_options_header"))
+    columns = st.columns(len(EXPORT_FORMATS))
+    
+    for column, fmt in zip(columns, EXPORT_FORMATS):
+        with column:
+            # The file is read and sent to the browser in the run that asks for it only
+            if not st.button(i18n("generation.prepare_download_label").format(format=fmt.upper()), key=f"prepare_{fmt}"):
+                continue
+            with st.spinner(i18n("generation.preparing_download_message").format(format=fmt.upper())):
+                try:
+                    data = bundle.get(fmt)
+                except Exception as e:
+                    st.error(i18n("generation.exception_template").format(error=str(e)))
+                    continue
+            st.download_button(
+                label=i18n(DOWNLOAD_LABEL_KEYS[fmt]),
+                data=data,
+                file_name=bundle.file_name(fmt),
+                mime=MIME_TYPES[fmt],
+                key=f"download_{fmt}",
+                on_click="ignore"
+            )
 
 def main():
     st.set_page_config(
@@ -97,6 +202,7 @@ def main():
         duration_minutes = st.number_input(
             i18n("lesson_plan.duration_label"),
             min_value=10,
+            max_value=240,
             value=50,
             step=5,
             help=i18n("lesson_plan.duration_help")
@@ -129,6 +235,11 @@ def main():
             i18n("lesson_plan.include_differentiation_label"),
             value=True
         )
+        outline_first = st.checkbox(
+            i18n("generation.outline_first_label"),
+            value=True,
+            help=i18n("generation.outline_first_help")
+        )
 
     elif doc_type_key == "lecture_notes":  # Lecture Notes
         detail_level = st.selectbox(
@@ -147,11 +258,16 @@ def main():
             i18n("lecture_notes.include_references_label"),
             value=False
         )
+        outline_first = st.checkbox(
+            i18n("generation.outline_first_label"),
+            value=True,
+            help=i18n("generation.outline_first_help")
+        )
 
     elif doc_type_key == "exercise":  # Exercise List
         num_questions = st.number_input(
             i18n("exercise_list.num_questions_label"), 
-            min_value=1, value=10, step=1
+            min_value=1, max_value=100, value=10, step=1
         )
         difficulty_options = i18n_list("exercise_list.difficulty_options")
         difficulty = st.select_slider(
@@ -168,11 +284,21 @@ def main():
             i18n("exercise_list.include_answer_key_label"),
             value=True
         )
+        sharded_generation = st.checkbox(
+            i18n("exercise_list.sharded_generation_label"),
+            value=True,
+            help=i18n("exercise_list.sharded_generation_help")
+        )
+        # The last option ("Mixed") spreads the questions over the other levels
+        difficulty_levels = [difficulty]
+        if len(difficulty_options) > 1 and difficulty == difficulty_options[-1]:
+            difficulty_levels = difficulty_options[:-1]
 
     elif doc_type_key == "mind_map":  # Lesson Mind Map
         main_branches = st.number_input(
             i18n("mind_map.main_branches_label"),
             min_value=3,
+            max_value=12,
             value=6,
             step=1
         )
@@ -191,6 +317,11 @@ def main():
             i18n("mind_map.highlight_hierarchy_label"),
             value=True
         )
+        lazy_branches = st.checkbox(
+            i18n("mind_map.lazy_branches_label"),
+            value=False,
+            help=i18n("mind_map.lazy_branches_help")
+        )
 
     elif doc_type_key == "assessment":  # Assessment
         st.caption(i18n("assessment.coming_soon"))
@@ -199,6 +330,13 @@ def main():
     if button_disabled:
         st.info(i18n("assessment.coming_soon"))
 
+    regenerate = st.checkbox(
+        i18n("generation.regenerate_label"),
+        value=False,
+        help=i18n("generation.regenerate_help"),
+        disabled=button_disabled
+    )
+
     if st.button(
         i18n("generation.generate_button"),
         type="primary",
@@ -210,90 +348,96 @@ def main():
         is_valid, validation_message = validate_inputs(subject, topic, selected_llm)
         
         if is_valid:
-            with st.spinner(i18n("generation.spinner_message")):
-                try:
-                    # Prepare generation parameters
-                    params = {
-                        "doc_type": doc_type,
-                        "doc_type_key": doc_type_key,
-                        "subject": subject,
-                        "grade_level": grade_level,
-                        "topic": topic,
-                        "llm_config": selected_llm
-                    }
-                    
-                    # Add specific parameters based on document type
-                    if doc_type_key == "lesson_plan":
-                        params.update({
-                            "duration_minutes": duration_minutes,
-                            "learning_objectives": learning_objectives,
-                            "materials": materials,
-                            "methodology": methodology,
-                            "assessment_strategy": assessment_strategy,
-                            "lesson_flow": lesson_flow,
-                            "include_differentiation": include_differentiation
-                        })
-                    elif doc_type_key == "lecture_notes":
-                        params.update({
-                            "detail_level": detail_level,
-                            "format_style": format_style,
-                            "include_examples": include_examples,
-                            "include_references": include_references
-                        })
-                    elif doc_type_key == "exercise":
-                        params.update({
-                            "num_questions": num_questions,
-                            "difficulty": difficulty,
-                            "question_types": question_types,
-                            "include_answer_key": include_answer_key
-                        })
-                    elif doc_type_key == "mind_map":
-                        params.update({
-                            "main_branches": main_branches,
-                            "depth_levels": depth_levels,
-                            "include_examples": include_examples,
-                            "highlight_hierarchy": highlight_hierarchy
-                        })
-                    
-                    # Generate document
-                    result = document_generator.generate_document(params)
-                    
-                    if result["success"]:
-                        st.success(i18n("generation.success_message"))
-                        
-                        # Display preview
-                        st.header(i18n("generation.document_preview_header"))
-                        with st.expander(i18n("generation.view_generated_content"), expanded=True):
-                            st.markdown(result["content"])
-
-                        # Download options
-                        st.header(i18n("generation.download_options_header"))
-                        col_download1, col_download2 = st.columns(2)
-                        
-                        with col_download1:
-                            if result.get("docx_file"):
-                                st.download_button(
-                                    label=i18n("generation.download_word_label"),
-                                    data=result["docx_file"],
-                                    file_name=f"{subject}_{doc_type.replace(' ', '_')}.docx",
-                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                                )
-                        
-                        with col_download2:
-                            if result.get("pptx_file"):
-                                st.download_button(
-                                    label=i18n("generation.download_ppt_label"),
-                                    data=result["pptx_file"],
-                                    file_name=f"{subject}_{doc_type.replace(' ', '_')}.pptx",
-                                    mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
-                                )
-                    else:
-                        st.error(i18n("generation.error_generating_template").format(error=result['error']))
-                        
-                except Exception as e:
-                    st.error(i18n("generation.exception_template").format(error=str(e)))
+            # Downloads of the previous document go away with it
+            st.session_state.pop("last_document", None)
+            session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+            get_artifact_store().release_session(session_id)
+            try:
+                # Prepare generation parameters
+                params = {
+                    "doc_type": doc_type,
+                    "doc_type_key": doc_type_key,
+                    "subject": subject,
+                    "grade_level": grade_level,
+                    "topic": topic,
+                    "llm_config": dict(selected_llm, bypass_cache=regenerate),
+                    # Jobs run outside the session; headings they write use its language
+                    "language": get_language_manager().get_current_language(),
+                    # Owner of the generated files in the artifact store
+                    "session_id": session_id
+                }
+                
+                # Add specific parameters based on document type
+                if doc_type_key == "lesson_plan":
+                    params.update({
+                        "duration_minutes": duration_minutes,
+                        "learning_objectives": learning_objectives,
+                        "materials": materials,
+                        "methodology": methodology,
+                        "assessment_strategy": assessment_strategy,
+                        "lesson_flow": lesson_flow,
+                        "include_differentiation": include_differentiation,
+                        "outline_first": outline_first
+                    })
+                elif doc_type_key == "lecture_notes":
+                    params.update({
+                        "detail_level": detail_level,
+                        "format_style": format_style,
+                        "include_examples": include_examples,
+                        "include_references": include_references,
+                        "outline_first": outline_first
+                    })
+                elif doc_type_key == "exercise":
+                    params.update({
+                        "num_questions": num_questions,
+                        "difficulty": difficulty,
+                        "question_types": question_types,
+                        "include_answer_key": include_answer_key,
+                        "sharded_generation": sharded_generation,
+                        "difficulty_levels": difficulty_levels
+                    })
+                elif doc_type_key == "mind_map":
+                    params.update({
+                        "main_branches": main_branches,
+                        "depth_levels": depth_levels,
+                        "include_examples": include_examples,
+                        "highlight_hierarchy": highlight_hierarchy,
+                        "lazy_branches": lazy_branches
+                    })
+                
+                # Generation runs in the background; this script only polls it
+                executor = get_job_executor()
+                previous_job = st.session_state.get("generation_job")
+                if previous_job:
+                    executor.cancel(previous_job)
+                st.session_state["generation_job"] = executor.submit(params).id
+                
+            except Exception as e:
+                st.error(i18n("generation.exception_template").format(error=str(e)))
         else:
             st.warning(validation_message)
 
+    job_id = st.session_state.get("generation_job")
+    if job_id:
+        display_generation_job(job_id)
+    
+    notice = st.session_state.pop("generation_notice", None)
+    if notice:
+        kind, message = notice
+        getattr(st, kind)(message)
+
+    last_document = st.session_state.get("last_document")
+    if last_document:
+        # Reruns (e.g. preparing a download) keep showing the last document
+        st.header(i18n("generation.document_preview_header"))
+        with st.expander(i18n("generation.view_generated_content"), expanded=True):
+            if last_document["blocks"] is not None:
+                st.markdown(render_markdown(last_document["blocks"]))
+            else:
+                st.markdown(last_document["content"])
+        if last_document.get("mind_map") is not None:
+            display_branch_expansion(last_document)
+        display_downloads(last_document["bundle"])
+
 if __name__ == "__main__":
     main()
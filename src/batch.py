@@ -0,0 +1,418 @@
+"""
+Headless batch generation.
+Reads a manifest (CSV or JSON) with one document per row, generates every
+row with document_generator.generate_document on a thread or process pool
+and writes the files to an output directory. Finished rows are recorded in
+a checkpoint, so an interrupted run resumes where it stopped.
+
+    python src/batch.py term.csv -o output --provider ollama --model llama3 \\
+        --workers 6 --limit ollama=2 --formats docx,md
+
+Manifest columns: subject, grade_level (or grade), doc_type, topic and,
+optionally, id, provider, model, params (a JSON object) and any other
+generation parameter (e.g. num_questions), given as JSON or plain text.
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+# Add src directory to path for imports
+src_path = Path(__file__).parent
+sys.path.append(str(src_path))
+
+from components import document_generator
+from generators.export_bundle import EXPORT_FORMATS, create_export_bundle
+from llm_handlers import ollama_catalog
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+REPORT_FILE = "report.json"
+
+DOC_TYPE_LABELS = {
+    "lesson_plan": "Lesson Plan",
+    "lecture_notes": "Lecture Notes",
+    "exercise": "Exercise List",
+    "mind_map": "Lesson Mind Map",
+    "powerpoint": "PowerPoint Presentation",
+    "summary": "Summary",
+}
+
+# The same defaults the app's forms start with
+DEFAULT_PARAMS = {
+    "lesson_plan": {"duration_minutes": 50, "include_differentiation": True, "outline_first": True},
+    "lecture_notes": {"detail_level": "Standard", "format_style": "Paragraphs", "include_examples": True,
+                      "include_references": False, "outline_first": True},
+    "exercise": {"num_questions": 10, "difficulty": "Medium", "question_types": ["Multiple Choice", "Short Answer"],
+                 "include_answer_key": True, "sharded_generation": True},
+    "mind_map": {"main_branches": 6, "depth_levels": 3, "include_examples": True, "highlight_hierarchy": True},
+    "powerpoint": {"num_slides": 10, "include_images": False, "presentation_style": "Educational"},
+    "summary": {"summary_length": "Detailed (3-5 pages)", "format_style": "Paragraphs", "include_examples": True},
+}
+
+# Manifest columns that are not generation parameters
+_ROW_FIELDS = ("id", "subject", "grade_level", "grade", "doc_type", "topic", "provider", "model", "params")
+
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+
+API_KEY_VARIABLES = {
+    "openai": "OPENAI_API_KEY",
+    "google": "GOOGLE_API_KEY",
+    "huggingface": "HUGGINGFACE_API_KEY",
+}
+
+# Model used when none is given: the first choice of the app's selectors
+DEFAULT_MODELS = {
+    "ollama": "llama2",
+    "openai": "gpt-5-nano",
+    "google": "gemini-2.5-pro",
+    "huggingface": "microsoft/DialoGPT-large",
+}
+
+
+def _parse_value(value):
+    """Manifest cells may hold JSON (numbers, booleans, lists); anything else is text"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def load_manifest(path):
+    """Read the manifest rows as dicts"""
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        with open(path, encoding="utf-8") as manifest:
+            rows = json.load(manifest)
+        if isinstance(rows, dict):
+            rows = rows.get("rows", [])
+    else:
+        with open(path, encoding="utf-8", newline="") as manifest:
+            rows = [
+                {key.strip(): value for key, value in row.items() if key and value not in (None, "")}
+                for row in csv.DictReader(manifest)
+            ]
+    return rows
+
+
+def row_id(row):
+    """Stable ID of a row: its own ``id`` or a hash of its contents"""
+    if row.get("id"):
+        return str(row["id"])
+    encoded = json.dumps(row, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+def _doc_type_key(doc_type):
+    key = (doc_type or "").strip().lower().replace(" ", "_")
+    return key if key in DOC_TYPE_LABELS else None
+
+
+def build_params(row, base_llm_config):
+    """Turn a manifest row into generate_document parameters"""
+    doc_type = row.get("doc_type") or ""
+    doc_type_key = _doc_type_key(doc_type)
+
+    params = dict(DEFAULT_PARAMS.get(doc_type_key, {}))
+    extra = _parse_value(row.get("params")) or {}
+    if not isinstance(extra, dict):
+        raise Exception("The params column must be a JSON object")
+    params.update({key: _parse_value(value) for key, value in row.items() if key not in _ROW_FIELDS})
+    params.update(extra)
+
+    llm_config = dict(base_llm_config)
+    provider = str(row.get("provider") or "").strip()
+    if provider and provider != base_llm_config.get("provider"):
+        # Another provider's settings don't carry over; start from its own
+        llm_config = llm_config_for(
+            provider, temperature=base_llm_config.get("temperature", 0.7),
+            bypass_cache=base_llm_config.get("bypass_cache", False)
+        )
+    if row.get("model"):
+        llm_config["model"] = str(row["model"]).strip()
+
+    params.update({
+        "doc_type": DOC_TYPE_LABELS.get(doc_type_key, doc_type),
+        "doc_type_key": doc_type_key,
+        "subject": str(row.get("subject") or "").strip(),
+        "grade_level": str(row.get("grade_level") or row.get("grade") or "").strip(),
+        "topic": str(row.get("topic") or "").strip(),
+        "llm_config": llm_config
+    })
+    if not params["subject"] or not params["topic"]:
+        raise Exception("Subject and topic are required")
+    return params
+
+
+def _file_stem(params, rid):
+    slug = re.sub(r"[^\w]+", "_", params["subject"]).strip("_")[:40] or "document"
+    return f"{slug}_{params['doc_type_key'] or 'document'}_{rid}"
+
+
+def run_row(rid, params, output_dir, formats):
+    """Generate one row and write its files (runs in a pool worker)"""
+    started = time.monotonic()
+    try:
+        result = document_generator.generate_document(params)
+        if not result["success"]:
+            raise Exception(result["error"])
+
+        if formats == ["auto"]:
+            formats = ["pptx" if params["doc_type_key"] == "powerpoint" else "docx"]
+        bundle = create_export_bundle(result, params)
+        files = []
+        for fmt in formats:
+            target = Path(output_dir) / f"{_file_stem(params, rid)}.{fmt}"
+            target.write_bytes(bundle.get(fmt))
+            files.append(target.name)
+
+        return {"id": rid, "status": "done", "files": files, "seconds": time.monotonic() - started}
+    except Exception as e:
+        return {"id": rid, "status": "failed", "error": str(e), "seconds": time.monotonic() - started}
+
+
+def load_checkpoint(output_dir):
+    """IDs of the rows a previous run finished"""
+    finished = set()
+    path = Path(output_dir) / CHECKPOINT_FILE
+    if path.exists():
+        # A cut-short last line may end mid character
+        with open(path, encoding="utf-8", errors="replace") as checkpoint:
+            for line in checkpoint:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interruption
+                    continue
+                if record.get("status") == "done":
+                    finished.add(record["id"])
+    return finished
+
+
+def _end_checkpoint_line(path):
+    """Terminate a last line an interruption cut short"""
+    if not path.exists():
+        return
+    # Bytes, since the line may have been cut inside a multi-byte character
+    with open(path, "rb+") as checkpoint:
+        if checkpoint.seek(0, os.SEEK_END) == 0:
+            return
+        checkpoint.seek(-1, os.SEEK_END)
+        if checkpoint.read(1) != b"\n":
+            checkpoint.write(b"\n")
+
+
+def _provider_of(params):
+    return params["llm_config"].get("provider") or "unknown"
+
+
+def run_batch(rows, base_llm_config, output_dir, workers=4, provider_limits=None,
+              formats=("auto",), use_processes=False, log=print):
+    """
+    Generate every unfinished row of a manifest and return the run's records.
+
+    No more than ``provider_limits[provider]`` rows of a provider run at once
+    (rows wait in order for a free slot), and at most ``workers`` overall.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    finished = load_checkpoint(output_dir)
+    provider_limits = provider_limits or {}
+    formats = list(formats)
+
+    records = []
+    pending = deque()
+    for index, row in enumerate(rows):
+        rid = row_id(row)
+        if rid in finished:
+            records.append({"id": rid, "status": "skipped"})
+            continue
+        try:
+            pending.append((rid, build_params(row, base_llm_config)))
+        except Exception as e:
+            records.append({"id": rid, "status": "failed", "error": f"Row {index + 1}: {e}", "seconds": 0.0})
+
+    # Ollama hosts are checked once, not per row
+    for _, params in pending:
+        llm_config = params["llm_config"]
+        if llm_config.get("provider") == "ollama":
+            llm_config["connected"] = ollama_catalog.get_catalog(llm_config.get("host", ""))["connected"]
+
+    if use_processes:
+        # Forked workers would share this process's pooled connections and
+        # cache handles, so they start fresh instead
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    in_flight = {}
+    running = {}
+    started = time.monotonic()
+
+    _end_checkpoint_line(output_dir / CHECKPOINT_FILE)
+    with pool, open(output_dir / CHECKPOINT_FILE, "a", encoding="utf-8") as checkpoint:
+        try:
+            while pending or in_flight:
+                # Start every waiting row whose provider has a free slot
+                waiting = deque()
+                while pending and len(in_flight) < workers:
+                    rid, params = pending.popleft()
+                    provider = _provider_of(params)
+                    if running.get(provider, 0) >= provider_limits.get(provider, workers):
+                        waiting.append((rid, params))
+                        continue
+                    running[provider] = running.get(provider, 0) + 1
+                    future = pool.submit(run_row, rid, params, str(output_dir), formats)
+                    in_flight[future] = provider
+                pending.extendleft(reversed(waiting))
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider = in_flight.pop(future)
+                    running[provider] -= 1
+                    record = future.result()
+                    records.append(record)
+                    checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    checkpoint.flush()
+                    log(_format_record(record))
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            log("Interrupted; finished rows are saved and will be skipped when the run is resumed.")
+            raise
+
+    return records, time.monotonic() - started
+
+
+def _format_record(record):
+    if record["status"] == "done":
+        return f"[done]   {record['id']}  {record['seconds']:.1f} s  {', '.join(record['files'])}"
+    if record["status"] == "failed":
+        return f"[failed] {record['id']}  {record['seconds']:.1f} s  {record['error']}"
+    return f"[skip]   {record['id']}"
+
+
+def summarize(records, elapsed):
+    """Counts, throughput and per-row timing statistics of a run"""
+    timed = sorted(record["seconds"] for record in records if record["status"] != "skipped")
+    counts = {status: sum(1 for record in records if record["status"] == status) for status in ("done", "failed", "skipped")}
+    summary = dict(counts, wall_seconds=round(elapsed, 2))
+    if timed:
+        summary.update({
+            "rows_per_minute": round(counts["done"] / elapsed * 60, 2) if elapsed else None,
+            "row_seconds_mean": round(sum(timed) / len(timed), 2),
+            "row_seconds_p50": round(timed[len(timed) // 2], 2),
+            "row_seconds_max": round(timed[-1], 2)
+        })
+    return summary
+
+
+def _parse_limits(values):
+    limits = {}
+    for value in values or []:
+        provider, _, limit = value.partition("=")
+        if not limit.isdigit() or int(limit) < 1:
+            raise argparse.ArgumentTypeError(f"Invalid limit '{value}', expected provider=N")
+        limits[provider.strip()] = int(limit)
+    return limits
+
+
+def _parse_formats(value):
+    formats = [fmt.strip().lower() for fmt in value.split(",") if fmt.strip()]
+    if formats != ["auto"] and any(fmt not in EXPORT_FORMATS for fmt in formats):
+        raise argparse.ArgumentTypeError(f"Formats must be 'auto' or a list of {', '.join(EXPORT_FORMATS)}")
+    return formats
+
+
+def add_llm_arguments(parser):
+    """Command-line options for the default provider and model"""
+    parser.add_argument("--provider", default="ollama", choices=["ollama", "openai", "google", "huggingface"])
+    parser.add_argument("--model", help="model name (default: the provider's default model; rows may override it)")
+    parser.add_argument("--host", default=DEFAULT_OLLAMA_HOST, help="Ollama host")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--use-local", action="store_true", help="run Hugging Face models locally")
+    parser.add_argument("--regenerate", action="store_true", help="ignore cached LLM responses")
+
+
+def llm_config_for(provider, model=None, temperature=0.7, bypass_cache=False,
+                   host=DEFAULT_OLLAMA_HOST, use_local=False):
+    """A complete LLM configuration for a provider, with its default model unless one is given"""
+    if provider not in DEFAULT_MODELS:
+        raise Exception(f"Unknown provider: {provider} (expected one of {', '.join(DEFAULT_MODELS)})")
+    llm_config = {
+        "provider": provider,
+        "model": model or DEFAULT_MODELS[provider],
+        "temperature": temperature,
+        "bypass_cache": bypass_cache,
+        "use_local": use_local
+    }
+    if provider == "ollama":
+        llm_config["host"] = host
+    if provider in API_KEY_VARIABLES:
+        llm_config["api_key"] = os.getenv(API_KEY_VARIABLES[provider], "")
+    return llm_config
+
+
+def base_llm_config_from_args(args):
+    """The LLM configuration rows start from"""
+    return llm_config_for(
+        args.provider, args.model, temperature=args.temperature, bypass_cache=args.regenerate,
+        host=args.host, use_local=args.provider == "huggingface" and args.use_local
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate EduADocs documents from a CSV/JSON manifest.")
+    parser.add_argument("manifest", help="CSV or JSON file with one document per row")
+    parser.add_argument("-o", "--output", default="output", help="directory for the files, checkpoint and report")
+    add_llm_arguments(parser)
+    parser.add_argument("--workers", type=int, default=4, help="rows generated at once")
+    parser.add_argument("--limit", action="append", metavar="PROVIDER=N",
+                        help="rows of a provider generated at once (repeatable)")
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    parser.add_argument("--formats", type=_parse_formats, default=["auto"],
+                        help="comma-separated formats to write (docx, pptx, md, zip) or 'auto'")
+    args = parser.parse_args(argv)
+
+    base_llm_config = base_llm_config_from_args(args)
+
+    provider_limits = _parse_limits(args.limit)
+    if args.use_local:
+        # A local model already uses the whole machine
+        provider_limits.setdefault("huggingface", 1)
+
+    rows = load_manifest(args.manifest)
+    try:
+        records, elapsed = run_batch(
+            rows, base_llm_config, args.output,
+            workers=max(1, args.workers),
+            provider_limits=provider_limits,
+            formats=args.formats,
+            use_processes=args.processes
+        )
+    except KeyboardInterrupt:
+        return 130
+
+    summary = summarize(records, elapsed)
+    with open(Path(args.output) / REPORT_FILE, "w", encoding="utf-8") as report:
+        json.dump({"summary": summary, "rows": records}, report, ensure_ascii=False, indent=2)
+
+    print()
+    print(f"{summary['done']} done, {summary['failed']} failed, {summary['skipped']} skipped "
+          f"in {summary['wall_seconds']:.1f} s")
+    if "row_seconds_mean" in summary:
+        print(f"Throughput: {summary['rows_per_minute']} rows/min; per row: mean {summary['row_seconds_mean']} s, "
+              f"median {summary['row_seconds_p50']} s, max {summary['row_seconds_max']} s")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,28 @@
 from generators.exercise_generator import generate_exercises
 from generators.lesson_notes_generator import generate_lecture_notes
 from generators.lesson_plan_generator import generate_lesson_plan
-from generators.mind_map_generator import generate_mind_map
+from generators.mind_map_generator import generate_mind_map, expand_mind_map_branch as _expand_mind_map_branch
 from generators.powerpoint_generator import generate_powerpoint
 from generators.summary_generator import generate_summary
 from generators.assessment_generator import generate_assessment_stub
+from llm_handlers.resilience import new_deadline
+from llm_handlers.token_accounting import output_token_limit
 
-def generate_document(params):
-    """Main document generation coordinator"""
+def generate_document(params, on_token=None, on_preview=None):
+    """Main document generation coordinator
+    
+    Pass ``on_token`` to receive the LLM response chunk by chunk while the
+    document is being generated (e.g. for a live preview). Documents that
+    are generated in several parts call ``on_preview`` with the whole
+    document so far instead.
+    """
     
     try:
+        if on_token is not None:
+            params = dict(params, on_token=on_token)
+        if on_preview is not None:
+            params = dict(params, on_preview=on_preview)
+        
         doc_type_key = params.get("doc_type_key")
         doc_type = params.get("doc_type")
 
@@ -36,6 +49,17 @@ def generate_document(params):
             else:
                 doc_type_key = "unknown"
         
+        llm_config = params.get("llm_config")
+        if llm_config is not None:
+            llm_config = dict(llm_config)
+            # Every LLM call made for this document shares one deadline
+            llm_config.setdefault("deadline", new_deadline())
+            # Sessions take turns when a provider's rate limit is reached
+            llm_config.setdefault("session_id", params.get("session_id"))
+            # Size the completion to what was asked for
+            llm_config.setdefault("max_output_tokens", output_token_limit(doc_type_key, params, llm_config))
+            params = dict(params, llm_config=llm_config)
+        
         if doc_type_key == "lesson_plan":
             return generate_lesson_plan(params)
         elif doc_type_key == "lecture_notes":
@@ -55,3 +79,21 @@ def generate_document(params):
             
     except Exception as e:
         return {"success": False, "error": str(e)}
+
+def expand_mind_map_branch(tree, branch_index, params, on_token=None, on_preview=None):
+    """Generate one collapsed branch of a mind map on demand
+    
+    ``on_preview`` receives the whole map once the branch is ready;
+    ``on_token`` is accepted for symmetry with generate_document (branches
+    are not streamed).
+    """
+    
+    try:
+        params = {key: value for key, value in params.items() if key not in ("on_token", "on_preview")}
+        if on_preview is not None:
+            params["on_preview"] = on_preview
+        llm_config = dict(params["llm_config"])
+        llm_config.setdefault("max_output_tokens", output_token_limit("mind_map", params, llm_config))
+        return _expand_mind_map_branch(tree, branch_index, dict(params, llm_config=llm_config))
+    except Exception as e:
+        return {"success": False, "error": str(e)}
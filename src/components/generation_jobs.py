@@ -0,0 +1,225 @@
+"""
+Background execution of document generation.
+Generation runs as a job on a process-wide executor instead of the
+Streamlit script thread, so reruns don't throw work away and a session
+only polls for progress. Each provider has its own bounded worker pool;
+jobs beyond it wait in that pool's queue without blocking other providers.
+Finished jobs are kept for a while, so their results survive reruns.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import uuid
+
+from components import document_generator
+from generators.export_bundle import create_export_bundle
+
+# Documents generated at once per provider
+JOB_WORKERS = int(os.getenv("EDUADOCS_JOB_WORKERS", "4"))
+
+# Seconds a finished job (and its files) is kept for polling
+JOB_RETENTION_SECONDS = float(os.getenv("EDUADOCS_JOB_RETENTION_SECONDS", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's callbacks to stop a cancelled generation."""
+
+
+class GenerationJob:
+    """One document generation and its progress."""
+
+    def __init__(self, params, task=None):
+        """
+        ``task(params, on_token=..., on_preview=...)`` produces the result;
+        it defaults to generating the document described by ``params``.
+        """
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self._task = task or document_generator.generate_document
+        self.provider = (params.get("llm_config") or {}).get("provider") or "unknown"
+        self.status = QUEUED
+        self.result = None
+        self.bundle = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._chunks = []
+        self._lock = threading.Lock()
+        self._cancel_requested = threading.Event()
+        self._future = None
+        self._callbacks = []
+
+    @property
+    def preview(self):
+        """The document text generated so far"""
+        with self._lock:
+            text = "".join(self._chunks)
+            self._chunks = [text]
+        return text
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_requested.is_set()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def elapsed(self):
+        """Seconds since the job was submitted (until it finished)"""
+        return (self.finished_at or time.time()) - self.created_at
+
+    def _on_token(self, chunk):
+        if self._cancel_requested.is_set():
+            raise JobCancelled("Generation cancelled")
+        with self._lock:
+            self._chunks.append(chunk)
+
+    def _on_preview(self, text):
+        if self._cancel_requested.is_set():
+            raise JobCancelled("Generation cancelled")
+        with self._lock:
+            self._chunks = [text]
+
+    def cancel(self):
+        """
+        Ask the job to stop. A queued job never starts; a running one stops
+        at its next streamed chunk or finished part.
+        """
+        self._cancel_requested.set()
+        if self._future is not None and self._future.cancel():
+            self._finish(CANCELLED)
+
+    def add_done_callback(self, callback):
+        """Call ``callback(job)`` once the job has finished (at once if it already has)"""
+        with self._lock:
+            if not self.finished:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            self.status = status
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def _run(self):
+        if self._cancel_requested.is_set():
+            self._finish(CANCELLED)
+            return
+
+        self.started_at = time.time()
+        self.status = RUNNING
+        try:
+            result = self._task(self.params, on_token=self._on_token, on_preview=self._on_preview)
+            if result["success"] and not self._cancel_requested.is_set():
+                self.bundle = create_export_bundle(result, self.params)
+                # The files now live in the artifact store; don't keep a second copy
+                result = {key: value for key, value in result.items() if key not in ("docx_file", "pptx_file")}
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        if self._cancel_requested.is_set():
+            self._finish(CANCELLED)
+        elif result["success"]:
+            self._finish(DONE, result=result)
+        else:
+            self._finish(FAILED, error=result["error"])
+
+
+class JobExecutor:
+    """Runs generation jobs on one bounded pool per provider."""
+
+    def __init__(self, workers=JOB_WORKERS, retention_seconds=JOB_RETENTION_SECONDS):
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self._pools = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, job):
+        # Local and hosted models of one provider don't share a pool
+        use_local = bool((job.params.get("llm_config") or {}).get("use_local"))
+        key = (job.provider, use_local)
+        pool = self._pools.get(key)
+        if pool is None:
+            workers = self.workers
+            # A local model already uses the whole machine
+            if job.provider == "huggingface" and use_local:
+                workers = 1
+            pool = self._pools[key] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f"job-{job.provider}{'-local' if use_local else ''}"
+            )
+        return pool
+
+    def _prune(self, now):
+        """Forget finished jobs past the retention period"""
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.retention_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, params, task=None):
+        """Queue a document generation (or another ``task`` on its params) and return its job"""
+        job = GenerationJob(params, task)
+        with self._lock:
+            self._prune(time.time())
+            self._jobs[job.id] = job
+            job._future = self._pool(job).submit(job._run)
+        return job
+
+    def get(self, job_id):
+        """Return a job by ID, or None if it is unknown or expired"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job; returns False if it is unknown"""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def get_stats(self):
+        """Job counts by status and provider"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        stats = {}
+        for job in jobs:
+            provider = stats.setdefault(job.provider, {status: 0 for status in (QUEUED, RUNNING) + FINISHED_STATES})
+            provider[job.status] += 1
+        return stats
+
+
+# Global instance
+_job_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    """Get or create the global job executor."""
+    global _job_executor
+    if _job_executor is None:
+        with _executor_lock:
+            if _job_executor is None:
+                _job_executor = JobExecutor()
+    return _job_executor
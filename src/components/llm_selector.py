@@ -1,8 +1,14 @@
 import streamlit as st
 import os
-import requests
+from llm_handlers import ollama_catalog
 from utils.language_manager import i18n, i18n_list, i18n_dict
 
+# How long a rerun waits for the first probe of a new Ollama host
+OLLAMA_PROBE_WAIT_SECONDS = 0.3
+
+# How often the sidebar checks whether a pending probe has finished
+OLLAMA_PROBE_POLL_SECONDS = 1.0
+
 def display_llm_selector():
     """Display LLM selection interface and return configuration"""
     
@@ -80,7 +86,17 @@ def _configure_ollama():
     # Check if Ollama is running
     ollama_status = _check_ollama_connection(host)
     
-    if ollama_status["connected"]:
+    if ollama_status.get("checking"):
+        st.info(i18n("llm.ollama.checking_template").format(host=host))
+        # Rerun once the background probe has an answer
+        _await_ollama_probe(host)
+        
+        model = st.text_input(
+            i18n("llm.ollama.model_name_label"),
+            value="llama2",
+            help=i18n("llm.ollama.model_name_help")
+        )
+    elif ollama_status["connected"]:
         st.success(i18n("llm.ollama.connected_template").format(host=host))
         
         # Try to fetch available models
@@ -106,6 +122,11 @@ def _configure_ollama():
         3. {fix_steps[2] if len(fix_steps) > 2 else ""}
         4. {fix_steps[3] if len(fix_steps) > 3 else ""}
         """)
+        st.button(
+            i18n("llm.ollama.check_again_button"),
+            on_click=ollama_catalog.invalidate,
+            args=(host,)
+        )
         
         model = st.text_input(
             i18n("llm.ollama.model_name_label"),
@@ -202,19 +223,12 @@ def _configure_google():
 
 def _check_ollama_connection(host):
     """Check if Ollama is running and get available models"""
-    try:
-        # Test connection with shorter timeout
-        response = requests.get(f"{host}/api/tags", timeout=3)
-        if response.status_code == 200:
-            models_data = response.json().get("models", [])
-            models = [model["name"] for model in models_data]
-            return {"connected": True, "models": models}
-        else:
-            return {"connected": False, "error": f"HTTP {response.status_code}"}
-    except requests.exceptions.ConnectionError:
-        return {"connected": False, "error": "Connection refused - Ollama not running"}
-    except requests.exceptions.Timeout:
-        return {"connected": False, "error": "Connection timeout"}
-    except Exception as e:
-        return {"connected": False, "error": str(e)}
-    
\ No newline at end of file
+    # Served from the shared catalog, which probes hosts in the background;
+    # a rerun never waits on an unreachable host
+    return ollama_catalog.get_catalog(host, wait=OLLAMA_PROBE_WAIT_SECONDS)
+
+@st.fragment(run_every=OLLAMA_PROBE_POLL_SECONDS)
+def _await_ollama_probe(host):
+    """Rerun the app when the first probe of a host finishes"""
+    if ollama_catalog.is_cached(host):
+        st.rerun()
@@ -0,0 +1,191 @@
+"""
+Word document builder shared by the generators.
+Renders the blocks produced by utils.markdown_parser into a .docx file.
+
+python-docx re-parses its default template for every ``Document()`` and
+builds proxy objects and style lookups for every paragraph, which is slow
+for long documents. Instead, the template is loaded once per process: its
+style IDs are resolved up front and every other part of the package is
+kept pre-compressed. Each document then only needs its body XML, which is
+written in bulk and appended to a copy of the template package.
+"""
+
+from docx import Document
+from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+from docx.shared import Inches
+from lxml import etree
+from xml.sax.saxutils import escape
+import io
+import re
+import threading
+import zipfile
+
+from utils.markdown_parser import plain_text
+
+# Left indent per nesting level for nested bullets
+BULLET_INDENT_INCHES = 0.25
+
+_DOCUMENT_PART = "word/document.xml"
+_W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+# Characters that are not allowed in XML 1.0 (python-docx rejects them too)
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_RUN_SPECIAL_CHARS = re.compile("(\t|\r|\n)")
+
+_ALIGNMENTS = {
+    WD_PARAGRAPH_ALIGNMENT.LEFT: "left",
+    WD_PARAGRAPH_ALIGNMENT.CENTER: "center",
+    WD_PARAGRAPH_ALIGNMENT.RIGHT: "right",
+    WD_PARAGRAPH_ALIGNMENT.JUSTIFY: "both",
+}
+
+
+class _Template:
+    """The default template, split into what every document shares."""
+
+    def __init__(self):
+        doc = Document()
+        self._document = doc
+        self._style_ids = {}
+        self._lock = threading.Lock()
+
+        # Empty the body (keeping the section properties) and split it at
+        # the point where paragraphs go
+        body = doc.element.body
+        for child in list(body):
+            if child.tag != f"{{{_W_NS}}}sectPr":
+                body.remove(child)
+        xml = etree.tostring(doc.element, xml_declaration=True, encoding="UTF-8", standalone=True).decode("utf-8")
+        split_at = xml.find("<w:sectPr")
+        if split_at == -1:
+            split_at = xml.rfind("</w:body>")
+        self.document_head = xml[:split_at]
+        self.document_tail = xml[split_at:]
+
+        # Every other part is compressed once and reused as is
+        package = io.BytesIO()
+        doc.save(package)
+        static = io.BytesIO()
+        with zipfile.ZipFile(package) as source, zipfile.ZipFile(static, "w", zipfile.ZIP_DEFLATED) as target:
+            for item in source.infolist():
+                if item.filename != _DOCUMENT_PART:
+                    target.writestr(item, source.read(item.filename))
+        self.static_package = static.getvalue()
+
+    def style_id(self, style_name):
+        """Resolve a style name (e.g. "List Bullet") to its ID, once"""
+        style_id = self._style_ids.get(style_name)
+        if style_id is None:
+            with self._lock:
+                style_id = self._document.styles[style_name].style_id
+                self._style_ids[style_name] = style_id
+        return style_id
+
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def _get_template():
+    """Load the template on first use"""
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                _template = _Template()
+    return _template
+
+
+def _run_xml(text):
+    """A run with tabs and line breaks written the way python-docx does"""
+    parts = []
+    for piece in _RUN_SPECIAL_CHARS.split(text):
+        if piece == "\t":
+            parts.append("<w:tab/>")
+        elif piece in ("\r", "\n"):
+            parts.append("<w:br/>")
+        elif piece:
+            space = ' xml:space="preserve"' if piece[0].isspace() or piece[-1].isspace() else ""
+            parts.append(f"<w:t{space}>{escape(piece)}</w:t>")
+    return "<w:r>" + "".join(parts) + "</w:r>"
+
+
+class DocxWriter:
+    """Accumulates body paragraphs and writes the .docx in one go."""
+
+    def __init__(self):
+        self._template = _get_template()
+        self._body = []
+
+    def add_paragraph(self, text="", style=None, alignment=None, left_indent=None):
+        """Append a paragraph; ``left_indent`` is a python-docx Length"""
+        properties = []
+        if style is not None and style != "Normal":
+            properties.append(f'<w:pStyle w:val="{self._template.style_id(style)}"/>')
+        if alignment is not None:
+            properties.append(f'<w:jc w:val="{_ALIGNMENTS[alignment]}"/>')
+        if left_indent is not None:
+            properties.append(f'<w:ind w:left="{left_indent.twips}"/>')
+
+        text = _INVALID_XML_CHARS.sub("", text)
+        if not properties and not text:
+            self._body.append("<w:p/>")
+            return
+
+        self._body.append(
+            "<w:p>"
+            + ("<w:pPr>" + "".join(properties) + "</w:pPr>" if properties else "")
+            + (_run_xml(text) if text else "")
+            + "</w:p>"
+        )
+
+    def add_heading(self, text="", level=1, alignment=None):
+        """Append a heading; level 0 is the document title"""
+        style = "Title" if level == 0 else f"Heading {level}"
+        self.add_paragraph(text, style=style, alignment=alignment)
+
+    def to_bytes(self):
+        """Write the complete .docx package"""
+        document_xml = self._template.document_head + "".join(self._body) + self._template.document_tail
+        package = io.BytesIO(self._template.static_package)
+        package.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(package, "a", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(_DOCUMENT_PART, document_xml.encode("utf-8"))
+        return package.getvalue()
+
+
+def new_document(title_text, subtitles):
+    """Create a document with a centered title and subtitle headings"""
+    doc = DocxWriter()
+    doc.add_heading(title_text, 0, alignment=WD_PARAGRAPH_ALIGNMENT.CENTER)
+
+    for text, level in subtitles:
+        doc.add_heading(text, level=level)
+
+    return doc
+
+
+def add_blocks_to_docx(doc, blocks, nested_bullets=False):
+    """Add parsed Markdown blocks to a document"""
+    for block in blocks:
+        kind = block.kind
+        if kind == "rule":
+            continue
+        if kind == "blank":
+            doc.add_paragraph("")
+        elif kind == "heading":
+            doc.add_heading(plain_text(block.runs), level=block.level)
+        elif kind == "bullet":
+            left_indent = None
+            if nested_bullets and block.level > 0:
+                left_indent = Inches(BULLET_INDENT_INCHES * block.level)
+            doc.add_paragraph(plain_text(block.runs), style='List Bullet', left_indent=left_indent)
+        elif kind == "number":
+            doc.add_paragraph(plain_text(block.runs), style='List Number')
+        else:
+            doc.add_paragraph(plain_text(block.runs))
+
+
+def docx_bytes(doc):
+    """Serialize a document to bytes"""
+    return doc.to_bytes()
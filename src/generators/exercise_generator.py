@@ -1,29 +1,322 @@
 from llm_handlers.api_handler import get_llm_response
-from docx import Document
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-import io
+from llm_handlers.parallel import get_llm_responses, split_output_budget
+from generators.docx_builder import new_document, add_blocks_to_docx, docx_bytes
+from utils.markdown_parser import parse_markdown
+from utils.language_manager import i18n
+import os
+import re
+
+# Largest number of questions asked for in one call when sharding
+SHARD_SIZE = int(os.getenv("EDUADOCS_EXERCISE_SHARD_SIZE", "10"))
+
+# Word overlap above which two questions count as the same question
+DUPLICATE_SIMILARITY = 0.8
+
+_ANSWER_KEY_MARKER = "ANSWER KEY"
+_NUMBERED_LINE = re.compile(r"^\s?(?:\*\*)?(\d+)[.)](?:\*\*)?\s+(.*)$")
+_WORD = re.compile(r"\w+")
 
 def generate_exercises(params):
-    """Generate exercise list document"""
+    """Generate exercise list document
+    
+    Long lists are split by question type and difficulty into shards that
+    are generated concurrently, then merged (see _generate_sharded).
+    """
+    
+    if params.get("sharded_generation") and int(params.get("num_questions") or 0) > SHARD_SIZE:
+        return _generate_sharded(params)
     
     prompt = _build_exercise_prompt(params)
     
     try:
         # Get content from LLM
-        content = get_llm_response(prompt, params["llm_config"])
+        content = get_llm_response(prompt, params["llm_config"], on_token=params.get("on_token"))
         
         # Create Word document
-        docx_file = _create_exercise_docx(content, params)
+        return _exercise_result(content, params)
         
-        return {
-            "success": True,
-            "content": content,
-            "docx_file": docx_file
-        }
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def _exercise_result(content, params):
+    """Parse the content and build the Word document"""
+    
+    blocks = parse_markdown(content)
+    return {
+        "success": True,
+        "content": content,
+        "blocks": blocks,
+        "docx_file": _create_exercise_docx(blocks, params)
+    }
+
+def _generate_sharded(params):
+    """Generate the list in shards concurrently and merge them
+    
+    Shards left short by duplicates or unusable answer keys are topped up
+    once; if the list is still short it is generated in a single call.
+    """
+    
+    try:
+        shards = plan_shards(params)
+        include_answer_key = params.get("include_answer_key", True)
+        labels = _labels(params)
+        prompts = [_build_intro_prompt(params)] + [_build_shard_prompt(params, shard) for shard in shards]
+        config = split_output_budget(params["llm_config"], len(shards))
+        intro = [None]
+        contents = [[] for _ in shards]
+        
+        def preview():
+            on_preview = params.get("on_preview")
+            if on_preview:
+                selected = _select_questions(shards, contents, include_answer_key)
+                on_preview(_merge_shards(intro[0], shards, selected, include_answer_key, labels))
+        
+        def on_complete(index, content):
+            if index == 0:
+                intro[0] = content
+            else:
+                contents[index - 1].append(content)
+            preview()
+        
+        get_llm_responses(prompts, config, on_complete=on_complete)
+        
+        selected = _select_questions(shards, contents, include_answer_key)
+        short = [index for index, shard in enumerate(shards) if len(selected[index]) < shard["count"]]
+        if short:
+            kept = [question["text"] for questions in selected for question in questions]
+            prompts = [
+                _build_shard_prompt(params, shards[index], shards[index]["count"] - len(selected[index]), kept)
+                for index in short
+            ]
+            
+            def on_top_up(index, content):
+                contents[short[index]].append(content)
+                preview()
+            
+            get_llm_responses(prompts, config, on_complete=on_top_up)
+            selected = _select_questions(shards, contents, include_answer_key)
+        
+        if sum(len(questions) for questions in selected) < int(params["num_questions"]):
+            return generate_exercises(dict(params, sharded_generation=False))
+        
+        content = _merge_shards(intro[0], shards, selected, include_answer_key, labels)
+        return _exercise_result(content, params)
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def _labels(params):
+    """Headings of a merged list, in the language of the app that asked for it"""
+    
+    language = params.get("language", "en")
+    return {
+        "title": i18n("exercise_list.document_title", "Exercise List", language),
+        "questions": i18n("exercise_list.questions_heading", "Questions", language),
+        "answer_key": i18n("exercise_list.answer_key_heading", "Answer Key", language)
+    }
+
+def plan_shards(params):
+    """Split the questions evenly by difficulty and type, at most SHARD_SIZE per shard"""
+    
+    num_questions = int(params['num_questions'])
+    # "Mixed" difficulty is passed as the list of levels to mix
+    levels = params.get("difficulty_levels") or [params['difficulty']]
+    types = params.get("question_types") or [None]
+    cells = [(difficulty, question_type) for difficulty in levels for question_type in types]
+    
+    shards = []
+    base, extra = divmod(num_questions, len(cells))
+    for index, (difficulty, question_type) in enumerate(cells):
+        count = base + (1 if index < extra else 0)
+        if not count:
+            continue
+        chunks = -(-count // SHARD_SIZE)
+        chunk_base, chunk_extra = divmod(count, chunks)
+        for chunk in range(chunks):
+            shards.append({
+                "difficulty": difficulty,
+                "question_type": question_type,
+                "count": chunk_base + (1 if chunk < chunk_extra else 0),
+                "part": chunk + 1,
+                "parts": chunks
+            })
+    return shards
+
+def _numbered_items(lines):
+    """Group lines into numbered items: (number, first line, following lines)"""
+    
+    items = []
+    for line in lines:
+        match = _NUMBERED_LINE.match(line.rstrip())
+        if match:
+            items.append((int(match.group(1)), match.group(2).strip(), []))
+        elif items and line.strip():
+            items[-1][2].append(line.strip())
+    return items
+
+def parse_shard(content, include_answer_key=True):
+    """
+    Split one shard's output into questions, each with its answer (or None).
+    
+    Answers are matched by number when the key numbers its answers like
+    the questions, otherwise by position. When an answer key was asked
+    for and cannot be matched (a different number of answers), the shard
+    is rejected and no questions are returned.
+    """
+    
+    lines = content.split("\n")
+    answer_lines = []
+    for index, line in enumerate(lines):
+        if line.strip(" #*:").upper() == _ANSWER_KEY_MARKER:
+            lines, answer_lines = lines[:index], lines[index + 1:]
+            break
+    
+    questions = _numbered_items(lines)
+    if not include_answer_key:
+        answers = [None] * len(questions)
+    else:
+        key = _numbered_items(answer_lines)
+        if len(key) != len(questions):
+            return []
+        numbers = [number for number, _, _ in questions]
+        if len(set(numbers)) == len(numbers) and {number for number, _, _ in key} == set(numbers):
+            by_number = {number: [text] + rest for number, text, rest in key}
+            answers = [by_number[number] for number in numbers]
+        else:
+            # Repeated or restarted numbering: the n-th answer is the n-th question's
+            answers = [[text] + rest for _, text, rest in key]
+    
+    return [
+        {"text": text, "details": rest, "answer": answer}
+        for (_, text, rest), answer in zip(questions, answers)
+    ]
+
+def _question_words(question):
+    return frozenset(word.lower() for word in _WORD.findall(question["text"]))
+
+def _is_duplicate(words, seen):
+    """Tell whether a question's words overlap too much with a kept question"""
+    
+    for other in seen:
+        union = len(words | other)
+        if union and len(words & other) / union >= DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+def _select_questions(shards, contents, include_answer_key):
+    """Pick up to each shard's count of questions from its outputs, skipping duplicates"""
+    
+    seen = []
+    selected = []
+    for shard, outputs in zip(shards, contents):
+        kept = []
+        for content in outputs:
+            for question in parse_shard(content, include_answer_key):
+                # Shards are asked for a spare question or two to replace duplicates
+                if len(kept) == shard["count"]:
+                    break
+                words = _question_words(question)
+                if _is_duplicate(words, seen):
+                    continue
+                seen.append(words)
+                kept.append(question)
+        selected.append(kept)
+    return selected
+
+def _merge_shards(intro, shards, selected, include_answer_key, labels):
+    """Merge the selected questions into one list with continuous numbering and one answer key"""
+    
+    several_levels = len({shard["difficulty"] for shard in shards}) > 1
+    lines = [f"# {labels['title']}", ""]
+    if intro:
+        lines += [intro.strip(), ""]
+    key_lines = []
+    number = 0
+    section = None
+    
+    for shard, questions in zip(shards, selected):
+        if not questions:
+            continue
+        
+        title = shard["question_type"] or labels["questions"]
+        if several_levels:
+            title = f"{title} ({shard['difficulty']})"
+        if title != section:
+            section = title
+            lines += [f"## {title}", ""]
+        
+        for question in questions:
+            number += 1
+            lines.append(f"{number}. {question['text']}")
+            lines += [f"   {detail}" for detail in question["details"]]
+            lines.append("")
+            if question["answer"]:
+                key_lines.append(f"{number}. {question['answer'][0]}")
+                key_lines += [f"   {detail}" for detail in question["answer"][1:]]
+    
+    if include_answer_key and key_lines:
+        lines += [f"## {labels['answer_key']}", ""] + key_lines
+    
+    return "\n".join(lines).rstrip() + "\n"
+
+def _build_intro_prompt(params):
+    """Build prompt for the introduction of a sharded exercise list"""
+    
+    prompt = f"""
+    Write a brief introduction to an exercise list for {params['subject']} at {params['grade_level']} level.
+    
+    Topic: {params['topic']}
+    Question types: {', '.join(params['question_types'])}
+    
+    FORMATTING RULES:
+    - Two to four sentences introducing the topic, then one sentence of general instructions
+    - Plain text only: no title, no headings, no questions
+    - Write in the same language as the subject/topic
+    """
+    
+    return prompt
+
+def _build_shard_prompt(params, shard, missing=None, avoid=()):
+    """Build prompt for one shard of a sharded exercise list, or for the questions it is missing"""
+    
+    include_answer_key = params.get("include_answer_key", True)
+    question_type = shard["question_type"] or "varied"
+    # A spare question or two replaces duplicates of other shards
+    count = missing or shard["count"]
+    count += max(1, count // 10)
+    
+    if include_answer_key:
+        answer_rules = f"""- For problem-solving questions, show step-by-step solutions in the answer key
+    - After the last question write a line containing only {_ANSWER_KEY_MARKER}, then one numbered answer per question"""
+    else:
+        answer_rules = "- Do not include answers, solutions or an answer key"
+    
+    variety = ""
+    if shard["parts"] > 1:
+        variety = f"This is set {shard['part']} of {shard['parts']} of these questions; cover different aspects of the topic than the other sets would."
+    if avoid:
+        variety += "\n    The list already has these questions; write different ones:\n" + "\n".join(f"    - {text}" for text in avoid)
+    
+    prompt = f"""
+    Write {count} {question_type} questions for an exercise list on {params['subject']} at {params['grade_level']} level.
+    
+    Topic: {params['topic']}
+    Difficulty: {shard['difficulty']}
+    {variety}
+    
+    FORMATTING RULES:
+    - Number the questions 1. 2. 3. at the start of the line
+    - Put everything that belongs to a question (e.g. options A, B, C, D) on indented lines below it
+    - For multiple choice questions, provide 4 options (A, B, C, D)
+    - Do not write a title, an introduction or headings
+    {answer_rules}
+    - Write in the same language as the subject/topic
+    
+    Make sure the content is age-appropriate and educationally valuable.
+    """
+    
+    return prompt
+
 def _build_exercise_prompt(params):
     """Build prompt for exercise generation"""
     include_answer_key = params.get("include_answer_key", True)
@@ -68,78 +361,14 @@ def _build_exercise_prompt(params):
     
     return prompt
 
-def _create_exercise_docx(content, params):
-    """Create Word document from exercise content"""
-    
-    doc = Document()
-    
-    # Title
-    title = doc.add_heading(f"{params['subject']} - Exercise List", 0)
-    title.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER  # Center alignment
+def _create_exercise_docx(blocks, params):
+    """Create Word document from parsed exercise content"""
     
-    # Subtitle
-    doc.add_heading(f"Topic: {params['topic']}", level=2)
-    doc.add_heading(f"Grade Level: {params['grade_level']}", level=3)
+    doc = new_document(f"{params['subject']} - Exercise List", [
+        (f"Topic: {params['topic']}", 2),
+        (f"Grade Level: {params['grade_level']}", 3)
+    ])
     
-    # Add content with proper markdown formatting
-    _add_formatted_content_to_docx(doc, content)
-    
-    # Save to bytes
-    doc_io = io.BytesIO()
-    doc.save(doc_io)
-    doc_io.seek(0)
-    
-    return doc_io.getvalue()
-
-def _add_formatted_content_to_docx(doc, content):
-    """Add formatted content to Word document, parsing Markdown formatting"""
-    lines = content.split('\n')
+    add_blocks_to_docx(doc, blocks)
     
-    for i, line in enumerate(lines):
-        line = line.strip()
-        if not line:
-            doc.add_paragraph("")
-            continue
-        
-        # Skip horizontal rules
-        if line == '---' or line.startswith('---'):
-            continue
-        
-        # Clean up malformed headings (remove extra # symbols)
-        if line.startswith('#'):
-            # Count the number of # at the start
-            hash_count = 0
-            for char in line:
-                if char == '#':
-                    hash_count += 1
-                else:
-                    break
-            
-            # Extract the text after all the #
-            remaining_text = line[hash_count:].strip()
-            
-            # Remove any additional # symbols from the beginning of the text
-            while remaining_text.startswith('#'):
-                remaining_text = remaining_text[1:].strip()
-            
-            # Limit heading levels to 4
-            actual_level = min(hash_count, 4)
-            if actual_level > 0 and remaining_text:
-                doc.add_heading(remaining_text, level=actual_level)
-                continue
-            
-        # Check if it's a bullet point
-        if line.startswith('- ') or line.startswith('* ') or line.startswith('• '):
-            doc.add_paragraph(line[2:], style='List Bullet')
-        # Check if it's a numbered list
-        elif len(line) > 3 and line[0].isdigit() and line[1:3] in ['. ', ') ']:
-            doc.add_paragraph(line[3:], style='List Number')
-        else:
-            # Handle bold formatting and other text
-            formatted_text = line
-            
-            # Remove markdown bold formatting (**text**)
-            import re
-            formatted_text = re.sub(r'\*\*(.*?)\*\*', r'\1', formatted_text)
-            
-            doc.add_paragraph(formatted_text)
+    return docx_bytes(doc)
@@ -0,0 +1,214 @@
+"""
+Multi-format export of one generated document.
+An ExportBundle turns a single content string into Word, PowerPoint and
+Markdown files (plus a ZIP of all three) without calling the LLM again.
+Formats are built on a shared worker pool only when they are requested,
+and each one is built at most once per bundle. Built files are kept in the
+artifact store and the bundle only holds their keys; a file the store has
+lost is built again when it is needed.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import io
+import os
+import threading
+import zipfile
+
+from generators.docx_builder import new_document, add_blocks_to_docx, docx_bytes
+from generators.powerpoint_generator import create_presentation, slides_from_blocks, _parse_powerpoint_content
+from utils.artifact_store import get_artifact_store
+from utils.markdown_parser import Block, parse_inline, parse_markdown, render_markdown
+
+EXPORT_FORMATS = ("docx", "pptx", "md", "zip")
+
+# Formats that go into the ZIP archive
+ARCHIVE_FORMATS = ("docx", "pptx", "md")
+
+MIME_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "md": "text/markdown",
+    "zip": "application/zip",
+}
+
+EXPORT_WORKERS = int(os.getenv("EDUADOCS_EXPORT_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+
+
+def _blocks_from_slides(slides):
+    """Slide data as Markdown blocks, so slides can be exported as text"""
+    blocks = []
+    for slide in slides:
+        blocks.append(Block("heading", 2, parse_inline(slide['title'])))
+        for bullet in slide['bullets']:
+            blocks.append(Block("bullet", 0, parse_inline(bullet)))
+        if slide.get('notes'):
+            blocks.append(Block("paragraph", 0, parse_inline(f"Notes: {slide['notes']}")))
+        blocks.append(Block("blank", 0, ()))
+    return blocks
+
+
+class ExportBundle:
+    """Lazily built DOCX/PPTX/Markdown/ZIP exports of one document."""
+
+    def __init__(self, content, params, blocks=None, files=None):
+        """
+        ``blocks`` is the parsed content if the generator already has it;
+        ``files`` maps formats to bytes the generator already built.
+        """
+        self.content = content
+        self.params = params
+        self._blocks = blocks
+        self._slides = None
+        self._lock = threading.Lock()
+        # format -> Future of the built file's artifact key
+        self._futures = {}
+
+        for fmt, data in (files or {}).items():
+            if data:
+                future = Future()
+                future.set_result(self._store(data))
+                self._futures[fmt] = future
+
+    def _store(self, data):
+        """Put a built file in the artifact store and return its key"""
+        return get_artifact_store().put(data, session_id=self.params.get("session_id"))
+
+    def _build_and_store(self, builder):
+        return self._store(builder())
+
+    @property
+    def title(self):
+        """Document title shared by every format"""
+        return f"{self.params['subject']} - {self.params.get('doc_type', 'Document')}"
+
+    def file_name(self, fmt):
+        """Download name for a format"""
+        stem = f"{self.params['subject']}_{self.params.get('doc_type', 'Document').replace(' ', '_')}"
+        return f"{stem}.{fmt}"
+
+    def _is_presentation(self):
+        return self.params.get("doc_type_key") == "powerpoint"
+
+    def _get_slides(self):
+        """Slide data, parsed once"""
+        with self._lock:
+            if self._slides is None:
+                if self._is_presentation():
+                    self._slides = _parse_powerpoint_content(self.content)
+                else:
+                    self._slides = slides_from_blocks(self._get_blocks_locked(), self.title)
+            return self._slides
+
+    def _get_blocks_locked(self):
+        if self._blocks is None:
+            if self._is_presentation():
+                self._blocks = _blocks_from_slides(_parse_powerpoint_content(self.content))
+            else:
+                self._blocks = parse_markdown(self.content)
+        return self._blocks
+
+    def _get_blocks(self):
+        """Markdown blocks, parsed once"""
+        with self._lock:
+            return self._get_blocks_locked()
+
+    def _build_docx(self):
+        doc = new_document(self.title, [
+            (f"Topic: {self.params['topic']}", 2),
+            (f"Grade Level: {self.params['grade_level']}", 3)
+        ])
+        add_blocks_to_docx(doc, self._get_blocks(), nested_bullets=self.params.get("doc_type_key") == "mind_map")
+        return docx_bytes(doc)
+
+    def _build_pptx(self):
+        return create_presentation(self._get_slides(), self.params)
+
+    def _build_md(self):
+        header = (
+            f"# {self.title}\n\n"
+            f"## Topic: {self.params['topic']}\n"
+            f"### Grade Level: {self.params['grade_level']}\n\n"
+        )
+        return (header + render_markdown(self._get_blocks()) + "\n").encode("utf-8")
+
+    def _build_zip(self, parts):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as target:
+            for fmt in ARCHIVE_FORMATS:
+                data = get_artifact_store().get(parts[fmt].result())
+                if data is None:
+                    data = getattr(self, f"_build_{fmt}")()
+                target.writestr(self.file_name(fmt), data)
+        return archive.getvalue()
+
+    def request(self, fmt):
+        """Start building a format in the background and return its Future"""
+        if fmt not in EXPORT_FORMATS:
+            raise Exception(f"Unsupported export format: {fmt}")
+
+        with self._lock:
+            future = self._futures.get(fmt)
+            if future is not None:
+                return future
+            if fmt != "zip":
+                builder = getattr(self, f"_build_{fmt}")
+                future = self._futures[fmt] = _executor.submit(self._build_and_store, builder)
+                return future
+            future = self._futures[fmt] = Future()
+
+        # The archive is assembled by whichever part finishes last, so no
+        # worker ever blocks waiting for the others
+        parts = {part: self.request(part) for part in ARCHIVE_FORMATS}
+        remaining = [len(parts)]
+        remaining_lock = threading.Lock()
+
+        def part_done(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                future.set_result(self._store(self._build_zip(parts)))
+            except Exception as e:
+                future.set_exception(e)
+
+        for part in parts.values():
+            part.add_done_callback(part_done)
+        return future
+
+    def prefetch(self, formats=EXPORT_FORMATS):
+        """Start building several formats at once"""
+        for fmt in formats:
+            self.request(fmt)
+
+    def is_ready(self, fmt):
+        """Tell whether a format has been built successfully"""
+        future = self._futures.get(fmt)
+        return future is not None and future.done() and future.exception() is None
+
+    def get(self, fmt):
+        """Return a format's bytes, building it if needed"""
+        data = get_artifact_store().get(self.request(fmt).result())
+        if data is None:
+            # Evicted from the store: build it again
+            if fmt == "zip":
+                data = self._build_zip({part: self.request(part) for part in ARCHIVE_FORMATS})
+            else:
+                data = getattr(self, f"_build_{fmt}")()
+            future = Future()
+            future.set_result(self._store(data))
+            with self._lock:
+                self._futures[fmt] = future
+        return data
+
+
+def create_export_bundle(result, params):
+    """Wrap a successful generation result in an ExportBundle"""
+    return ExportBundle(
+        result["content"],
+        params,
+        blocks=result.get("blocks"),
+        files={"docx": result.get("docx_file"), "pptx": result.get("pptx_file")}
+    )
@@ -1,53 +1,68 @@
 from llm_handlers.api_handler import get_llm_response
-from docx import Document
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-import io
-import re
+from generators.docx_builder import new_document, add_blocks_to_docx, docx_bytes
+from generators.outline_pipeline import generate_from_outline
+from utils.markdown_parser import parse_markdown
 
 def generate_lecture_notes(params):
-    """Generate lecture notes document"""
+    """Generate lecture notes document
     
-    prompt = _build_lecture_notes_prompt(params)
+    With ``outline_first`` an outline is generated first and its sections
+    are written concurrently (see generators.outline_pipeline).
+    """
     
     try:
-        # Get content from LLM
-        content = get_llm_response(prompt, params["llm_config"])
+        content = None
+        if params.get("outline_first"):
+            content = generate_from_outline(params, _build_outline_prompt(params), _build_section_prompt)
+        
+        if content is None:
+            # Get content from LLM
+            content = get_llm_response(_build_lecture_notes_prompt(params), params["llm_config"], on_token=params.get("on_token"))
         
         # Create Word document
-        docx_file = _create_lecture_notes_docx(content, params)
+        blocks = parse_markdown(content)
+        docx_file = _create_lecture_notes_docx(blocks, params)
         
         return {
             "success": True,
             "content": content,
+            "blocks": blocks,
             "docx_file": docx_file
         }
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def _build_lecture_notes_prompt(params):
-    """Build prompt for lecture notes generation"""
+def _notes_settings(params):
+    """The options every lecture notes prompt shares"""
     
     detail_level = params.get("detail_level") or "Standard"
     format_style = params.get("format_style") or "Paragraphs"
     include_examples = params.get("include_examples", True)
     include_references = params.get("include_references", False)
     
-    prompt = f"""
-    Create lecture notes for {params['subject']} at {params['grade_level']} level.
-    
-    Topic: {params['topic']}
+    return f"""Topic: {params['topic']}
     Detail level: {detail_level}
     Format style: {format_style}
     Include examples: {include_examples}
-    Include references: {include_references}
-    
-    Structure the notes with:
-    1. Brief introduction and learning goals
+    Include references: {include_references}"""
+
+_NOTES_STRUCTURE = """1. Brief introduction and learning goals
     2. Key concepts and definitions
     3. Explanations with examples (if requested)
     4. Key takeaways or summary
-    5. References or further reading (if requested)
+    5. References or further reading (if requested)"""
+
+def _build_lecture_notes_prompt(params):
+    """Build prompt for lecture notes generation"""
+    
+    prompt = f"""
+    Create lecture notes for {params['subject']} at {params['grade_level']} level.
+    
+    {_notes_settings(params)}
+    
+    Structure the notes with:
+    {_NOTES_STRUCTURE}
     
     FORMATTING RULES:
     - Use Markdown headings (#, ##, ###) for sections
@@ -58,58 +73,63 @@ def _build_lecture_notes_prompt(params):
     
     return prompt
 
-def _create_lecture_notes_docx(content, params):
-    """Create Word document from lecture notes content"""
+def _build_outline_prompt(params):
+    """Build prompt for the outline of outline-first lecture notes"""
     
-    doc = Document()
+    prompt = f"""
+    Create the outline of lecture notes for {params['subject']} at {params['grade_level']} level.
     
-    title_text = f"{params['subject']} - {params.get('doc_type', 'Lecture Notes')}"
-    title = doc.add_heading(title_text, 0)
-    title.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    {_notes_settings(params)}
     
-    doc.add_heading(f"Topic: {params['topic']}", level=2)
-    doc.add_heading(f"Grade Level: {params['grade_level']}", level=3)
+    The notes will cover:
+    {_NOTES_STRUCTURE}
     
-    _add_formatted_content_to_docx(doc, content)
+    FORMATTING RULES:
+    - Start with a single H1 title (#)
+    - Then one H2 heading (##) per section of the notes, in teaching order
+    - Under each H2, 2-4 short bullet points (- ) saying what the section covers
+    - No other text
+    - Write in the same language as the subject/topic
+    """
+    
+    return prompt
+
+def _build_section_prompt(params, outline, section):
+    """Build prompt for one section of outline-first lecture notes"""
+    
+    points = "\n".join(f"    - {point}" for point in section.points)
     
-    doc_io = io.BytesIO()
-    doc.save(doc_io)
-    doc_io.seek(0)
+    prompt = f"""
+    Write one section of lecture notes for {params['subject']} at {params['grade_level']} level.
+    
+    {_notes_settings(params)}
+    
+    Outline of the whole notes:
+    {outline}
+    
+    Section to write: {section.heading}
+    It should cover:
+{points}
+    
+    FORMATTING RULES:
+    - Write only this section; other sections are written separately, so do not repeat their content
+    - Do not repeat the section heading; use ### for subsections
+    - Use bullet points when the format style is "Bullet Points" or "Outline"
+    - Keep the content clear and classroom-ready
+    - Write in the same language as the subject/topic
+    """
     
-    return doc_io.getvalue()
+    return prompt
 
-def _add_formatted_content_to_docx(doc, content):
-    """Add formatted content to Word document, parsing Markdown formatting"""
-    lines = content.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            doc.add_paragraph("")
-            continue
-        
-        if line.startswith('#'):
-            hash_count = 0
-            for char in line:
-                if char == '#':
-                    hash_count += 1
-                else:
-                    break
-            
-            heading_text = line[hash_count:].strip()
-            heading_text = re.sub(r'\*\*(.*?)\*\*', r'\1', heading_text)
-            
-            actual_level = min(hash_count, 4)
-            if actual_level > 0 and heading_text:
-                doc.add_heading(heading_text, level=actual_level)
-                continue
-        
-        if line.startswith('- ') or line.startswith('* ') or line.startswith('• '):
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', line[2:].strip())
-            doc.add_paragraph(text, style='List Bullet')
-        elif len(line) > 2 and line[0].isdigit() and line[1:3] in ['. ', ') ']:
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', line[3:].strip())
-            doc.add_paragraph(text, style='List Number')
-        else:
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', line)
-            doc.add_paragraph(text)
+def _create_lecture_notes_docx(blocks, params):
+    """Create Word document from parsed lecture notes content"""
+    
+    title_text = f"{params['subject']} - {params.get('doc_type', 'Lecture Notes')}"
+    doc = new_document(title_text, [
+        (f"Topic: {params['topic']}", 2),
+        (f"Grade Level: {params['grade_level']}", 3)
+    ])
+    
+    add_blocks_to_docx(doc, blocks)
+    
+    return docx_bytes(doc)
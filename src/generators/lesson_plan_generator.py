@@ -1,32 +1,40 @@
 from llm_handlers.api_handler import get_llm_response
-from docx import Document
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-import io
-import re
+from generators.docx_builder import new_document, add_blocks_to_docx, docx_bytes
+from generators.outline_pipeline import generate_from_outline
+from utils.markdown_parser import parse_markdown
 
 def generate_lesson_plan(params):
-    """Generate lesson plan document"""
+    """Generate lesson plan document
     
-    prompt = _build_lesson_plan_prompt(params)
+    With ``outline_first`` an outline is generated first and its sections
+    are written concurrently (see generators.outline_pipeline).
+    """
     
     try:
-        # Get content from LLM
-        content = get_llm_response(prompt, params["llm_config"])
+        content = None
+        if params.get("outline_first"):
+            content = generate_from_outline(params, _build_outline_prompt(params), _build_section_prompt)
+        
+        if content is None:
+            # Get content from LLM
+            content = get_llm_response(_build_lesson_plan_prompt(params), params["llm_config"], on_token=params.get("on_token"))
         
         # Create Word document
-        docx_file = _create_lesson_plan_docx(content, params)
+        blocks = parse_markdown(content)
+        docx_file = _create_lesson_plan_docx(blocks, params)
         
         return {
             "success": True,
             "content": content,
+            "blocks": blocks,
             "docx_file": docx_file
         }
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def _build_lesson_plan_prompt(params):
-    """Build prompt for lesson plan generation"""
+def _plan_settings(params):
+    """The options every lesson plan prompt shares"""
     
     duration_minutes = params.get("duration_minutes")
     learning_objectives = params.get("learning_objectives") or "Not specified"
@@ -36,26 +44,33 @@ def _build_lesson_plan_prompt(params):
     lesson_flow = params.get("lesson_flow") or "Not specified"
     include_differentiation = params.get("include_differentiation", False)
     
-    prompt = f"""
-    Create a detailed lesson plan for {params['subject']} at {params['grade_level']} level.
-    
-    Topic: {params['topic']}
+    return f"""Topic: {params['topic']}
     Duration: {duration_minutes} minutes
     Learning objectives: {learning_objectives}
     Materials/Resources: {materials}
     Teaching methodology: {methodology}
     Assessment strategy: {assessment_strategy}
     Lesson flow: {lesson_flow}
-    Include differentiation/adaptations: {include_differentiation}
-    
-    Structure the lesson plan with:
-    1. Lesson title and objectives
+    Include differentiation/adaptations: {include_differentiation}"""
+
+_PLAN_STRUCTURE = """1. Lesson title and objectives
     2. Prior knowledge or prerequisites
     3. Step-by-step lesson flow (warm-up, main activity, closure), using the provided flow when specified
     4. Materials and resources list
     5. Assessment strategy
     6. Differentiation/adaptations for diverse learners (if requested)
-    7. Homework or extension activities (optional)
+    7. Homework or extension activities (optional)"""
+
+def _build_lesson_plan_prompt(params):
+    """Build prompt for lesson plan generation"""
+    
+    prompt = f"""
+    Create a detailed lesson plan for {params['subject']} at {params['grade_level']} level.
+    
+    {_plan_settings(params)}
+    
+    Structure the lesson plan with:
+    {_PLAN_STRUCTURE}
     
     FORMATTING RULES:
     - Use Markdown headings (#, ##, ###) for sections
@@ -66,61 +81,66 @@ def _build_lesson_plan_prompt(params):
     
     return prompt
 
-def _create_lesson_plan_docx(content, params):
-    """Create Word document from lesson plan content"""
+def _build_outline_prompt(params):
+    """Build prompt for the outline of an outline-first lesson plan"""
     
-    doc = Document()
+    prompt = f"""
+    Create the outline of a detailed lesson plan for {params['subject']} at {params['grade_level']} level.
     
-    title_text = f"{params['subject']} - {params.get('doc_type', 'Lesson Plan')}"
-    title = doc.add_heading(title_text, 0)
-    title.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    {_plan_settings(params)}
     
-    doc.add_heading(f"Topic: {params['topic']}", level=2)
-    doc.add_heading(f"Grade Level: {params['grade_level']}", level=3)
+    The lesson plan will cover:
+    {_PLAN_STRUCTURE}
     
-    if params.get("duration_minutes"):
-        doc.add_paragraph(f"Duration: {params['duration_minutes']} minutes")
+    FORMATTING RULES:
+    - Start with a single H1 title (#) with the lesson title
+    - Then one H2 heading (##) per section of the plan, in the order above
+    - Under each H2, 2-4 short bullet points (- ) saying what the section covers, with timings for lesson flow steps
+    - No other text
+    - Write in the same language as the subject/topic
+    """
+    
+    return prompt
+
+def _build_section_prompt(params, outline, section):
+    """Build prompt for one section of an outline-first lesson plan"""
+    
+    points = "\n".join(f"    - {point}" for point in section.points)
     
-    _add_formatted_content_to_docx(doc, content)
+    prompt = f"""
+    Write one section of a detailed lesson plan for {params['subject']} at {params['grade_level']} level.
+    
+    {_plan_settings(params)}
+    
+    Outline of the whole lesson plan:
+    {outline}
     
-    doc_io = io.BytesIO()
-    doc.save(doc_io)
-    doc_io.seek(0)
+    Section to write: {section.heading}
+    It should cover:
+{points}
+    
+    FORMATTING RULES:
+    - Write only this section; other sections are written separately, so do not repeat their content
+    - Do not repeat the section heading; use ### for subsections
+    - Use bullet points for lists and activities
+    - Keep timings consistent with the outline and avoid horizontal rules
+    - Write in the same language as the subject/topic
+    """
     
-    return doc_io.getvalue()
+    return prompt
 
-def _add_formatted_content_to_docx(doc, content):
-    """Add formatted content to Word document, parsing Markdown formatting"""
-    lines = content.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            doc.add_paragraph("")
-            continue
-        
-        if line.startswith('#'):
-            hash_count = 0
-            for char in line:
-                if char == '#':
-                    hash_count += 1
-                else:
-                    break
-            
-            heading_text = line[hash_count:].strip()
-            heading_text = re.sub(r'\*\*(.*?)\*\*', r'\1', heading_text)
-            
-            actual_level = min(hash_count, 4)
-            if actual_level > 0 and heading_text:
-                doc.add_heading(heading_text, level=actual_level)
-                continue
-        
-        if line.startswith('- ') or line.startswith('* ') or line.startswith('• '):
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', line[2:].strip())
-            doc.add_paragraph(text, style='List Bullet')
-        elif len(line) > 2 and line[0].isdigit() and line[1:3] in ['. ', ') ']:
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', line[3:].strip())
-            doc.add_paragraph(text, style='List Number')
-        else:
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', line)
-            doc.add_paragraph(text)
+def _create_lesson_plan_docx(blocks, params):
+    """Create Word document from parsed lesson plan content"""
+    
+    title_text = f"{params['subject']} - {params.get('doc_type', 'Lesson Plan')}"
+    doc = new_document(title_text, [
+        (f"Topic: {params['topic']}", 2),
+        (f"Grade Level: {params['grade_level']}", 3)
+    ])
+    
+    if params.get("duration_minutes"):
+        doc.add_paragraph(f"Duration: {params['duration_minutes']} minutes")
+    
+    add_blocks_to_docx(doc, blocks)
+    
+    return docx_bytes(doc)
@@ -1,126 +1,216 @@
 from llm_handlers.api_handler import get_llm_response
-from docx import Document
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from docx.shared import Inches
-import io
-import re
+from llm_handlers.parallel import get_llm_responses, split_output_budget
+from llm_handlers.resilience import new_deadline
+from generators.docx_builder import new_document, add_blocks_to_docx, docx_bytes
+from utils.markdown_parser import parse_markdown, render_inline
+
+class MindMapNode:
+    """A node of the mind map; ``expanded`` tells whether its sub-branches were generated."""
+    
+    def __init__(self, text, children=None, expanded=False):
+        self.text = text
+        self.children = children if children is not None else []
+        self.expanded = expanded
 
 def generate_mind_map(params):
-    """Generate lesson mind map document"""
+    """Generate lesson mind map document
     
-    prompt = _build_mind_map_prompt(params)
+    The central topic and main branches come from one short call; each
+    branch's subtree is then generated in its own call, several at a time.
+    With ``lazy_branches`` only the first step runs and branches are
+    expanded later with expand_mind_map_branch.
+    """
     
     try:
-        # Get content from LLM
-        content = get_llm_response(prompt, params["llm_config"])
+        llm_config = params["llm_config"]
+        branches = params.get("main_branches") or 6
+        
+        # Root and main branches first (breadth-first)
+        skeleton = get_llm_response(_build_skeleton_prompt(params), split_output_budget(llm_config, branches))
+        tree = parse_mind_map(skeleton, params['topic'])
+        _preview(params, tree)
         
-        # Create Word document
-        docx_file = _create_mind_map_docx(content, params)
+        if not params.get("lazy_branches"):
+            _expand_branches(tree, [b for b in tree.children if not b.expanded], params)
         
-        return {
-            "success": True,
-            "content": content,
-            "docx_file": docx_file
-        }
+        return _mind_map_result(tree, params)
+        
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def expand_mind_map_branch(tree, branch_index, params):
+    """Generate the subtree of one main branch on demand and rebuild the document"""
+    
+    try:
+        # The document's original deadline has long passed
+        llm_config = dict(params["llm_config"], deadline=new_deadline())
+        _expand_branches(tree, [tree.children[branch_index]], dict(params, llm_config=llm_config))
+        return _mind_map_result(tree, params)
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def _build_mind_map_prompt(params):
-    """Build prompt for mind map generation"""
+def _expand_branches(tree, branches, params):
+    """Generate several branches' subtrees concurrently"""
+    
+    if not branches:
+        return
+    
+    prompts = [_build_branch_prompt(params, tree, branch) for branch in branches]
+    config = split_output_budget(params["llm_config"], params.get("main_branches") or len(tree.children))
+    
+    def on_complete(index, content):
+        branch = branches[index]
+        branch.children = _parse_subtree(content, branch.text)
+        branch.expanded = True
+        # Show each branch as soon as it is ready
+        _preview(params, tree)
+    
+    get_llm_responses(prompts, config, on_complete=on_complete)
+
+def _preview(params, tree):
+    """Hand the current state of the map to the live preview"""
+    
+    on_preview = params.get("on_preview")
+    if on_preview:
+        on_preview(render_mind_map(tree))
+
+def _mind_map_result(tree, params):
+    """Render the tree and build the Word document"""
+    
+    content = render_mind_map(tree)
+    blocks = parse_markdown(content)
+    docx_file = _create_mind_map_docx(blocks, params)
+    
+    return {
+        "success": True,
+        "content": content,
+        "blocks": blocks,
+        "docx_file": docx_file,
+        "mind_map": tree
+    }
+
+def parse_mind_map(content, default_title):
+    """Build the tree from Markdown: H1 root, H2 main branches, nested bullets below"""
+    
+    root = MindMapNode(default_title, expanded=True)
+    stack = [(-1, root)]
+    
+    for block in parse_markdown(content):
+        text = render_inline(block.runs)
+        if block.kind == "heading" and block.level == 1:
+            root.text = text
+        elif block.kind == "heading":
+            branch = MindMapNode(text)
+            root.children.append(branch)
+            stack = [(-1, root), (0, branch)]
+        elif block.kind in ("bullet", "number"):
+            while len(stack) > 1 and stack[-1][0] >= block.level + 1:
+                stack.pop()
+            parent = stack[-1][1]
+            node = MindMapNode(text, expanded=parent is not root)
+            parent.children.append(node)
+            if parent is not root:
+                # A branch the model already filled in needs no second call
+                parent.expanded = True
+            stack.append((block.level + 1, node))
+    
+    return root
+
+def _parse_subtree(content, branch_text):
+    """Parse one branch's nested bullets into nodes"""
+    
+    nodes = []
+    for child in parse_mind_map(content, branch_text).children:
+        # Some models repeat the branch itself as a heading; keep what is below it
+        if child.text.strip().lower() == branch_text.strip().lower():
+            nodes.extend(child.children)
+        else:
+            nodes.append(child)
+    return nodes
+
+def render_mind_map(tree):
+    """Render the tree as Markdown"""
+    
+    lines = [f"# {tree.text}", ""]
+    
+    def add_nodes(nodes, level):
+        for node in nodes:
+            lines.append("  " * level + f"- {node.text}")
+            add_nodes(node.children, level + 1)
+    
+    for branch in tree.children:
+        lines.append(f"## {branch.text}")
+        add_nodes(branch.children, 0)
+        lines.append("")
+    
+    return "\n".join(lines).rstrip() + "\n"
+
+def _hierarchy_instruction(params):
+    if params.get("highlight_hierarchy", True):
+        return "Emphasize hierarchical relationships between concepts."
+    return "Keep the hierarchy minimal and focus on main branches."
+
+def _build_skeleton_prompt(params):
+    """Build prompt for the central topic and main branches"""
     
     main_branches = params.get("main_branches") or 6
-    depth_levels = params.get("depth_levels") or 3
-    include_examples = params.get("include_examples", True)
-    highlight_hierarchy = params.get("highlight_hierarchy", True)
-    hierarchy_instruction = "Emphasize hierarchical relationships between concepts."
-    if not highlight_hierarchy:
-        hierarchy_instruction = "Keep the hierarchy minimal and focus on main branches."
     
     prompt = f"""
-    Create a lesson mind map for {params['subject']} at {params['grade_level']} level.
+    Create the top level of a lesson mind map for {params['subject']} at {params['grade_level']} level.
     
     Topic: {params['topic']}
     Main branches: {main_branches}
-    Depth levels: {depth_levels}
-    Include examples/applications: {include_examples}
-    Hierarchy emphasis: {highlight_hierarchy}
+    Include examples/applications: {params.get("include_examples", True)}
     
     FORMATTING RULES:
     - Use Markdown only
     - Start with a single H1 title (#) for the central topic
-    - Use H2 headings (##) for each main branch
-    - Use nested bullet points for sub-branches with 2 spaces per level
+    - Then exactly {main_branches} H2 headings (##), one per main branch
+    - Do not add sub-branches, bullet points or any other text
     - Keep each node short (max 8-10 words)
-    - Avoid paragraphs and horizontal rules
     - Write in the same language as the subject/topic
-    - {hierarchy_instruction}
     """
     
     return prompt
 
-def _create_mind_map_docx(content, params):
-    """Create Word document from mind map content"""
-    
-    doc = Document()
+def _build_branch_prompt(params, tree, branch):
+    """Build prompt for the sub-branches of one main branch"""
     
-    title_text = f"{params['subject']} - {params.get('doc_type', 'Lesson Mind Map')}"
-    title = doc.add_heading(title_text, 0)
-    title.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    depth_levels = params.get("depth_levels") or 3
+    sub_levels = max(1, depth_levels - 1)
+    other_branches = ", ".join(b.text for b in tree.children if b is not branch)
     
-    doc.add_heading(f"Topic: {params['topic']}", level=2)
-    doc.add_heading(f"Grade Level: {params['grade_level']}", level=3)
+    prompt = f"""
+    Expand one branch of a lesson mind map for {params['subject']} at {params['grade_level']} level.
     
-    _add_mind_map_content_to_docx(doc, content)
+    Central topic: {tree.text}
+    Branch to expand: {branch.text}
+    Other branches (do not cover them): {other_branches}
+    Levels below this branch: {sub_levels}
+    Include examples/applications: {params.get("include_examples", True)}
     
-    doc_io = io.BytesIO()
-    doc.save(doc_io)
-    doc_io.seek(0)
+    FORMATTING RULES:
+    - Output only nested bullet points (- ) for this branch's sub-branches, 2 spaces per level
+    - Do not repeat the branch name and do not use headings
+    - Keep each node short (max 8-10 words)
+    - Avoid paragraphs and horizontal rules
+    - Write in the same language as the subject/topic
+    - {_hierarchy_instruction(params)}
+    """
     
-    return doc_io.getvalue()
+    return prompt
 
-def _add_mind_map_content_to_docx(doc, content):
-    """Add mind map content to Word document, preserving hierarchy"""
-    lines = content.split('\n')
+def _create_mind_map_docx(blocks, params):
+    """Create Word document from parsed mind map content"""
     
-    for line in lines:
-        raw_line = line.rstrip('\n')
-        stripped = raw_line.strip()
-        
-        if not stripped:
-            doc.add_paragraph("")
-            continue
-        
-        if stripped.startswith('#'):
-            hash_count = 0
-            for char in stripped:
-                if char == '#':
-                    hash_count += 1
-                else:
-                    break
-            
-            heading_text = stripped[hash_count:].strip()
-            heading_text = re.sub(r'\*\*(.*?)\*\*', r'\1', heading_text)
-            
-            actual_level = min(hash_count, 4)
-            if actual_level > 0 and heading_text:
-                doc.add_heading(heading_text, level=actual_level)
-                continue
-        
-        bullet_line = raw_line.lstrip()
-        if bullet_line.startswith('- ') or bullet_line.startswith('* ') or bullet_line.startswith('• '):
-            indent_spaces = len(raw_line) - len(bullet_line)
-            level = max(0, indent_spaces // 2)
-            text = bullet_line[2:].strip()
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
-            paragraph = doc.add_paragraph(text, style='List Bullet')
-            if level > 0:
-                paragraph.paragraph_format.left_indent = Inches(0.25 * level)
-            continue
-        
-        if len(stripped) > 2 and stripped[0].isdigit() and stripped[1:3] in ['. ', ') ']:
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', stripped[3:].strip())
-            doc.add_paragraph(text, style='List Number')
-        else:
-            text = re.sub(r'\*\*(.*?)\*\*', r'\1', stripped)
-            doc.add_paragraph(text)
+    title_text = f"{params['subject']} - {params.get('doc_type', 'Lesson Mind Map')}"
+    doc = new_document(title_text, [
+        (f"Topic: {params['topic']}", 2),
+        (f"Grade Level: {params['grade_level']}", 3)
+    ])
+    
+    # Nested bullets keep their indentation to preserve the hierarchy
+    add_blocks_to_docx(doc, blocks, nested_bullets=True)
+    
+    return docx_bytes(doc)
@@ -0,0 +1,103 @@
+"""
+Outline-first generation for long, sectioned documents.
+One short call returns the document's outline; every section is then
+written by its own call, several at a time, with the whole outline as
+shared context. Sections are assembled in outline order and shown in the
+preview as soon as each one is ready.
+"""
+
+from collections import namedtuple
+
+from llm_handlers.api_handler import get_llm_response
+from llm_handlers.parallel import get_llm_responses, split_output_budget
+from llm_handlers.token_accounting import MIN_OUTPUT_TOKENS, reasoning_headroom
+from utils.markdown_parser import parse_markdown, render_inline
+
+# heading: section heading text; points: what the section should cover
+Section = namedtuple("Section", ["heading", "points"])
+
+# Fewer sections than this gain nothing from running in parallel
+MIN_SECTIONS = 2
+
+
+def parse_outline(content):
+    """Read the H1 title and the H2 sections (with their bullet points) from an outline"""
+    title = None
+    sections = []
+    for block in parse_markdown(content):
+        text = render_inline(block.runs).strip()
+        if not text:
+            continue
+        if block.kind == "heading" and block.level == 1 and title is None:
+            title = text
+        elif block.kind == "heading" and block.level == 2:
+            sections.append(Section(text, []))
+        elif block.kind in ("bullet", "number", "paragraph") and sections:
+            sections[-1].points.append(text)
+    return title, sections
+
+
+def render_outline(title, sections):
+    """The outline as Markdown, used as context for every section"""
+    lines = [f"# {title}"] if title else []
+    for section in sections:
+        lines.append(f"## {section.heading}")
+        lines += [f"- {point}" for point in section.points]
+    return "\n".join(lines)
+
+
+def _section_body(content):
+    """A section's text without the heading the model may have repeated"""
+    lines = content.strip().split("\n")
+    while lines and (not lines[0].strip() or lines[0].lstrip().startswith(("# ", "## "))):
+        lines.pop(0)
+    return "\n".join(lines).strip()
+
+
+def assemble_document(title, sections, bodies):
+    """Join the sections in outline order; sections still being written show their outline"""
+    parts = [f"# {title}"] if title else []
+    for section, body in zip(sections, bodies):
+        if body is None:
+            body = "\n".join(f"- {point}" for point in section.points)
+        parts.append(f"## {section.heading}\n\n{body}".rstrip())
+    return "\n\n".join(parts) + "\n"
+
+
+def generate_from_outline(params, outline_prompt, build_section_prompt):
+    """
+    Generate a document outline-first and return its Markdown content.
+
+    ``build_section_prompt(params, outline, section)`` builds the prompt of
+    one section from the rendered outline. Returns None when the outline has
+    too few sections, so the caller can fall back to a single call.
+    """
+    llm_config = params["llm_config"]
+
+    # The outline is short; don't let it use the whole document's budget,
+    # but leave reasoning models room to think before they write it
+    outline_config = llm_config
+    if llm_config.get("max_output_tokens"):
+        outline_cap = MIN_OUTPUT_TOKENS * reasoning_headroom(llm_config)
+        outline_config = dict(llm_config, max_output_tokens=min(llm_config["max_output_tokens"], outline_cap))
+
+    title, sections = parse_outline(get_llm_response(outline_prompt, outline_config))
+    if len(sections) < MIN_SECTIONS:
+        return None
+
+    title = title or params["topic"]
+    outline = render_outline(title, sections)
+    bodies = [None] * len(sections)
+    on_preview = params.get("on_preview")
+    if on_preview:
+        on_preview(assemble_document(title, sections, bodies))
+
+    def on_complete(index, content):
+        bodies[index] = _section_body(content)
+        if on_preview:
+            on_preview(assemble_document(title, sections, bodies))
+
+    prompts = [build_section_prompt(params, outline, section) for section in sections]
+    get_llm_responses(prompts, split_output_budget(llm_config, len(sections)), on_complete=on_complete)
+
+    return assemble_document(title, sections, bodies)
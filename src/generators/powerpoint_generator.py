@@ -1,9 +1,41 @@
 from llm_handlers.api_handler import get_llm_response
+from utils.markdown_parser import parse_inline, plain_text, render_inline
 from pptx import Presentation
 from pptx.util import Inches
 from pptx.enum.text import PP_ALIGN
+from pptx.enum.shapes import PP_PLACEHOLDER
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from pptx.opc.packuri import PackURI
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
+from pptx.oxml.slide import CT_NotesSlide
+from pptx.parts.slide import NotesSlidePart, SlidePart
+from copy import deepcopy
+from xml.sax.saxutils import escape
+import hashlib
 import io
+import os
 import re
+import threading
+
+# Optional .pptx file whose layouts, theme and masters every deck uses
+PPTX_TEMPLATE_PATH = os.getenv("EDUADOCS_PPTX_TEMPLATE", "")
+
+# Preferred layout for content slides
+CONTENT_LAYOUT_NAME = "Title and Content"
+
+TITLE_PLACEHOLDERS = {PP_PLACEHOLDER.TITLE, PP_PLACEHOLDER.CENTER_TITLE}
+BODY_PLACEHOLDERS = {PP_PLACEHOLDER.BODY, PP_PLACEHOLDER.OBJECT}
+
+NO_CONTENT_TEXT = "No content available"
+
+_A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+
+_SLIDE_MARKER = re.compile(r'SLIDE', re.IGNORECASE)
+_SLIDE_TITLE = re.compile(r'SLIDE\s*\d*:?\s*(.+)', re.IGNORECASE)
+
+# Characters that are not allowed in XML 1.0
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
 
 def generate_powerpoint(params):
     """Generate PowerPoint presentation"""
@@ -11,14 +43,15 @@ def generate_powerpoint(params):
     prompt = _build_powerpoint_prompt(params)
     
     try:
-        # Get content from LLM
-        content = get_llm_response(prompt, params["llm_config"])
+        # Slides are built while the LLM is still streaming the rest
+        deck = _StreamingDeck(params)
+        content = get_llm_response(prompt, params["llm_config"], on_token=deck.on_token)
         
         if not content or content.strip() == "":
             return {"success": False, "error": "LLM returned empty content"}
         
         # Create PowerPoint file
-        pptx_file = _create_powerpoint_pptx(content, params)
+        pptx_file = deck.finish(content)
         
         return {
             "success": True,
@@ -70,15 +103,237 @@ def _build_powerpoint_prompt(params):
     
     return prompt
 
+class _StreamingDeck:
+    """Parses the token stream and adds each slide to the deck once it is complete."""
+
+    def __init__(self, params):
+        self.params = params
+        self._forward = params.get("on_token")
+        self._chunks = []
+        self._parser = SlideStreamParser()
+        self._deck = get_slide_template(params.get("pptx_template")).new_deck()
+
+    def on_token(self, chunk):
+        """Streaming callback passed to the LLM handler"""
+        self._chunks.append(chunk)
+        for slide_data in self._parser.feed(chunk):
+            self._deck.add_slide(slide_data)
+        if self._forward:
+            self._forward(chunk)
+
+    def finish(self, content):
+        """Add the last slides and return the deck's bytes"""
+        if "".join(self._chunks) != content:
+            # The stream did not carry the final text; build from it directly
+            return _create_powerpoint_pptx(content, self.params)
+        try:
+            for slide_data in self._parser.finish():
+                self._deck.add_slide(slide_data)
+            return self._deck.to_bytes()
+        except Exception as e:
+            raise Exception(f"Failed to create PowerPoint file: {str(e)}")
+
 def _create_powerpoint_pptx(content, params):
     """Create PowerPoint file from content"""
+    return create_presentation(_parse_powerpoint_content(content), params)
+
+class SlideTemplate:
+    """
+    A .pptx template with its content layout and placeholders resolved once.
+
+    A prototype slide (and notes page) is built from the layout when the
+    template is loaded; every deck then copies its placeholder shapes and
+    fills them in directly instead of having python-pptx clone and search
+    the layout's placeholders again for each slide.
+    """
+
+    def __init__(self, source=None):
+        """``source`` is a template path, the template's bytes, or None for the default"""
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as template_file:
+                source = template_file.read()
+        self._data = source
+
+        prs = self.open()
+        self.layout_index = _find_content_layout(prs.slide_layouts)
+        slide = prs.slides.add_slide(prs.slide_layouts[self.layout_index])
+
+        self.slide_shapes = list(slide.shapes._spTree.iter_shape_elms())
+        self.title_position = None
+        self.body_position = None
+        for placeholder in sorted(slide.placeholders, key=lambda ph: ph.placeholder_format.idx):
+            ph_type = placeholder.placeholder_format.type
+            position = self.slide_shapes.index(placeholder._element)
+            if ph_type in TITLE_PLACEHOLDERS and self.title_position is None:
+                self.title_position = position
+            elif ph_type in BODY_PLACEHOLDERS and self.body_position is None:
+                self.body_position = position
+
+        notes_slide = slide.notes_slide
+        self.notes_shapes = list(notes_slide.shapes._spTree.iter_shape_elms())
+        notes_placeholder = notes_slide.notes_placeholder
+        self.notes_position = self.notes_shapes.index(notes_placeholder._element) if notes_placeholder is not None else None
+
+    def open(self):
+        """A fresh Presentation based on this template"""
+        return Presentation(io.BytesIO(self._data) if self._data else None)
+
+    def build(self, slides_data):
+        """Create a deck with one slide per slide record and return its bytes"""
+        deck = self.new_deck()
+        for slide_data in slides_data:
+            deck.add_slide(slide_data)
+        return deck.to_bytes()
+
+    def new_deck(self):
+        """Start a deck that slides can be added to one at a time"""
+        return DeckBuilder(self)
+
+
+class DeckBuilder:
+    """A deck under construction from a SlideTemplate."""
+
+    def __init__(self, template):
+        self.template = template
+        self.slide_count = 0
+        self._prs = template.open()
+        self._layout_part = self._prs.slide_layouts[template.layout_index].part
+        self._presentation_part = self._prs.part
+        self._package = self._presentation_part.package
+        self._sld_id_lst = self._prs.slides._sldIdLst
+        self._notes_master_part = None
+
+        # Part names, relationship and slide IDs are allocated here; python-pptx
+        # rescans the whole package or relationship list for each of them,
+        # which makes large decks quadratic
+        partnames = [part.partname for part in self._package.iter_parts()]
+        self._slide_number = sum(1 for name in partnames if name.startswith("/ppt/slides/"))
+        self._notes_number = sum(1 for name in partnames if name.startswith("/ppt/notesSlides/"))
+        self._slide_id = max([255] + [int(sld_id.id) for sld_id in self._sld_id_lst.sldId_lst])
+
+    def add_slide(self, slide_data):
+        """Append a slide built from a slide record"""
+        template = self.template
+        self.slide_count += 1
+        self._slide_number += 1
+        self._slide_id += 1
+        slide_part = SlidePart.new(PackURI(f"/ppt/slides/slide{self._slide_number}.xml"), self._package, self._layout_part)
+        rId = self._presentation_part.rels._add_relationship(RT.SLIDE, slide_part)
+        self._sld_id_lst._add_sldId(id=self._slide_id, rId=rId)
+        slide = slide_part.slide
+
+        shapes = [deepcopy(shape) for shape in template.slide_shapes]
+        sp_tree = slide.shapes._spTree
+        for shape in shapes:
+            sp_tree.append(shape)
+
+        if template.title_position is not None:
+            title = plain_text(parse_inline(slide_data.get('title', 'Slide Title')))
+            _replace_paragraphs(shapes[template.title_position], _paragraph_xml(((title, False),) if title else (), first=True))
+
+        bullets = slide_data.get('bullets', [])
+        if template.body_position is None:
+            _add_text_box_to_slide(slide, bullets)
+        elif bullets:
+            _replace_paragraphs(shapes[template.body_position], "".join(
+                _paragraph_xml(parse_inline(bullet), first=index == 0) for index, bullet in enumerate(bullets)
+            ))
+        else:
+            _replace_paragraphs(shapes[template.body_position], _paragraph_xml(((NO_CONTENT_TEXT, False),), first=True))
+
+        notes_text = slide_data.get('notes', '')
+        if notes_text and template.notes_position is not None:
+            if self._notes_master_part is None:
+                self._notes_master_part = self._presentation_part.notes_master_part
+            self._notes_number += 1
+            notes_part = NotesSlidePart(
+                PackURI(f"/ppt/notesSlides/notesSlide{self._notes_number}.xml"),
+                CT.PML_NOTES_SLIDE,
+                self._package,
+                CT_NotesSlide.new()
+            )
+            notes_part.relate_to(self._notes_master_part, RT.NOTES_MASTER)
+            notes_part.relate_to(slide_part, RT.SLIDE)
+            slide_part.relate_to(notes_part, RT.NOTES_SLIDE)
+
+            notes_shapes = [deepcopy(shape) for shape in template.notes_shapes]
+            notes_tree = notes_part.notes_slide.shapes._spTree
+            for shape in notes_shapes:
+                notes_tree.append(shape)
+            _replace_paragraphs(notes_shapes[template.notes_position], _paragraph_xml(((notes_text, False),), first=True))
+
+    def to_bytes(self):
+        """Save the deck"""
+        pptx_io = io.BytesIO()
+        self._prs.save(pptx_io)
+        return pptx_io.getvalue()
+
+
+def _find_content_layout(layouts):
+    """Index of the layout to use: "Title and Content", or any title + body layout"""
+    fallback = None
+    for index, layout in enumerate(layouts):
+        types = {placeholder.placeholder_format.type for placeholder in layout.placeholders}
+        if types & TITLE_PLACEHOLDERS and types & BODY_PLACEHOLDERS:
+            if layout.name == CONTENT_LAYOUT_NAME:
+                return index
+            if fallback is None:
+                fallback = index
+    if fallback is not None:
+        return fallback
+    return 1 if len(layouts) > 1 else 0
+
+
+def _paragraph_xml(runs, first=False):
+    """DrawingML for one paragraph, in the form python-pptx writes it"""
+    parts = ["<a:p>"]
+    if not first:
+        # python-pptx adds an (empty) pPr when the paragraph level is set
+        parts.append("<a:pPr/>")
+    for text, bold in runs:
+        text = _INVALID_XML_CHARS.sub("", text)
+        if text:
+            parts.append(f'<a:r><a:rPr b="1"/><a:t>{escape(text)}</a:t></a:r>' if bold else f"<a:r><a:t>{escape(text)}</a:t></a:r>")
+    parts.append("</a:p>")
+    return "".join(parts)
+
+
+def _replace_paragraphs(shape, paragraphs_xml):
+    """Replace the paragraphs of a shape's text body"""
+    tx_body = shape.find(qn("p:txBody"))
+    if tx_body is None:
+        return
+    for paragraph in tx_body.findall(qn("a:p")):
+        tx_body.remove(paragraph)
+    fragment = parse_xml(f'<a:txBody xmlns:a="{_A_NS}">{paragraphs_xml}</a:txBody>')
+    tx_body.extend(list(fragment))
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_slide_template(source=None):
+    """Get a cached SlideTemplate for a template path or template bytes"""
+    source = source or PPTX_TEMPLATE_PATH or None
+    if source is None:
+        key = None
+    elif isinstance(source, bytes):
+        key = hashlib.sha256(source).hexdigest()
+    else:
+        # A template edited on disk is picked up again
+        key = (str(source), os.path.getmtime(source))
+
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            template = _templates[key] = SlideTemplate(source)
+        return template
+
+def create_presentation(slides_data, params):
+    """Create PowerPoint file from parsed slide data"""
     
     try:
-        prs = Presentation()
-        
-        # Parse content and create slides
-        slides_data = _parse_powerpoint_content(content)
-        
         if not slides_data:
             # Create a fallback slide if parsing fails
             slides_data = [{
@@ -88,76 +343,19 @@ def _create_powerpoint_pptx(content, params):
                 'image': ''
             }]
         
-        for slide_data in slides_data:
-            # Use title and content layout
-            slide_layout = prs.slide_layouts[1]  # Title and Content layout
-            slide = prs.slides.add_slide(slide_layout)
-            
-            # Set title - check if title placeholder exists
-            if slide.shapes.title:
-                slide.shapes.title.text = slide_data.get('title', 'Slide Title')
-            
-            # Add content using a more robust approach
-            bullets = slide_data.get('bullets', [])
-            
-            # Find the content placeholder
-            content_shape = None
-            for shape in slide.shapes:
-                if hasattr(shape, 'placeholder_format') and shape.placeholder_format.idx == 1:
-                    content_shape = shape
-                    break
-            
-            # If we found the content placeholder, add text to it
-            if content_shape:
-                try:
-                    # Access text_frame safely with getattr
-                    tf = getattr(content_shape, 'text_frame', None)
-                    if tf:
-                        tf.clear()
-                        
-                        if bullets:
-                            # Set the first bullet point
-                            tf.text = bullets[0]
-                            
-                            # Add additional bullet points
-                            for bullet in bullets[1:]:
-                                p = tf.add_paragraph()
-                                p.text = bullet
-                                p.level = 0
-                        else:
-                            tf.text = "No content available"
-                    else:
-                        raise AttributeError("No text_frame available")
-                        
-                except (AttributeError, Exception):
-                    # If text_frame doesn't exist, add a text box instead
-                    _add_text_box_to_slide(slide, bullets)
-            else:
-                # No content placeholder found, add a text box
-                _add_text_box_to_slide(slide, bullets)
-            
-            # Add speaker notes if available
-            notes_text = slide_data.get('notes', '')
-            if notes_text:
-                try:
-                    notes_slide = slide.notes_slide
-                    if notes_slide and hasattr(notes_slide, 'notes_text_frame'):
-                        text_frame = notes_slide.notes_text_frame
-                        if text_frame:
-                            text_frame.text = notes_text
-                except Exception:
-                    pass  # Skip notes if there's an issue
-        
-        # Save to bytes
-        pptx_io = io.BytesIO()
-        prs.save(pptx_io)
-        pptx_io.seek(0)
-        
-        return pptx_io.getvalue()
+        return get_slide_template(params.get("pptx_template")).build(slides_data)
         
     except Exception as e:
         raise Exception(f"Failed to create PowerPoint file: {str(e)}")
 
+def _set_paragraph_text(paragraph, text):
+    """Write text into a slide paragraph, rendering **bold** markup as bold runs"""
+    for run_text, bold in parse_inline(text):
+        run = paragraph.add_run()
+        run.text = run_text
+        if bold:
+            run.font.bold = True
+
 def _add_text_box_to_slide(slide, bullets):
     """Add a text box with bullet points to a slide"""
     try:
@@ -170,84 +368,148 @@ def _add_text_box_to_slide(slide, bullets):
         text_frame = textbox.text_frame
         
         if bullets:
-            text_frame.text = bullets[0]
+            _set_paragraph_text(text_frame.paragraphs[0], bullets[0])
             for bullet in bullets[1:]:
                 p = text_frame.add_paragraph()
-                p.text = bullet
+                _set_paragraph_text(p, bullet)
                 p.level = 0
         else:
-            text_frame.text = "No content available"
+            text_frame.text = NO_CONTENT_TEXT
     except Exception:
         pass  # Skip if text box creation fails
 
-def _parse_powerpoint_content(content):
-    """Parse LLM response into slide data with improved parsing"""
-    
-    slides = []
-    current_slide = None
-    
-    lines = content.split('\n')
-    
-    for line in lines:
+class SlideStreamParser:
+    """
+    Incremental version of the slide parser.
+
+    Text can be fed in arbitrary chunks (e.g. LLM tokens); each slide is
+    returned as soon as the next SLIDE marker shows it is complete, and the
+    last one (or the fallback slide) when the stream is finished. On a
+    complete response the slides are the same as parsing it in one go.
+    """
+
+    def __init__(self):
+        self.slides = []
+        self._current_slide = None
+        self._partial_line = ""
+        # Kept only until the first marker, for the no-slides fallback
+        self._fallback_lines = []
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return the slides it completed"""
+        data = self._partial_line + chunk
+        lines = data.split('\n')
+        self._partial_line = lines.pop()
+        finished = []
+        for line in lines:
+            self._parse_line(line, finished)
+        return finished
+
+    def finish(self):
+        """Flush the stream and return the remaining slides"""
+        finished = []
+        self._parse_line(self._partial_line, finished)
+        self._partial_line = ""
+
+        # Don't forget the last slide
+        current_slide = self._current_slide
+        if current_slide and (current_slide.get('title') or current_slide.get('bullets')):
+            self._emit(current_slide, finished)
+        self._current_slide = None
+
+        # If no slides were parsed, create a fallback slide with the raw content
+        if not self.slides:
+            # Try to extract some meaningful content
+            content_lines = [line for line in self._fallback_lines if not line.startswith('#')]
+            bullets = content_lines[:10] if content_lines else ["Unable to parse content"]
+            
+            self._emit({
+                'title': 'Generated Content',
+                'bullets': bullets,
+                'notes': 'Content was parsed as fallback',
+                'image': ''
+            }, finished)
+        self._fallback_lines = []
+        return finished
+
+    def _emit(self, slide, finished):
+        self.slides.append(slide)
+        finished.append(slide)
+
+    def _parse_line(self, line, finished):
         line = line.strip()
+        if line and not self.slides and self._current_slide is None:
+            self._fallback_lines.append(line)
         
         # Look for slide markers with various formats
-        if re.match(r'^SLIDE\s*\d*:?', line, re.IGNORECASE) or line.upper().startswith('SLIDE'):
+        if line[:5].upper().startswith('SLIDE') or _SLIDE_MARKER.match(line):
             # Save previous slide if exists
+            current_slide = self._current_slide
             if current_slide and (current_slide.get('title') or current_slide.get('bullets')):
-                slides.append(current_slide)
+                self._emit(current_slide, finished)
+            self._fallback_lines = []
             
             # Extract title from slide line
-            title_match = re.search(r'SLIDE\s*\d*:?\s*(.+)', line, re.IGNORECASE)
-            title = title_match.group(1).strip() if title_match else f"Slide {len(slides) + 1}"
+            title_match = _SLIDE_TITLE.search(line)
+            title = title_match.group(1).strip() if title_match else f"Slide {len(self.slides) + 1}"
             
-            current_slide = {
+            self._current_slide = {
                 'title': title,
                 'bullets': [],
                 'notes': '',
                 'image': ''
             }
-            
-        elif line.startswith('- ') or line.startswith('• ') or line.startswith('* '):
+            return
+        
+        current_slide = self._current_slide
+        if line.startswith(('- ', '• ', '* ')):
             # Handle bullet points
             if current_slide is not None:
                 bullet_text = line[2:].strip()  # Remove bullet marker
                 if bullet_text:
                     current_slide['bullets'].append(bullet_text)
-                    
-        elif line.upper().startswith('NOTES:'):
+            return
+        
+        prefix = line[:6].upper()
+        if prefix.startswith('NOTES:'):
             # Handle speaker notes
             if current_slide is not None:
-                notes_text = line[6:].strip()  # Remove "NOTES:" prefix
-                current_slide['notes'] = notes_text
-                
-        elif line.upper().startswith('IMAGE:'):
+                current_slide['notes'] = line[6:].strip()  # Remove "NOTES:" prefix
+        elif prefix.startswith('IMAGE:'):
             # Handle image suggestions
             if current_slide is not None:
-                image_text = line[6:].strip()  # Remove "IMAGE:" prefix
-                current_slide['image'] = image_text
-                
+                current_slide['image'] = line[6:].strip()  # Remove "IMAGE:" prefix
         elif line and current_slide is not None and not current_slide.get('bullets'):
             # If we have text but no bullets yet, treat it as content
             # This handles cases where LLM doesn't use bullet format
-            if not any(line.upper().startswith(prefix) for prefix in ['SLIDE', 'NOTES:', 'IMAGE:']):
-                current_slide['bullets'].append(line)
+            current_slide['bullets'].append(line)
+
+def _parse_powerpoint_content(content):
+    """Parse LLM response into slide data with improved parsing"""
+    parser = SlideStreamParser()
+    parser.feed(content)
+    parser.finish()
+    return parser.slides
+
+def slides_from_blocks(blocks, title, max_bullets=8):
+    """Turn parsed Markdown into slide data: one slide per top-level section"""
     
-    # Don't forget the last slide
-    if current_slide and (current_slide.get('title') or current_slide.get('bullets')):
+    slides = []
+    current_slide = {'title': title, 'bullets': [], 'notes': '', 'image': ''}
+    
+    for block in blocks:
+        if block.kind == "heading" and block.level <= 2:
+            if current_slide['bullets']:
+                slides.append(current_slide)
+            current_slide = {'title': plain_text(block.runs), 'bullets': [], 'notes': '', 'image': ''}
+        elif block.kind in ("heading", "bullet", "number", "paragraph"):
+            # Long sections continue on another slide with the same title
+            if len(current_slide['bullets']) >= max_bullets:
+                slides.append(current_slide)
+                current_slide = {'title': current_slide['title'], 'bullets': [], 'notes': '', 'image': ''}
+            current_slide['bullets'].append(render_inline(block.runs))
+    
+    if current_slide['bullets']:
         slides.append(current_slide)
     
-    # If no slides were parsed, create a fallback slide with the raw content
-    if not slides:
-        # Try to extract some meaningful content
-        content_lines = [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
-        bullets = content_lines[:10] if content_lines else ["Unable to parse content"]
-        
-        slides.append({
-            'title': 'Generated Content',
-            'bullets': bullets,
-            'notes': 'Content was parsed as fallback',
-            'image': ''
-        })
-    
-    return slides
\ No newline at end of file
+    return slides
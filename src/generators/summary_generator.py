@@ -1,6 +1,6 @@
 from llm_handlers.api_handler import get_llm_response
-from docx import Document
-import io
+from generators.docx_builder import new_document, add_blocks_to_docx, docx_bytes
+from utils.markdown_parser import parse_markdown
 
 def generate_summary(params):
     """Generate summary document"""
@@ -9,14 +9,16 @@ def generate_summary(params):
     
     try:
         # Get content from LLM
-        content = get_llm_response(prompt, params["llm_config"])
+        content = get_llm_response(prompt, params["llm_config"], on_token=params.get("on_token"))
         
         # Create Word document
-        docx_file = _create_summary_docx(content, params)
+        blocks = parse_markdown(content)
+        docx_file = _create_summary_docx(blocks, params)
         
         return {
             "success": True,
             "content": content,
+            "blocks": blocks,
             "docx_file": docx_file
         }
         
@@ -50,76 +52,15 @@ def _build_summary_prompt(params):
     
     return prompt
 
-def _create_summary_docx(content, params):
-    """Create Word document from summary content"""
+def _create_summary_docx(blocks, params):
+    """Create Word document from parsed summary content"""
     
-    doc = Document()
+    # Every format style (bullets, outline, Q&A, paragraphs) is Markdown
+    doc = new_document(f"{params['subject']} - Summary", [
+        (f"Topic: {params['topic']}", 2),
+        (f"Grade Level: {params['grade_level']}", 3)
+    ])
     
-    # Title
-    title = doc.add_heading(f"{params['subject']} - Summary", 0)
-    title.alignment = 1  # Center alignment
+    add_blocks_to_docx(doc, blocks)
     
-    # Subtitle
-    doc.add_heading(f"Topic: {params['topic']}", level=2)
-    doc.add_heading(f"Grade Level: {params['grade_level']}", level=3)
-    
-    # Add content based on format style
-    if params['format_style'] == "Bullet Points":
-        _add_bullet_content(doc, content)
-    elif params['format_style'] == "Outline":
-        _add_outline_content(doc, content)
-    elif params['format_style'] == "Q&A Format":
-        _add_qa_content(doc, content)
-    else:  # Paragraphs
-        _add_paragraph_content(doc, content)
-    
-    # Save to bytes
-    doc_io = io.BytesIO()
-    doc.save(doc_io)
-    doc_io.seek(0)
-    
-    return doc_io.getvalue()
-
-def _add_bullet_content(doc, content):
-    """Add content in bullet point format"""
-    _add_formatted_content_to_docx(doc, content)
-
-def _add_outline_content(doc, content):
-    """Add content in outline format"""
-    _add_formatted_content_to_docx(doc, content)
-
-def _add_qa_content(doc, content):
-    """Add content in Q&A format"""
-    _add_formatted_content_to_docx(doc, content)
-
-def _add_paragraph_content(doc, content):
-    """Add content in paragraph format"""
-    _add_formatted_content_to_docx(doc, content)
-
-def _add_formatted_content_to_docx(doc, content):
-    """Add formatted content to Word document, parsing Markdown formatting"""
-    lines = content.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            doc.add_paragraph("")
-            continue
-            
-        # Check if it's a heading (starts with #)
-        if line.startswith('# '):
-            doc.add_heading(line[2:], level=1)
-        elif line.startswith('## '):
-            doc.add_heading(line[3:], level=2)
-        elif line.startswith('### '):
-            doc.add_heading(line[4:], level=3)
-        elif line.startswith('#### '):
-            doc.add_heading(line[5:], level=4)
-        # Check if it's a bullet point
-        elif line.startswith('- ') or line.startswith('* ') or line.startswith('• '):
-            doc.add_paragraph(line[2:], style='List Bullet')
-        # Check if it's a numbered list
-        elif line[0].isdigit() and line[1:3] in ['. ', ') ']:
-            doc.add_paragraph(line[3:], style='List Number')
-        else:
-            doc.add_paragraph(line)
\ No newline at end of file
+    return docx_bytes(doc)
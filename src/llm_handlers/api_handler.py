@@ -1,42 +1,98 @@
-import os
 import requests
 import json
 import time
-import re
+import threading
+
+from llm_handlers import ollama_catalog, rate_governor, transport
+from llm_handlers.google_clients import get_google_client
+from llm_handlers.model_registry import get_model_registry
+from llm_handlers.resilience import (
+    DeadlineExceeded,
+    ProviderError,
+    call_with_resilience,
+    error_from_response,
+    is_retryable_status,
+    request_timeout,
+)
+from llm_handlers.response_cache import get_response_cache, make_cache_key
+from llm_handlers.single_flight import credential_fingerprint, get_single_flight
+from llm_handlers.think_filter import clean_thinking_tags, filter_think_stream
+from llm_handlers.token_accounting import compact_prompt, record_usage
 
 def _clean_thinking_tags(text):
     """Remove <think> and </think> tags and content between them from text"""
     if not text:
         return text
     
-    # Remove thinking tags and their content (case-insensitive, multiline)
-    pattern = r'<think>.*?</think>'
-    cleaned_text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
+    return clean_thinking_tags(text)
+
+def get_llm_response(prompt, llm_config, on_token=None):
+    """Get response from configured LLM
     
-    # Also handle self-closing think tags
-    pattern_self_closing = r'<think\s*/>'
-    cleaned_text = re.sub(pattern_self_closing, '', cleaned_text, flags=re.IGNORECASE)
+    When ``on_token`` is given the response is streamed and every chunk is
+    passed to it as it arrives; the complete text is still returned.
+    Responses are served from the persistent cache unless
+    ``llm_config["bypass_cache"]`` is set (e.g. when regenerating).
+    Provider calls are retried and guarded by a circuit breaker, within
+    ``llm_config["deadline"]`` when one is set, and every attempt waits
+    for its turn under the provider's rate governor. A request identical
+    to one already in flight shares that call's result (and stream).
+    """
     
-    # Clean up extra whitespace that might be left behind
-    # Replace multiple consecutive newlines with just two newlines
-    cleaned_text = re.sub(r'\n\s*\n\s*\n+', '\n\n', cleaned_text)
+    prompt = compact_prompt(prompt)
+    cache = get_response_cache()
+    cache_key = make_cache_key(prompt, llm_config)
     
-    # Remove leading/trailing whitespace from each line while preserving structure
-    lines = cleaned_text.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        cleaned_lines.append(line.rstrip())
+    if not llm_config.get("bypass_cache"):
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached)
+            return cached
     
-    cleaned_text = '\n'.join(cleaned_lines)
-    cleaned_text = cleaned_text.strip()
+    def _call_provider(on_chunk):
+        text = call_with_resilience(
+            lambda: _governed_response(prompt, llm_config, on_chunk),
+            llm_config
+        )
+        record_usage(llm_config, prompt, text)
+        cache.put(cache_key, text)
+        return text
     
-    return cleaned_text
+    # Identical requests already running (with the same credentials) are joined instead of repeated
+    flight_key = f"{cache_key}:{credential_fingerprint(llm_config)}"
+    return get_single_flight().run(flight_key, _call_provider, on_token, llm_config.get("deadline"))
 
-def get_llm_response(prompt, llm_config):
-    """Get response from configured LLM"""
+def _governed_response(prompt, llm_config, on_token=None):
+    """Call the provider once the rate governor admits the call"""
+    ticket = rate_governor.admit(prompt, llm_config)
+    text = None
+    try:
+        text = _generate_response(prompt, llm_config, on_token)
+        return text
+    finally:
+        rate_governor.release(ticket, text)
+
+def _generate_response(prompt, llm_config, on_token=None):
+    """Call the configured provider, streaming when on_token is given"""
     
     provider = llm_config["provider"]
     
+    if on_token is not None:
+        chunks = []
+        try:
+            for chunk in get_llm_response_stream(prompt, llm_config):
+                chunks.append(chunk)
+                on_token(chunk)
+                if llm_config.get("deadline") and time.monotonic() > llm_config["deadline"]:
+                    raise DeadlineExceeded()
+        except ProviderError as e:
+            # Once text reached the caller a retry would duplicate it
+            if chunks:
+                e.partial = True
+            raise
+        return "".join(chunks)
+    
     if provider == "openai":
         return _get_openai_response(prompt, llm_config)
     elif provider == "ollama":
@@ -48,8 +104,46 @@ def get_llm_response(prompt, llm_config):
     else:
         raise ValueError(f"Unsupported provider: {provider}")
 
-def _get_openai_response(prompt, config):
-    """Get response from OpenAI API"""
+def get_llm_response_stream(prompt, llm_config):
+    """Stream the response from configured LLM as text chunks"""
+    
+    provider = llm_config["provider"]
+    
+    if provider == "openai":
+        yield from _stream_openai_response(prompt, llm_config)
+    elif provider == "ollama":
+        # Reasoning models wrap their thoughts in <think> tags
+        yield from filter_think_stream(_stream_ollama_response(prompt, llm_config))
+    elif provider == "huggingface":
+        if llm_config["use_local"]:
+            yield from _stream_huggingface_local_response(prompt, llm_config)
+        else:
+            yield from _stream_huggingface_api_response(prompt, llm_config)
+    elif provider == "google":
+        yield from _stream_google_response(prompt, llm_config)
+    else:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+def _iter_sse_data(response):
+    """Yield the data payloads of a server-sent events response"""
+    response.encoding = response.encoding or "utf-8"
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if line and line.startswith("data:"):
+            yield line[5:].strip()
+
+def _openai_error_message(response):
+    """Build an error message from a failed OpenAI response"""
+    error_msg = f"OpenAI API error: {response.status_code}"
+    try:
+        error_detail = response.json().get("error", {}).get("message", "")
+        if error_detail:
+            error_msg += f" - {error_detail}"
+    except:
+        pass
+    return error_msg
+
+def _build_openai_request(prompt, config, stream=False):
+    """Build URL, headers and payload for an OpenAI chat completion"""
     
     if not config.get("api_key"):
         raise ValueError("OpenAI API key is required")
@@ -63,71 +157,139 @@ def _get_openai_response(prompt, config):
         "model": config["model"],
         "messages": [{"role": "user", "content": prompt}],
     }
+    if config.get("max_output_tokens"):
+        data["max_completion_tokens"] = config["max_output_tokens"]
+    if stream:
+        data["stream"] = True
+    
+    return "https://api.openai.com/v1/chat/completions", headers, data
+
+def _parse_openai_stream_event(payload):
+    """Return the text delta of an OpenAI stream event, or None"""
+    choices = json.loads(payload).get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content")
+
+def _get_openai_response(prompt, config):
+    """Get response from OpenAI API"""
+    
+    url, headers, data = _build_openai_request(prompt, config)
     
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
+        response = transport.post(
+            url,
             headers=headers,
             json=data,
-            timeout=60
+            timeout=request_timeout(config, 60)
         )
         
         if response.status_code != 200:
-            error_msg = f"OpenAI API error: {response.status_code}"
-            try:
-                error_detail = response.json().get("error", {}).get("message", "")
-                if error_detail:
-                    error_msg += f" - {error_detail}"
-            except:
-                pass
-            raise Exception(error_msg)
+            raise error_from_response(_openai_error_message(response), response)
         
         result = response.json()
         return result["choices"][0]["message"]["content"]
         
     except requests.exceptions.Timeout:
-        raise Exception("OpenAI API timeout. Please try again.")
+        raise ProviderError("OpenAI API timeout. Please try again.", retryable=True)
     except requests.exceptions.ConnectionError:
-        raise Exception("Cannot connect to OpenAI API. Check your internet connection.")
+        raise ProviderError("Cannot connect to OpenAI API. Check your internet connection.", retryable=True)
+    except ProviderError:
+        raise
     except Exception as e:
         if "API error" in str(e):
             raise e
         else:
             raise Exception(f"OpenAI API error: {str(e)}")
 
-def _get_ollama_response(prompt, config):
-    """Get response from Ollama local instance"""
+def _stream_openai_response(prompt, config):
+    """Stream response from OpenAI API"""
     
-    # Check if connection was verified during configuration
-    if not config.get("connected", False):
-        raise Exception("Ollama is not running or not accessible. Please start Ollama and try again.")
+    url, headers, data = _build_openai_request(prompt, config, stream=True)
     
+    try:
+        with transport.post(
+            url,
+            headers=headers,
+            json=data,
+            timeout=request_timeout(config, 60),
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise error_from_response(_openai_error_message(response), response)
+            
+            for payload in _iter_sse_data(response):
+                if payload == "[DONE]":
+                    break
+                delta = _parse_openai_stream_event(payload)
+                if delta:
+                    yield delta
+                    
+    except requests.exceptions.Timeout:
+        raise ProviderError("OpenAI API timeout. Please try again.", retryable=True)
+    except requests.exceptions.ConnectionError:
+        raise ProviderError("Cannot connect to OpenAI API. Check your internet connection.", retryable=True)
+    except requests.exceptions.ChunkedEncodingError:
+        # The connection broke off in the middle of the stream
+        raise ProviderError("OpenAI API stream was interrupted. Please try again.", retryable=True)
+    except ProviderError:
+        raise
+    except Exception as e:
+        if "API error" in str(e):
+            raise e
+        else:
+            raise Exception(f"OpenAI API error: {str(e)}")
+
+def _build_ollama_payload(prompt, config, stream=False):
+    """Build the payload for an Ollama /api/generate request"""
     data = {
         "model": config["model"],
         "prompt": prompt,
-        "stream": False,
+        "stream": stream,
         "options": {
             "temperature": config["temperature"]
         }
     }
+    if config.get("max_output_tokens"):
+        data["options"]["num_predict"] = config["max_output_tokens"]
+    return data
+
+def _parse_ollama_stream_line(line):
+    """Return (text, done) for one line of an Ollama stream"""
+    part = json.loads(line)
+    if part.get("error"):
+        raise Exception(f"Ollama API error: {part['error']}")
+    return part.get("response", ""), part.get("done", False)
+
+def _is_ollama_model_missing(response):
+    """Tell whether an Ollama error response means the model is not pulled"""
+    return response.status_code == 404 and "not found" in response.text
+
+def _ollama_model_not_found_error(config):
+    """Refresh the model catalog and build the "model not found" error"""
+    ollama_catalog.invalidate(config["host"])
+    available_models = ollama_catalog.get_models(config["host"])
+    return Exception(f"Model '{config['model']}' not found. Available models: {', '.join(available_models)}")
+
+def _get_ollama_response(prompt, config):
+    """Get response from Ollama local instance"""
+    
+    # Check if connection was verified during configuration
+    if not config.get("connected", False):
+        raise Exception("Ollama is not running or not accessible. Please start Ollama and try again.")
+    
+    data = _build_ollama_payload(prompt, config, stream=False)
     
     try:
-        # First, check if the model exists
-        models_response = requests.get(f"{config['host']}/api/tags", timeout=5)
-        if models_response.status_code == 200:
-            available_models = [m["name"] for m in models_response.json().get("models", [])]
-            if config["model"] not in available_models:
-                raise Exception(f"Model '{config['model']}' not found. Available models: {', '.join(available_models)}")
-        
         # Generate response with longer timeout for generation
-        response = requests.post(
+        response = transport.post(
             f"{config['host']}/api/generate",
             json=data,
-            timeout=300  # 5 minutes timeout for generation
+            timeout=request_timeout(config, 300)  # 5 minutes timeout for generation
         )
         
+        if _is_ollama_model_missing(response):
+            raise _ollama_model_not_found_error(config)
         if response.status_code != 200:
-            raise Exception(f"Ollama API error: {response.status_code} - {response.text}")
+            raise error_from_response(f"Ollama API error: {response.status_code} - {response.text}", response)
         
         result = response.json()
         raw_response = result.get("response", "No response generated")
@@ -138,9 +300,56 @@ def _get_ollama_response(prompt, config):
         return cleaned_response
         
     except requests.exceptions.Timeout:
-        raise Exception("Ollama generation timeout. The model might be too slow or the prompt too complex. Try a simpler prompt or a faster model.")
+        raise ProviderError("Ollama generation timeout. The model might be too slow or the prompt too complex. Try a simpler prompt or a faster model.", retryable=True)
+    except requests.exceptions.ConnectionError:
+        raise ProviderError("Cannot connect to Ollama. Make sure Ollama is running with 'ollama serve'.", retryable=True)
+    except ProviderError:
+        raise
+    except Exception as e:
+        if "API error" in str(e) or "not found" in str(e) or "timeout" in str(e):
+            raise e
+        else:
+            raise Exception(f"Ollama error: {str(e)}")
+
+def _stream_ollama_response(prompt, config):
+    """Stream response from Ollama local instance"""
+    
+    if not config.get("connected", False):
+        raise Exception("Ollama is not running or not accessible. Please start Ollama and try again.")
+    
+    data = _build_ollama_payload(prompt, config, stream=True)
+    
+    try:
+        with transport.post(
+            f"{config['host']}/api/generate",
+            json=data,
+            timeout=request_timeout(config, 300),
+            stream=True
+        ) as response:
+            if _is_ollama_model_missing(response):
+                raise _ollama_model_not_found_error(config)
+            if response.status_code != 200:
+                raise error_from_response(f"Ollama API error: {response.status_code} - {response.text}", response)
+            
+            # Ollama streams one JSON object per line
+            for line in response.iter_lines(chunk_size=None):
+                if not line:
+                    continue
+                text, done = _parse_ollama_stream_line(line)
+                if text:
+                    yield text
+                if done:
+                    break
+                    
+    except requests.exceptions.Timeout:
+        raise ProviderError("Ollama generation timeout. The model might be too slow or the prompt too complex. Try a simpler prompt or a faster model.", retryable=True)
     except requests.exceptions.ConnectionError:
-        raise Exception("Cannot connect to Ollama. Make sure Ollama is running with 'ollama serve'.")
+        raise ProviderError("Cannot connect to Ollama. Make sure Ollama is running with 'ollama serve'.", retryable=True)
+    except requests.exceptions.ChunkedEncodingError:
+        # The connection broke off in the middle of the stream
+        raise ProviderError("Ollama stream was interrupted. Please try again.", retryable=True)
+    except ProviderError:
+        raise
     except Exception as e:
         if "API error" in str(e) or "not found" in str(e) or "timeout" in str(e):
             raise e
@@ -155,8 +364,8 @@ def _get_huggingface_response(prompt, config):
     else:
         return _get_huggingface_api_response(prompt, config)
 
-def _get_huggingface_api_response(prompt, config):
-    """Get response from Hugging Face API"""
+def _build_huggingface_request(prompt, config, stream=False):
+    """Build URL, headers and payload for the Hugging Face Inference API"""
     
     headers = {"Content-Type": "application/json"}
     if config.get("api_key"):
@@ -166,69 +375,195 @@ def _get_huggingface_api_response(prompt, config):
         "inputs": prompt,
         "parameters": {
             "temperature": config["temperature"],
-            "max_new_tokens": 2000,
+            "max_new_tokens": config.get("max_output_tokens") or 2000,
             "return_full_text": False
         }
     }
+    if stream:
+        data["stream"] = True
+    
+    return f"https://api-inference.huggingface.co/models/{config['model']}", headers, data
+
+def _parse_huggingface_stream_event(payload):
+    """Return the text of a Hugging Face (TGI) stream event, or None"""
+    event = json.loads(payload)
+    if event.get("error"):
+        raise Exception(f"Hugging Face API error: {event['error']}")
+    token = event.get("token") or {}
+    if token.get("special"):
+        return None
+    return token.get("text")
+
+def _get_huggingface_api_response(prompt, config):
+    """Get response from Hugging Face API"""
+    
+    url, headers, data = _build_huggingface_request(prompt, config)
     
     try:
-        response = requests.post(
-            f"https://api-inference.huggingface.co/models/{config['model']}",
+        response = transport.post(
+            url,
             headers=headers,
             json=data,
-            timeout=60
+            timeout=request_timeout(config, 60)
         )
         
         if response.status_code == 503:
             # Model is loading
-            raise Exception("Model is loading on Hugging Face. Please wait a moment and try again.")
+            raise error_from_response("Model is loading on Hugging Face. Please wait a moment and try again.", response)
         elif response.status_code != 200:
-            raise Exception(f"Hugging Face API error: {response.status_code} - {response.text}")
-        
-        result = response.json()
+            raise error_from_response(f"Hugging Face API error: {response.status_code} - {response.text}", response)
         
-        if isinstance(result, list) and len(result) > 0:
-            if isinstance(result[0], dict):
-                return result[0].get("generated_text", str(result[0]))
-            else:
-                return str(result[0])
-        elif isinstance(result, dict):
-            return result.get("generated_text", str(result))
+        return _parse_huggingface_result(response.json())
+            
+    except requests.exceptions.Timeout:
+        raise ProviderError("Hugging Face API timeout. Please try again.", retryable=True)
+    except requests.exceptions.ConnectionError:
+        raise ProviderError("Cannot connect to Hugging Face API. Check your internet connection.", retryable=True)
+    except ProviderError:
+        raise
+    except Exception as e:
+        if "API error" in str(e) or "loading" in str(e):
+            raise e
+        else:
+            raise Exception(f"Hugging Face error: {str(e)}")
+
+def _parse_huggingface_result(result):
+    """Extract the generated text from a Hugging Face API result"""
+    if isinstance(result, list) and len(result) > 0:
+        if isinstance(result[0], dict):
+            return result[0].get("generated_text", str(result[0]))
         else:
-            return str(result)
+            return str(result[0])
+    elif isinstance(result, dict):
+        return result.get("generated_text", str(result))
+    else:
+        return str(result)
+
+def _stream_huggingface_api_response(prompt, config):
+    """Stream response from Hugging Face API"""
+    
+    url, headers, data = _build_huggingface_request(prompt, config, stream=True)
+    
+    try:
+        with transport.post(
+            url,
+            headers=headers,
+            json=data,
+            timeout=request_timeout(config, 60),
+            stream=True
+        ) as response:
+            if response.status_code == 503:
+                raise error_from_response("Model is loading on Hugging Face. Please wait a moment and try again.", response)
+            elif response.status_code != 200:
+                raise error_from_response(f"Hugging Face API error: {response.status_code} - {response.text}", response)
+            
+            # Models that cannot stream answer with a single JSON document
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                yield _parse_huggingface_result(response.json())
+                return
             
+            for payload in _iter_sse_data(response):
+                text = _parse_huggingface_stream_event(payload)
+                if text:
+                    yield text
+                    
     except requests.exceptions.Timeout:
-        raise Exception("Hugging Face API timeout. Please try again.")
+        raise ProviderError("Hugging Face API timeout. Please try again.", retryable=True)
     except requests.exceptions.ConnectionError:
-        raise Exception("Cannot connect to Hugging Face API. Check your internet connection.")
+        raise ProviderError("Cannot connect to Hugging Face API. Check your internet connection.", retryable=True)
+    except requests.exceptions.ChunkedEncodingError:
+        # The connection broke off in the middle of the stream
+        raise ProviderError("Hugging Face API stream was interrupted. Please try again.", retryable=True)
+    except ProviderError:
+        raise
     except Exception as e:
         if "API error" in str(e) or "loading" in str(e):
             raise e
         else:
             raise Exception(f"Hugging Face error: {str(e)}")
 
+def _local_length_kwargs(config):
+    """Generation length for local models: the document cap when known"""
+    if config.get("max_output_tokens"):
+        return {"max_new_tokens": config["max_output_tokens"]}
+    return {"max_length": 2000}
+
 def _get_huggingface_local_response(prompt, config):
     """Get response from local Hugging Face model"""
     
     try:
-        from transformers import pipeline
-        
-        # This is a simplified implementation
-        # In production, you'd want to cache the model loading
-        generator = pipeline(
-            "text-generation",
-            model=config["model"],
-            temperature=config["temperature"]
-        )
+        import transformers  # noqa: F401 - fail early with a helpful message
         
-        result = generator(prompt, max_length=2000, num_return_sequences=1)
+        # Loaded once per process and shared by every session
+        generator = get_model_registry().get_pipeline(config["model"])
+        
+        result = generator(
+            prompt,
+            num_return_sequences=1,
+            temperature=config["temperature"],
+            # Like the streaming path (skip_prompt), return only the completion
+            return_full_text=False,
+            **_local_length_kwargs(config)
+        )
         return result[0]["generated_text"]
         
     except ImportError:
         raise Exception("transformers library not installed for local Hugging Face models. Install with: pip install transformers torch")
     except Exception as e:
         raise Exception(f"Local Hugging Face model error: {str(e)}")
+
+def _stream_huggingface_local_response(prompt, config):
+    """Stream response from local Hugging Face model"""
+    
+    try:
+        from transformers import TextIteratorStreamer
+    except ImportError:
+        raise Exception("transformers library not installed for local Hugging Face models. Install with: pip install transformers torch")
+    
+    try:
+        generator = get_model_registry().get_pipeline(config["model"])
+        streamer = TextIteratorStreamer(generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+        
+        def _generate():
+            try:
+                generator(
+                    prompt,
+                    num_return_sequences=1,
+                    temperature=config["temperature"],
+                    streamer=streamer,
+                    **_local_length_kwargs(config)
+                )
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+        
+        worker = threading.Thread(target=_generate, daemon=True)
+        worker.start()
+        for text in streamer:
+            if text:
+                yield text
+        worker.join()
+        if errors:
+            raise errors[0]
+        
+    except Exception as e:
+        raise Exception(f"Local Hugging Face model error: {str(e)}")
     
+def _google_error(error):
+    """Wrap a google.genai exception so transient failures can be retried"""
+    status_code = getattr(error, "code", None)
+    if not isinstance(status_code, int):
+        status_code = None
+    retryable = is_retryable_status(status_code) or isinstance(error, (TimeoutError, ConnectionError))
+    return ProviderError(f"Google GenAI API error: {str(error)}", status_code=status_code, retryable=retryable)
+
+def _google_generation_config(config):
+    """Generation config for google.genai (None keeps the model defaults)"""
+    if config.get("max_output_tokens"):
+        return {"max_output_tokens": config["max_output_tokens"]}
+    return None
+
 def _get_google_response(prompt, config):
     """Get response from Google GenAI API"""
     
@@ -236,11 +571,23 @@ def _get_google_response(prompt, config):
         raise ValueError("Google API key is required")
 
     try:
-        import google.genai as genai
-        os.environ["GOOGLE_API_KEY"] = config["api_key"]
-        client=genai.Client()
-        response = client.models.generate_content(model=config["model"], contents=prompt)
+        client = get_google_client(config["api_key"])
+        response = client.models.generate_content(model=config["model"], contents=prompt, config=_google_generation_config(config))
         
         return response.text
     except Exception as e:
-        raise Exception(f"Google GenAI API error: {str(e)}")
+        raise _google_error(e)
+
+def _stream_google_response(prompt, config):
+    """Stream response from Google GenAI API"""
+    
+    if not config.get("api_key"):
+        raise ValueError("Google API key is required")
+
+    try:
+        client = get_google_client(config["api_key"])
+        for chunk in client.models.generate_content_stream(model=config["model"], contents=prompt, config=_google_generation_config(config)):
+            if chunk.text:
+                yield chunk.text
+    except Exception as e:
+        raise _google_error(e)
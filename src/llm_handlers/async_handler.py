@@ -0,0 +1,508 @@
+"""
+Asyncio-native LLM client layer built on httpx.
+Mirrors get_llm_response / get_llm_response_stream so many generations
+(several documents, or several sections of one document) can run
+concurrently on one event loop instead of blocking one thread each.
+Calls take the same path as the blocking handler: prompt compaction, the
+response cache, single-flight coalescing, the rate governor, retries and
+the circuit breaker, and usage recording. Only the blocking steps around
+the provider call (cache and governor waits) run in worker threads.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import weakref
+
+import httpx
+
+from llm_handlers import rate_governor, transport
+from llm_handlers.google_clients import get_google_client
+from llm_handlers.api_handler import (
+    _build_huggingface_request,
+    _build_ollama_payload,
+    _build_openai_request,
+    _clean_thinking_tags,
+    _get_huggingface_local_response,
+    _google_error,
+    _google_generation_config,
+    _is_ollama_model_missing,
+    _ollama_model_not_found_error,
+    _openai_error_message,
+    _parse_huggingface_result,
+    _parse_huggingface_stream_event,
+    _parse_ollama_stream_line,
+    _parse_openai_stream_event,
+    _stream_huggingface_local_response,
+)
+from llm_handlers.resilience import (
+    DeadlineExceeded,
+    ProviderError,
+    call_with_resilience_async,
+    error_from_response,
+    request_timeout,
+)
+from llm_handlers.response_cache import get_response_cache, make_cache_key
+from llm_handlers.single_flight import credential_fingerprint, get_single_flight
+from llm_handlers.think_filter import ThinkTagFilter
+from llm_handlers.token_accounting import compact_prompt, record_usage
+
+# Upper bound on simultaneous connections per event loop
+ASYNC_MAX_CONNECTIONS = int(os.getenv("EDUADOCS_ASYNC_MAX_CONNECTIONS", "100"))
+
+# Default number of prompts gather_llm_responses runs at once
+ASYNC_MAX_CONCURRENCY = int(os.getenv("EDUADOCS_ASYNC_MAX_CONCURRENCY", "8"))
+
+# Threads for the blocking steps of async calls (cache, governor waits, local models)
+ASYNC_BLOCKING_THREADS = int(os.getenv("EDUADOCS_ASYNC_BLOCKING_THREADS", "32"))
+
+# httpx clients are bound to the loop they were created on
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Get the shared AsyncClient for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=transport.POOL_MAXSIZE
+            )
+        )
+        _clients[loop] = client
+    return client
+
+
+async def aclose_clients():
+    """Close the shared client of the running event loop"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def get_llm_response_async(prompt, llm_config, on_token=None):
+    """Get response from configured LLM without blocking the event loop
+
+    Behaves like api_handler.get_llm_response: ``on_token`` receives the
+    streamed chunks, responses are cached, identical calls in flight are
+    shared (with blocking callers too), and provider calls are governed,
+    retried and guarded by the circuit breaker within the deadline.
+    """
+
+    prompt = compact_prompt(prompt)
+    cache = get_response_cache()
+    cache_key = make_cache_key(prompt, llm_config)
+
+    if not llm_config.get("bypass_cache"):
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached)
+            return cached
+
+    async def _call_provider(on_chunk):
+        text = await call_with_resilience_async(
+            lambda: _governed_response_async(prompt, llm_config, on_chunk),
+            llm_config
+        )
+        record_usage(llm_config, prompt, text)
+        await asyncio.to_thread(cache.put, cache_key, text)
+        return text
+
+    flight_key = f"{cache_key}:{credential_fingerprint(llm_config)}"
+    return await get_single_flight().run_async(flight_key, _call_provider, on_token, llm_config.get("deadline"))
+
+
+async def _admit_async(prompt, llm_config):
+    """Wait for the rate governor (shared with the blocking handler) off the loop"""
+    admission = asyncio.ensure_future(asyncio.to_thread(rate_governor.admit, prompt, llm_config))
+    try:
+        return await asyncio.shield(admission)
+    except asyncio.CancelledError:
+        # The wait goes on in its thread; give the slot back if it gets one
+        admission.add_done_callback(
+            lambda done: done.cancelled() or done.exception() or rate_governor.release(done.result())
+        )
+        raise
+
+
+async def _governed_response_async(prompt, llm_config, on_token=None):
+    """Call the provider once the rate governor admits the call"""
+    ticket = await _admit_async(prompt, llm_config)
+    text = None
+    try:
+        text = await _generate_response_async(prompt, llm_config, on_token)
+        return text
+    finally:
+        rate_governor.release(ticket, text)
+
+
+async def _generate_response_async(prompt, llm_config, on_token=None):
+    """Call the configured provider, streaming when on_token is given"""
+
+    provider = llm_config["provider"]
+
+    if on_token is not None:
+        chunks = []
+        try:
+            async for chunk in get_llm_response_stream_async(prompt, llm_config):
+                chunks.append(chunk)
+                on_token(chunk)
+                if llm_config.get("deadline") and time.monotonic() > llm_config["deadline"]:
+                    raise DeadlineExceeded()
+        except ProviderError as e:
+            # Once text reached the caller a retry would duplicate it
+            if chunks:
+                e.partial = True
+            raise
+        return "".join(chunks)
+
+    if provider == "openai":
+        return await _get_openai_response_async(prompt, llm_config)
+    elif provider == "ollama":
+        return await _get_ollama_response_async(prompt, llm_config)
+    elif provider == "huggingface":
+        if llm_config["use_local"]:
+            # Local inference is CPU/GPU bound; keep it off the event loop
+            return await asyncio.to_thread(_get_huggingface_local_response, prompt, llm_config)
+        return await _get_huggingface_api_response_async(prompt, llm_config)
+    elif provider == "google":
+        return await _get_google_response_async(prompt, llm_config)
+    else:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+
+async def get_llm_response_stream_async(prompt, llm_config):
+    """Stream the response from configured LLM as text chunks"""
+
+    provider = llm_config["provider"]
+
+    if provider == "openai":
+        stream = _stream_openai_response_async(prompt, llm_config)
+    elif provider == "ollama":
+        # Reasoning models wrap their thoughts in <think> tags
+        stream = _filter_think_stream_async(_stream_ollama_response_async(prompt, llm_config))
+    elif provider == "huggingface":
+        if llm_config["use_local"]:
+            stream = _iterate_in_thread(_stream_huggingface_local_response(prompt, llm_config))
+        else:
+            stream = _stream_huggingface_api_response_async(prompt, llm_config)
+    elif provider == "google":
+        stream = _stream_google_response_async(prompt, llm_config)
+    else:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+    async for chunk in stream:
+        yield chunk
+
+
+async def gather_llm_responses(prompts, llm_config, max_concurrency=ASYNC_MAX_CONCURRENCY):
+    """Run several prompts concurrently and return their responses in order"""
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _run(prompt):
+        async with semaphore:
+            return await get_llm_response_async(prompt, llm_config)
+
+    return await asyncio.gather(*(_run(prompt) for prompt in prompts))
+
+
+# Event loop shared by blocking callers (see run_on_loop)
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Get or start the process-wide event loop that async calls fan out on."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(ThreadPoolExecutor(
+                    max_workers=ASYNC_BLOCKING_THREADS, thread_name_prefix="llm-async-blocking"
+                ))
+                threading.Thread(target=loop.run_forever, name="llm-async", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_on_loop(coroutine):
+    """Schedule a coroutine on the shared event loop; returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop())
+
+
+async def _iterate_in_thread(iterator):
+    """Consume a blocking iterator from a worker thread"""
+    sentinel = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, sentinel)
+        if item is sentinel:
+            break
+        yield item
+
+
+async def _filter_think_stream_async(chunks):
+    """Async counterpart of think_filter.filter_think_stream"""
+    think_filter = ThinkTagFilter()
+    async for chunk in chunks:
+        text = think_filter.feed(chunk)
+        if text:
+            yield text
+    text = think_filter.flush()
+    if text:
+        yield text
+
+
+async def _aiter_sse_data(response):
+    """Yield the data payloads of a server-sent events response"""
+    async for line in response.aiter_lines():
+        if line and line.startswith("data:"):
+            yield line[5:].strip()
+
+
+async def _get_openai_response_async(prompt, config):
+    """Get response from OpenAI API"""
+
+    url, headers, data = _build_openai_request(prompt, config)
+
+    try:
+        response = await get_async_client().post(url, headers=headers, json=data, timeout=request_timeout(config, 60))
+
+        if response.status_code != 200:
+            raise error_from_response(_openai_error_message(response), response)
+
+        result = response.json()
+        return result["choices"][0]["message"]["content"]
+
+    except httpx.TimeoutException:
+        raise ProviderError("OpenAI API timeout. Please try again.", retryable=True)
+    except httpx.TransportError:
+        raise ProviderError("Cannot connect to OpenAI API. Check your internet connection.", retryable=True)
+    except ProviderError:
+        raise
+    except Exception as e:
+        if "API error" in str(e):
+            raise e
+        else:
+            raise Exception(f"OpenAI API error: {str(e)}")
+
+
+async def _stream_openai_response_async(prompt, config):
+    """Stream response from OpenAI API"""
+
+    url, headers, data = _build_openai_request(prompt, config, stream=True)
+
+    try:
+        async with get_async_client().stream(
+            "POST", url, headers=headers, json=data, timeout=request_timeout(config, 60)
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise error_from_response(_openai_error_message(response), response)
+
+            async for payload in _aiter_sse_data(response):
+                if payload == "[DONE]":
+                    break
+                delta = _parse_openai_stream_event(payload)
+                if delta:
+                    yield delta
+
+    except httpx.TimeoutException:
+        raise ProviderError("OpenAI API timeout. Please try again.", retryable=True)
+    except httpx.ConnectError:
+        raise ProviderError("Cannot connect to OpenAI API. Check your internet connection.", retryable=True)
+    except httpx.TransportError:
+        # The connection broke off in the middle of the stream
+        raise ProviderError("OpenAI API stream was interrupted. Please try again.", retryable=True)
+    except ProviderError:
+        raise
+    except Exception as e:
+        if "API error" in str(e):
+            raise e
+        else:
+            raise Exception(f"OpenAI API error: {str(e)}")
+
+
+async def _get_ollama_response_async(prompt, config):
+    """Get response from Ollama local instance"""
+
+    if not config.get("connected", False):
+        raise Exception("Ollama is not running or not accessible. Please start Ollama and try again.")
+
+    data = _build_ollama_payload(prompt, config, stream=False)
+
+    try:
+        response = await get_async_client().post(
+            f"{config['host']}/api/generate", json=data, timeout=request_timeout(config, 300)
+        )
+
+        if _is_ollama_model_missing(response):
+            raise await asyncio.to_thread(_ollama_model_not_found_error, config)
+        if response.status_code != 200:
+            raise error_from_response(f"Ollama API error: {response.status_code} - {response.text}", response)
+
+        result = response.json()
+        return _clean_thinking_tags(result.get("response", "No response generated"))
+
+    except httpx.TimeoutException:
+        raise ProviderError("Ollama generation timeout. The model might be too slow or the prompt too complex. Try a simpler prompt or a faster model.", retryable=True)
+    except httpx.TransportError:
+        raise ProviderError("Cannot connect to Ollama. Make sure Ollama is running with 'ollama serve'.", retryable=True)
+    except ProviderError:
+        raise
+    except Exception as e:
+        if "API error" in str(e) or "not found" in str(e) or "timeout" in str(e):
+            raise e
+        else:
+            raise Exception(f"Ollama error: {str(e)}")
+
+
+async def _stream_ollama_response_async(prompt, config):
+    """Stream response from Ollama local instance"""
+
+    if not config.get("connected", False):
+        raise Exception("Ollama is not running or not accessible. Please start Ollama and try again.")
+
+    data = _build_ollama_payload(prompt, config, stream=True)
+
+    try:
+        async with get_async_client().stream(
+            "POST", f"{config['host']}/api/generate", json=data, timeout=request_timeout(config, 300)
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                if _is_ollama_model_missing(response):
+                    raise await asyncio.to_thread(_ollama_model_not_found_error, config)
+                raise error_from_response(f"Ollama API error: {response.status_code} - {response.text}", response)
+
+            # Ollama streams one JSON object per line
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                text, done = _parse_ollama_stream_line(line)
+                if text:
+                    yield text
+                if done:
+                    break
+
+    except httpx.TimeoutException:
+        raise ProviderError("Ollama generation timeout. The model might be too slow or the prompt too complex. Try a simpler prompt or a faster model.", retryable=True)
+    except httpx.ConnectError:
+        raise ProviderError("Cannot connect to Ollama. Make sure Ollama is running with 'ollama serve'.", retryable=True)
+    except httpx.TransportError:
+        # The connection broke off in the middle of the stream
+        raise ProviderError("Ollama stream was interrupted. Please try again.", retryable=True)
+    except ProviderError:
+        raise
+    except Exception as e:
+        if "API error" in str(e) or "not found" in str(e) or "timeout" in str(e):
+            raise e
+        else:
+            raise Exception(f"Ollama error: {str(e)}")
+
+
+async def _get_huggingface_api_response_async(prompt, config):
+    """Get response from Hugging Face API"""
+
+    url, headers, data = _build_huggingface_request(prompt, config)
+
+    try:
+        response = await get_async_client().post(url, headers=headers, json=data, timeout=request_timeout(config, 60))
+
+        if response.status_code == 503:
+            # Model is loading
+            raise error_from_response("Model is loading on Hugging Face. Please wait a moment and try again.", response)
+        elif response.status_code != 200:
+            raise error_from_response(f"Hugging Face API error: {response.status_code} - {response.text}", response)
+
+        return _parse_huggingface_result(response.json())
+
+    except httpx.TimeoutException:
+        raise ProviderError("Hugging Face API timeout. Please try again.", retryable=True)
+    except httpx.TransportError:
+        raise ProviderError("Cannot connect to Hugging Face API. Check your internet connection.", retryable=True)
+    except ProviderError:
+        raise
+    except Exception as e:
+        if "API error" in str(e) or "loading" in str(e):
+            raise e
+        else:
+            raise Exception(f"Hugging Face error: {str(e)}")
+
+
+async def _stream_huggingface_api_response_async(prompt, config):
+    """Stream response from Hugging Face API"""
+
+    url, headers, data = _build_huggingface_request(prompt, config, stream=True)
+
+    try:
+        async with get_async_client().stream(
+            "POST", url, headers=headers, json=data, timeout=request_timeout(config, 60)
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                if response.status_code == 503:
+                    raise error_from_response("Model is loading on Hugging Face. Please wait a moment and try again.", response)
+                raise error_from_response(f"Hugging Face API error: {response.status_code} - {response.text}", response)
+
+            # Models that cannot stream answer with a single JSON document
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                await response.aread()
+                yield _parse_huggingface_result(response.json())
+                return
+
+            async for payload in _aiter_sse_data(response):
+                text = _parse_huggingface_stream_event(payload)
+                if text:
+                    yield text
+
+    except httpx.TimeoutException:
+        raise ProviderError("Hugging Face API timeout. Please try again.", retryable=True)
+    except httpx.ConnectError:
+        raise ProviderError("Cannot connect to Hugging Face API. Check your internet connection.", retryable=True)
+    except httpx.TransportError:
+        # The connection broke off in the middle of the stream
+        raise ProviderError("Hugging Face API stream was interrupted. Please try again.", retryable=True)
+    except ProviderError:
+        raise
+    except Exception as e:
+        if "API error" in str(e) or "loading" in str(e):
+            raise e
+        else:
+            raise Exception(f"Hugging Face error: {str(e)}")
+
+
+async def _get_google_response_async(prompt, config):
+    """Get response from Google GenAI API"""
+
+    if not config.get("api_key"):
+        raise ValueError("Google API key is required")
+
+    try:
+        client = get_google_client(config["api_key"])
+        response = await client.aio.models.generate_content(model=config["model"], contents=prompt, config=_google_generation_config(config))
+        return response.text
+    except Exception as e:
+        raise _google_error(e)
+
+
+async def _stream_google_response_async(prompt, config):
+    """Stream response from Google GenAI API"""
+
+    if not config.get("api_key"):
+        raise ValueError("Google API key is required")
+
+    try:
+        client = get_google_client(config["api_key"])
+        stream = await client.aio.models.generate_content_stream(model=config["model"], contents=prompt, config=_google_generation_config(config))
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+    except Exception as e:
+        raise _google_error(e)
@@ -0,0 +1,57 @@
+"""
+Pool of Google GenAI clients keyed by API key.
+Each client is created once and reused by every session using that key.
+Keys are passed to the client directly, never through os.environ, so
+sessions with different keys cannot race on process-wide state.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Maximum number of distinct API keys kept warm
+MAX_CLIENTS = int(os.getenv("EDUADOCS_GOOGLE_MAX_CLIENTS", "32"))
+
+_lock = threading.Lock()
+_clients = OrderedDict()
+
+
+def _key_id(api_key):
+    """Identify a key without keeping the raw secret as a dict key"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def get_google_client(api_key):
+    """Get the shared google.genai client for an API key"""
+
+    if not api_key:
+        raise ValueError("Google API key is required")
+
+    key_id = _key_id(api_key)
+    with _lock:
+        client = _clients.get(key_id)
+        if client is not None:
+            _clients.move_to_end(key_id)
+            return client
+
+    # Build outside the lock so a slow first client doesn't block other keys
+    import google.genai as genai
+    client = genai.Client(api_key=api_key)
+
+    with _lock:
+        # Another session may have created one meanwhile; keep the first
+        existing = _clients.get(key_id)
+        if existing is not None:
+            _clients.move_to_end(key_id)
+            return existing
+        _clients[key_id] = client
+        while len(_clients) > MAX_CLIENTS:
+            _clients.popitem(last=False)
+    return client
+
+
+def clear_clients():
+    """Drop every pooled client (e.g. after rotating keys)."""
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,140 @@
+"""
+Process-wide registry of local Hugging Face pipelines.
+Each model is loaded once and kept warm; least-recently-used models are
+evicted when the estimated memory of the loaded models exceeds the budget.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# RAM budget for loaded local models, in megabytes
+MODEL_RAM_BUDGET_MB = int(os.getenv("EDUADOCS_HF_MODEL_RAM_MB", "8192"))
+
+
+def _estimate_pipeline_bytes(generator):
+    """Estimate the memory held by a pipeline's model weights and buffers"""
+    model = getattr(generator, "model", None)
+    if model is None:
+        return 0
+
+    total = 0
+    try:
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    except Exception:
+        return 0
+    return total
+
+
+class ModelRegistry:
+    """Loads text-generation pipelines once and shares them across sessions."""
+
+    def __init__(self, budget_bytes=None):
+        """Create an empty registry with the given memory budget."""
+        if budget_bytes is None:
+            budget_bytes = MODEL_RAM_BUDGET_MB * 1024 * 1024
+        self.budget_bytes = budget_bytes
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "load_seconds": {}
+        }
+
+    def get_pipeline(self, model_name, loader=None):
+        """
+        Return the pipeline for ``model_name``, loading it on first use.
+
+        Concurrent callers asking for a model that is still loading wait for
+        that single load instead of loading the weights again.
+        """
+        with self._lock:
+            entry = self._models.get(model_name)
+            if entry is not None:
+                self._models.move_to_end(model_name)
+                self._stats["hits"] += 1
+                return entry["pipeline"]
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        with load_lock:
+            # Another session may have finished loading while we waited
+            with self._lock:
+                entry = self._models.get(model_name)
+                if entry is not None:
+                    self._models.move_to_end(model_name)
+                    self._stats["hits"] += 1
+                    return entry["pipeline"]
+                self._stats["misses"] += 1
+
+            start = time.perf_counter()
+            generator = (loader or _load_text_generation_pipeline)(model_name)
+            elapsed = time.perf_counter() - start
+            size = _estimate_pipeline_bytes(generator)
+
+            with self._lock:
+                self._models[model_name] = {"pipeline": generator, "bytes": size}
+                self._stats["load_seconds"][model_name] = elapsed
+                self._evict_over_budget(keep=model_name)
+                self._load_locks.pop(model_name, None)
+
+        return generator
+
+    def _evict_over_budget(self, keep):
+        """Drop least-recently-used models until the budget is respected"""
+        while self._used_bytes() > self.budget_bytes and len(self._models) > 1:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            del self._models[oldest]
+            self._stats["evictions"] += 1
+
+    def _used_bytes(self):
+        """Total estimated bytes held by loaded models"""
+        return sum(entry["bytes"] for entry in self._models.values())
+
+    def evict(self, model_name):
+        """Unload a model explicitly."""
+        with self._lock:
+            if self._models.pop(model_name, None) is not None:
+                self._stats["evictions"] += 1
+
+    def get_stats(self):
+        """Return hit/miss/eviction counters, load times and loaded models."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "hits": self._stats["hits"],
+                "misses": self._stats["misses"],
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "evictions": self._stats["evictions"],
+                "load_seconds": dict(self._stats["load_seconds"]),
+                "loaded_models": {name: entry["bytes"] for name, entry in self._models.items()},
+                "used_bytes": self._used_bytes(),
+                "budget_bytes": self.budget_bytes
+            }
+
+
+def _load_text_generation_pipeline(model_name):
+    """Build a text-generation pipeline for a model"""
+    from transformers import pipeline
+    return pipeline("text-generation", model=model_name)
+
+
+# Global instance
+_model_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """Get or create the global model registry instance."""
+    global _model_registry
+    if _model_registry is None:
+        with _registry_lock:
+            if _model_registry is None:
+                _model_registry = ModelRegistry()
+    return _model_registry
@@ -0,0 +1,143 @@
+"""
+Shared, TTL-based catalog of the models available on Ollama hosts.
+The sidebar and the generation path both read it, so /api/tags is fetched
+once per host per TTL instead of on every rerun and every generation.
+Probes always run in the background: stale entries are served while they
+refresh, and an unreachable host is probed again with exponential backoff
+instead of stalling every rerun for the request timeout.
+"""
+
+import os
+import threading
+import time
+
+import requests
+
+from llm_handlers import transport
+
+# Seconds a fetched model list is considered fresh
+CATALOG_TTL_SECONDS = float(os.getenv("EDUADOCS_OLLAMA_CATALOG_TTL", "30"))
+
+# Re-probe delays for an unreachable host: base doubled per failure, capped
+UNREACHABLE_BACKOFF_SECONDS = float(os.getenv("EDUADOCS_OLLAMA_BACKOFF_BASE", "2"))
+UNREACHABLE_BACKOFF_MAX_SECONDS = float(os.getenv("EDUADOCS_OLLAMA_BACKOFF_MAX", "30"))
+
+# Timeout for the /api/tags request
+CATALOG_TIMEOUT_SECONDS = 3
+
+_lock = threading.Lock()
+_entries = {}
+# host -> Event set when its running probe finishes
+_refreshing = {}
+
+
+def _normalize_host(host):
+    """Use one catalog entry regardless of trailing slashes"""
+    return host.rstrip("/")
+
+
+def _fetch(host):
+    """Query /api/tags and return a catalog entry"""
+    try:
+        response = transport.get(f"{host}/api/tags", timeout=CATALOG_TIMEOUT_SECONDS)
+        if response.status_code == 200:
+            models_data = response.json().get("models", [])
+            models = [model["name"] for model in models_data]
+            entry = {"connected": True, "models": models}
+        else:
+            entry = {"connected": False, "error": f"HTTP {response.status_code}"}
+    except requests.exceptions.ConnectionError:
+        entry = {"connected": False, "error": "Connection refused - Ollama not running"}
+    except requests.exceptions.Timeout:
+        entry = {"connected": False, "error": "Connection timeout"}
+    except Exception as e:
+        entry = {"connected": False, "error": str(e)}
+
+    entry["fetched_at"] = time.monotonic()
+    return entry
+
+
+def _max_age(entry):
+    """How long an entry is served before it is probed again"""
+    if entry["connected"]:
+        return CATALOG_TTL_SECONDS
+    return min(UNREACHABLE_BACKOFF_SECONDS * 2 ** (entry["failures"] - 1), UNREACHABLE_BACKOFF_MAX_SECONDS)
+
+
+def _store(host, entry):
+    """Save a fetched entry, counting consecutive failures for the backoff"""
+    with _lock:
+        previous = _entries.get(host)
+        if entry["connected"]:
+            entry["failures"] = 0
+        else:
+            entry["failures"] = (previous["failures"] if previous else 0) + 1
+        _entries[host] = entry
+
+
+def _refresh_in_background(host):
+    """
+    Start a background probe unless one is already running.
+    Returns the probe's Event and whether this call started it.
+    """
+    with _lock:
+        done = _refreshing.get(host)
+        if done is not None:
+            return done, False
+        done = _refreshing[host] = threading.Event()
+
+    def _run():
+        try:
+            _store(host, _fetch(host))
+        finally:
+            with _lock:
+                _refreshing.pop(host, None)
+            done.set()
+
+    threading.Thread(target=_run, name=f"ollama-catalog-{host}", daemon=True).start()
+    return done, True
+
+
+def get_catalog(host, wait=None):
+    """
+    Return ``{"connected": bool, "models": [...], "error": str}`` for a host.
+
+    A cached entry is returned immediately (and refreshed in the background
+    once stale). Without one, the call that starts the first probe waits
+    for it at most ``wait`` seconds (None waits for it to finish); while
+    it is still running, ``{"connected": False, "checking": True}`` is
+    returned.
+    """
+    host = _normalize_host(host)
+    with _lock:
+        entry = _entries.get(host)
+
+    if entry is None:
+        done, started = _refresh_in_background(host)
+        if started or wait is None:
+            done.wait(wait)
+        with _lock:
+            entry = _entries.get(host)
+        if entry is None:
+            return {"connected": False, "checking": True, "models": []}
+    elif time.monotonic() - entry["fetched_at"] > _max_age(entry):
+        _refresh_in_background(host)
+
+    return {key: value for key, value in entry.items() if key not in ("fetched_at", "failures")}
+
+
+def is_cached(host):
+    """Tell whether a probe result is available for a host"""
+    with _lock:
+        return _normalize_host(host) in _entries
+
+
+def get_models(host):
+    """Return the cached model names for a host (empty when unreachable)."""
+    return get_catalog(host).get("models", [])
+
+
+def invalidate(host):
+    """Forget the cached entry so the next read fetches /api/tags again."""
+    with _lock:
+        _entries.pop(_normalize_host(host), None)
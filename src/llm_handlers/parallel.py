@@ -0,0 +1,65 @@
+"""
+Concurrent LLM calls for documents generated in several parts.
+Each prompt goes through get_llm_response_async on the shared event loop,
+so the parts fan out without a thread each and still use the response
+cache, retry policy and token accounting. Completion callbacks run on the
+calling thread, where Streamlit allows UI updates.
+"""
+
+import asyncio
+from concurrent.futures import as_completed
+import os
+
+from llm_handlers.async_handler import get_llm_response_async, run_on_loop
+from llm_handlers.token_accounting import MIN_OUTPUT_TOKENS, reasoning_headroom
+
+# Default number of calls in flight for one document
+MAX_PARALLEL_CALLS = int(os.getenv("EDUADOCS_MAX_PARALLEL_CALLS", "4"))
+
+
+def parallel_limit(llm_config, max_concurrency=None):
+    """How many calls to run at once for this provider"""
+    # A local model already uses the whole machine; parallel calls only thrash it
+    if llm_config.get("provider") == "huggingface" and llm_config.get("use_local"):
+        return 1
+    return max(1, max_concurrency or llm_config.get("max_concurrency") or MAX_PARALLEL_CALLS)
+
+
+def split_output_budget(llm_config, parts):
+    """Share a document's output token budget between its calls"""
+    limit = llm_config.get("max_output_tokens")
+    if not limit:
+        return llm_config
+    floor = MIN_OUTPUT_TOKENS * reasoning_headroom(llm_config)
+    return dict(llm_config, max_output_tokens=max(floor, limit // max(1, parts)))
+
+
+def get_llm_responses(prompts, llm_config, max_concurrency=None, on_complete=None):
+    """
+    Run several prompts concurrently and return the responses in prompt order.
+
+    ``on_complete(index, response)`` is called as each response arrives.
+    The first failure cancels the other calls and is raised.
+    """
+    if not prompts:
+        return []
+
+    responses = [None] * len(prompts)
+    semaphore = asyncio.Semaphore(min(len(prompts), parallel_limit(llm_config, max_concurrency)))
+
+    async def _call(prompt):
+        async with semaphore:
+            return await get_llm_response_async(prompt, llm_config)
+
+    futures = {run_on_loop(_call(prompt)): index for index, prompt in enumerate(prompts)}
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            responses[index] = future.result()
+            if on_complete is not None:
+                on_complete(index, responses[index])
+    finally:
+        for future in futures:
+            future.cancel()
+
+    return responses
@@ -0,0 +1,295 @@
+"""
+Process-wide rate and concurrency governor for remote LLM providers.
+Every session calls the providers from the same process, so their calls
+go through one governor per provider/model: token buckets for requests
+and tokens per minute, a cap on calls in flight, and a wait queue served
+round-robin across sessions. A call waits (for a bounded time) for its
+turn instead of tripping the provider's rate limit for everyone at once.
+"""
+
+from collections import OrderedDict, deque
+import os
+import threading
+import time
+
+from llm_handlers.token_accounting import CHARS_PER_TOKEN
+
+# Providers governed by default; local models are bounded elsewhere
+GOVERNED_PROVIDERS = ("openai", "google", "huggingface")
+
+# Default limits per provider/model (0 disables a limit)
+GOVERNOR_RPM = int(os.getenv("EDUADOCS_GOVERNOR_RPM", "60"))
+GOVERNOR_TPM = int(os.getenv("EDUADOCS_GOVERNOR_TPM", "100000"))
+GOVERNOR_MAX_IN_FLIGHT = int(os.getenv("EDUADOCS_GOVERNOR_MAX_IN_FLIGHT", "8"))
+
+# Overrides as "provider[/model]=rpm:tpm:in_flight", comma-separated,
+# e.g. "openai=500:200000:16,google/gemini-2.5-pro=5:250000:2"
+GOVERNOR_LIMITS = os.getenv("EDUADOCS_GOVERNOR_LIMITS", "")
+
+# Longest a call waits for its turn before giving up
+GOVERNOR_MAX_WAIT_SECONDS = float(os.getenv("EDUADOCS_GOVERNOR_MAX_WAIT", "60"))
+
+# How many seconds' worth of the per-minute rates may be spent at once
+GOVERNOR_BURST_SECONDS = float(os.getenv("EDUADOCS_GOVERNOR_BURST_SECONDS", "10"))
+
+# Completion tokens reserved for a call without an output cap
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+class GovernorTimeout(Exception):
+    """
+    Raised when a call waited too long for provider capacity.
+    ``deadline_bound`` is set when the wait was cut short by the caller's own
+    deadline rather than by GOVERNOR_MAX_WAIT_SECONDS.
+    """
+
+    def __init__(self, message, deadline_bound=False):
+        super().__init__(message)
+        self.deadline_bound = deadline_bound
+
+
+def parse_limits(value):
+    """Parse GOVERNOR_LIMITS into {"provider" or "provider/model": (rpm, tpm, in_flight)}"""
+    limits = {}
+    for item in value.split(","):
+        key, _, numbers = item.partition("=")
+        if not key.strip():
+            continue
+        parts = numbers.split(":")
+        if len(parts) != 3 or not all(part.strip().isdigit() for part in parts):
+            raise Exception(f"Invalid governor limit '{item.strip()}', expected provider[/model]=rpm:tpm:in_flight")
+        limits[key.strip()] = tuple(int(part) for part in parts)
+    return limits
+
+
+def estimate_tokens(text):
+    """Cheap token estimate; the exact count is done off the request path"""
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units a minute up to a burst capacity."""
+
+    def __init__(self, per_minute, burst_seconds=GOVERNOR_BURST_SECONDS):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self):
+        return self.per_minute <= 0
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until ``amount`` can be taken (a call larger than the burst needs a full bucket)"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        if not self.unlimited:
+            self.level -= amount
+
+    def adjust(self, amount):
+        """Charge (or refund, when negative) the difference to an estimate"""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level - amount)
+
+
+class _Ticket:
+    """A call waiting for, or holding, a slot."""
+
+    __slots__ = ("session", "tokens", "granted", "enqueued_at")
+
+    def __init__(self, session, tokens):
+        self.session = session
+        self.tokens = tokens
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+class ProviderGovernor:
+    """Admission for one provider/model: RPM and TPM buckets, in-flight cap, fair queue."""
+
+    def __init__(self, rpm=GOVERNOR_RPM, tpm=GOVERNOR_TPM, max_in_flight=GOVERNOR_MAX_IN_FLIGHT,
+                 burst_seconds=GOVERNOR_BURST_SECONDS):
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds)
+        self._cond = threading.Condition()
+        # session -> its waiting calls, oldest first; sessions take turns
+        self._queues = OrderedDict()
+        self._in_flight = 0
+        self._stats = {"admitted": 0, "waited": 0, "timeouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+    def _dispatch(self):
+        """
+        Grant slots to waiting calls, one session at a time in turn.
+        Returns the seconds until the buckets can admit the next call,
+        or None if it waits for a call in flight to finish.
+        """
+        granted = False
+        retry_in = None
+        now = time.monotonic()
+        while self._queues:
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                break
+            session, queue = next(iter(self._queues.items()))
+            ticket = queue[0]
+            delay = max(self.requests.wait_time(1, now), self.tokens.wait_time(ticket.tokens, now))
+            if delay > 0:
+                retry_in = delay
+                break
+
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+            self.requests.take(1)
+            self.tokens.take(ticket.tokens)
+            self._in_flight += 1
+            ticket.granted = True
+            granted = True
+
+        if granted:
+            self._cond.notify_all()
+        return retry_in
+
+    def _remove(self, ticket):
+        queue = self._queues.get(ticket.session)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.session]
+
+    def acquire(self, session, tokens, timeout=GOVERNOR_MAX_WAIT_SECONDS, deadline_bound=False):
+        """
+        Wait for a slot for a call estimated at ``tokens``; returns its ticket.
+        ``deadline_bound`` says ``timeout`` is what is left of the caller's deadline.
+        """
+        ticket = _Ticket(session, tokens)
+        deadline = ticket.enqueued_at + timeout
+        with self._cond:
+            self._queues.setdefault(session, deque()).append(ticket)
+            while True:
+                retry_in = self._dispatch()
+                if ticket.granted:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._remove(ticket)
+                    self._stats["timeouts"] += 1
+                    # It may have been holding up the calls behind it
+                    self._dispatch()
+                    raise GovernorTimeout(
+                        "The provider is busy and no capacity became available in time. Please try again.",
+                        deadline_bound
+                    )
+                self._cond.wait(remaining if retry_in is None else min(remaining, retry_in))
+
+            waited = time.monotonic() - ticket.enqueued_at
+            self._stats["admitted"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+            if waited > 0.01:
+                self._stats["waited"] += 1
+        return ticket
+
+    def release(self, ticket, used_tokens=None):
+        """Free a call's slot, settling its token estimate against what it used"""
+        with self._cond:
+            self._in_flight -= 1
+            if used_tokens is not None:
+                self.tokens.adjust(used_tokens - ticket.tokens)
+            self._dispatch()
+
+    def get_stats(self):
+        with self._cond:
+            admitted = self._stats["admitted"]
+            return {
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "sessions_waiting": len(self._queues),
+                "in_flight": self._in_flight,
+                "admitted": admitted,
+                "waited": self._stats["waited"],
+                "timeouts": self._stats["timeouts"],
+                "wait_seconds_mean": round(self._stats["wait_seconds_total"] / admitted, 3) if admitted else 0.0,
+                "wait_seconds_max": round(self._stats["wait_seconds_max"], 3),
+                "limits": {"rpm": self.requests.per_minute, "tpm": self.tokens.per_minute,
+                           "max_in_flight": self.max_in_flight}
+            }
+
+
+_governors_lock = threading.Lock()
+_governors = {}
+_limits = None
+
+
+def get_governor(provider, model, use_local=False):
+    """Get the governor for a provider/model pair, or None if it is not governed"""
+    global _limits
+    # A model run locally doesn't share the hosted model's limits
+    key = (provider, model, bool(use_local))
+    with _governors_lock:
+        if key in _governors:
+            return _governors[key]
+        if _limits is None:
+            _limits = parse_limits(GOVERNOR_LIMITS)
+        limits = _limits.get(f"{provider}/{model}") or _limits.get(provider)
+        governor = None
+        if limits is not None:
+            governor = ProviderGovernor(*limits)
+        elif provider in GOVERNED_PROVIDERS and not use_local:
+            governor = ProviderGovernor()
+        _governors[key] = governor
+        return governor
+
+
+def admit(prompt, llm_config):
+    """
+    Wait for the configured provider to have room for a call.
+    Returns a ticket to pass to ``release`` (None when ungoverned).
+    The wait is bounded by GOVERNOR_MAX_WAIT_SECONDS and the document deadline.
+    """
+    governor = get_governor(llm_config.get("provider"), llm_config.get("model"), llm_config.get("use_local"))
+    if governor is None:
+        return None
+
+    timeout = GOVERNOR_MAX_WAIT_SECONDS
+    deadline_bound = False
+    if llm_config.get("deadline") is not None:
+        remaining = max(0.0, llm_config["deadline"] - time.monotonic())
+        if remaining < timeout:
+            timeout = remaining
+            deadline_bound = True
+    prompt_tokens = estimate_tokens(prompt)
+    estimate = prompt_tokens + (llm_config.get("max_output_tokens") or DEFAULT_COMPLETION_TOKENS)
+    ticket = governor.acquire(llm_config.get("session_id"), estimate, timeout, deadline_bound)
+    return governor, ticket, prompt_tokens
+
+
+def release(ticket, completion=None):
+    """Return a call's slot; ``completion`` is its text if it succeeded"""
+    if ticket is None:
+        return
+    governor, slot, prompt_tokens = ticket
+    used_tokens = None if completion is None else prompt_tokens + estimate_tokens(completion)
+    governor.release(slot, used_tokens)
+
+
+def get_governor_stats():
+    """Queue depth, waits and limits of every governor, keyed by "provider/model" ("... (local)" when run locally)."""
+    with _governors_lock:
+        governors = {
+            f"{provider}/{model}{' (local)' if use_local else ''}": governor
+            for (provider, model, use_local), governor in _governors.items() if governor
+        }
+    return {key: governor.get_stats() for key, governor in governors.items()}
@@ -0,0 +1,265 @@
+"""
+Resilience policy for LLM provider calls.
+Retries transient failures (timeouts, connection errors, 429 and 5xx) with
+jittered exponential backoff that honours Retry-After, keeps every call of
+a document inside one deadline, and trips a circuit breaker per
+provider/model so a failing provider is not hammered while it recovers.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+MAX_RETRIES = int(os.getenv("EDUADOCS_LLM_MAX_RETRIES", "3"))
+BACKOFF_BASE_SECONDS = float(os.getenv("EDUADOCS_LLM_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX_SECONDS = float(os.getenv("EDUADOCS_LLM_BACKOFF_MAX", "20.0"))
+
+# Overall time budget for generating one document
+DOCUMENT_DEADLINE_SECONDS = float(os.getenv("EDUADOCS_DOCUMENT_DEADLINE", "600"))
+
+# Consecutive transient failures that open a breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("EDUADOCS_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("EDUADOCS_BREAKER_RESET_SECONDS", "30"))
+
+
+class ProviderError(Exception):
+    """Error from an LLM provider, with the details the retry policy needs."""
+
+    def __init__(self, message, status_code=None, retry_after=None, retryable=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        if retryable is None:
+            retryable = is_retryable_status(status_code)
+        self.retryable = retryable
+        # Set once part of the response reached the caller: a retry would duplicate it
+        self.partial = False
+
+
+class DeadlineExceeded(ProviderError):
+    """Raised when a caller's document deadline has passed."""
+
+    def __init__(self, message="Generation deadline exceeded. Please try again."):
+        super().__init__(message)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its breaker is open."""
+
+
+def is_retryable_status(status_code):
+    """Rate limits and server-side errors are worth retrying"""
+    if status_code is None:
+        return False
+    return status_code in (408, 429) or (500 <= status_code < 600 and status_code != 501)
+
+
+def parse_retry_after(value):
+    """Convert a Retry-After header (seconds or HTTP date) to seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_from_response(message, response):
+    """Build a ProviderError from a failed HTTP response"""
+    return ProviderError(
+        message,
+        status_code=response.status_code,
+        retry_after=parse_retry_after(response.headers.get("Retry-After"))
+    )
+
+
+def new_deadline(seconds=DOCUMENT_DEADLINE_SECONDS):
+    """Return an absolute (monotonic) deadline ``seconds`` from now"""
+    return time.monotonic() + seconds
+
+
+def request_timeout(config, default):
+    """Clip a per-request timeout to what is left of the document deadline"""
+    deadline = config.get("deadline")
+    if deadline is None:
+        return default
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return min(default, remaining)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry number"""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker counting consecutive transient failures."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Tell whether a call may go through right now"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self.state = "half_open"
+                self._trial_in_flight = False
+            # Half-open: let a single trial call probe the provider
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a trial call through"""
+        with self._lock:
+            return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def record_success(self):
+        """The provider answered; close the breaker"""
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_neutral(self):
+        """The call ended without telling whether the provider is healthy"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """A transient failure; open the breaker past the threshold"""
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+_breakers_lock = threading.Lock()
+_breakers = {}
+
+
+def get_breaker(provider, model, use_local=False):
+    """Get the circuit breaker for a provider/model pair (local and hosted models apart)"""
+    key = (provider, model, bool(use_local))
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker()
+        return breaker
+
+
+def get_breaker_states():
+    """Return the state of every breaker, keyed by "provider/model" ("... (local)" when run locally)."""
+    with _breakers_lock:
+        return {
+            f"{provider}/{model}{' (local)' if use_local else ''}": breaker.state
+            for (provider, model, use_local), breaker in _breakers.items()
+        }
+
+
+def _check_breaker(breaker, llm_config):
+    """Refuse the call without trying it while the provider's breaker is open"""
+    if not breaker.allow():
+        raise CircuitOpenError(
+            f"{llm_config.get('provider')} ({llm_config.get('model')}) is temporarily unavailable "
+            f"after repeated failures. Try again in {breaker.retry_in():.0f} seconds."
+        )
+
+
+def _retry_delay(breaker, error, attempt, deadline):
+    """Record a ProviderError on the breaker; return the delay before retrying, or None to give up"""
+    if not error.retryable:
+        if error.status_code is not None:
+            # The provider answered (e.g. bad request); it is not down
+            breaker.record_success()
+        else:
+            breaker.record_neutral()
+        return None
+    breaker.record_failure()
+    if error.partial or attempt >= MAX_RETRIES:
+        return None
+
+    delay = max(backoff_delay(attempt), error.retry_after or 0.0)
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+def call_with_resilience(fn, llm_config):
+    """
+    Call ``fn`` under the retry, deadline and circuit breaker policy.
+
+    Only ProviderError marked retryable is retried; any other exception
+    propagates immediately. A retry is skipped when its delay would run
+    past the document deadline, or when the failed call already streamed
+    part of its response. Only answers from the provider move the breaker;
+    other errors (cancellation, deadlines, our own bugs) leave it as is.
+    """
+    breaker = get_breaker(llm_config.get("provider"), llm_config.get("model"), llm_config.get("use_local"))
+    deadline = llm_config.get("deadline")
+    attempt = 0
+
+    while True:
+        _check_breaker(breaker, llm_config)
+        try:
+            result = fn()
+        except ProviderError as e:
+            delay = _retry_delay(breaker, e, attempt, deadline)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            breaker.record_neutral()
+            raise
+
+        breaker.record_success()
+        return result
+
+
+async def call_with_resilience_async(fn, llm_config):
+    """Like call_with_resilience, for a coroutine function ``fn``; backoff doesn't block the loop"""
+    breaker = get_breaker(llm_config.get("provider"), llm_config.get("model"), llm_config.get("use_local"))
+    deadline = llm_config.get("deadline")
+    attempt = 0
+
+    while True:
+        _check_breaker(breaker, llm_config)
+        try:
+            result = await fn()
+        except ProviderError as e:
+            delay = _retry_delay(breaker, e, attempt, deadline)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            breaker.record_neutral()
+            raise
+
+        breaker.record_success()
+        return result
@@ -0,0 +1,202 @@
+"""
+Persistent cache of LLM responses.
+Responses are stored in SQLite keyed by a hash of provider, model,
+normalized prompt and sampling parameters, with TTL expiry and a size
+bound enforced by least-recently-used eviction. SQLite's WAL mode and
+locking make the cache safe to share between several server processes.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Default cache location (next to the locales folder)
+CACHE_DIR = Path(__file__).parent.parent.parent / ".cache"
+
+CACHE_PATH = Path(os.getenv("EDUADOCS_CACHE_PATH", str(CACHE_DIR / "responses.sqlite3")))
+CACHE_TTL_SECONDS = int(os.getenv("EDUADOCS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_MB = float(os.getenv("EDUADOCS_CACHE_MAX_MB", "64"))
+CACHE_ENABLED = os.getenv("EDUADOCS_CACHE_ENABLED", "1") != "0"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so cosmetic prompt changes share a cache entry"""
+    return " ".join(prompt.split())
+
+
+def make_cache_key(prompt, llm_config):
+    """Hash the fields of a request that determine the response"""
+    fields = {
+        "provider": llm_config.get("provider"),
+        "model": llm_config.get("model"),
+        "host": llm_config.get("host"),
+        "use_local": llm_config.get("use_local"),
+        "temperature": llm_config.get("temperature"),
+        "max_output_tokens": llm_config.get("max_output_tokens"),
+        "prompt": normalize_prompt(prompt)
+    }
+    encoded = json.dumps(fields, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL and LRU size bound."""
+
+    def __init__(self, path=CACHE_PATH, ttl_seconds=CACHE_TTL_SECONDS,
+                 max_bytes=int(CACHE_MAX_MB * 1024 * 1024), enabled=CACHE_ENABLED):
+        """Create a cache stored at ``path``."""
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+    def _connect(self):
+        """Return this thread's connection, creating the database if needed"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit mode; write transactions are opened explicitly
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        """Increment a statistics counter"""
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def get(self, key):
+        """Return the cached response for ``key`` or None."""
+        if not self.enabled:
+            return None
+        try:
+            conn = self._connect()
+            now = time.time()
+            row = conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self._count("misses")
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._count("misses")
+                return None
+
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count("hits")
+            return value
+        except sqlite3.Error:
+            # A broken cache must never break generation
+            self._count("errors")
+            self._count("misses")
+            return None
+
+    def put(self, key, value):
+        """Store a response and evict entries over the size bound."""
+        if not self.enabled or not value:
+            return
+        try:
+            conn = self._connect()
+            now = time.time()
+            size = len(value.encode("utf-8"))
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now)
+                )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._count("writes")
+        except sqlite3.Error:
+            self._count("errors")
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least-recently-used ones over the bound"""
+        evicted = 0
+        if self.ttl_seconds:
+            evicted += conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            freed = 0
+            victims = []
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                victims.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            evicted += len(victims)
+
+        if evicted:
+            self._count("evictions", evicted)
+
+    def clear(self):
+        """Remove every cached response."""
+        try:
+            self._connect().execute("DELETE FROM responses")
+        except sqlite3.Error:
+            self._count("errors")
+
+    def get_stats(self):
+        """Return hit/miss counters for this process and the cache size."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        try:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            stats.update({"entries": entries, "bytes": size})
+        except sqlite3.Error:
+            stats.update({"entries": None, "bytes": None})
+        return stats
+
+
+# Global instance
+_response_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Get or create the global response cache instance."""
+    global _response_cache
+    if _response_cache is None:
+        with _cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
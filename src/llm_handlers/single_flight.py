@@ -0,0 +1,275 @@
+"""
+Single-flight coalescing of identical LLM calls.
+When the same request (provider, model, options and normalized prompt)
+is already in flight, later callers don't call the provider again: they
+join the running call and receive its result, and its streamed chunks as
+they arrive when they stream. A double-clicked Generate or a whole class
+asking for the same lesson at once costs one provider call.
+Only callers with the same credentials share a call, and a failure that
+belongs to the running call's own caller (its credentials, deadline or
+cancellation) is not handed on: the callers that joined it call again.
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+from llm_handlers.rate_governor import GovernorTimeout
+from llm_handlers.resilience import DeadlineExceeded, ProviderError
+
+SINGLE_FLIGHT_ENABLED = os.getenv("EDUADOCS_SINGLE_FLIGHT", "1") not in ("0", "false", "False", "")
+
+
+def credential_fingerprint(llm_config):
+    """Short hash of the API key, so callers with different credentials don't share a call"""
+    api_key = llm_config.get("api_key")
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _caller_error(error):
+    """Tell whether a failure belongs to the caller that made the call rather than to the request"""
+    if isinstance(error, DeadlineExceeded):
+        return True
+    if isinstance(error, GovernorTimeout):
+        # Only a wait cut short by the leader's deadline; saturation is everyone's
+        return error.deadline_bound
+    return isinstance(error, ProviderError) and error.status_code in (401, 403)
+
+
+class _Flight:
+    """One running call and what it has produced so far."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        # The error is the leader's own; followers call again instead
+        self.rerun = False
+        self.followers = 0
+        # Wake-ups of followers waiting on an event loop
+        self.waiters = []
+
+    def notify(self):
+        """Wake every follower; call with ``cond`` held"""
+        self.cond.notify_all()
+        for waiter in self.waiters:
+            waiter()
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share it."""
+
+    def __init__(self, enabled=SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {"calls": 0, "coalesced": 0, "reruns": 0}
+
+    def _join(self, key):
+        """Return the running flight for ``key`` and whether this caller leads it"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats["calls"] += 1
+            else:
+                with flight.cond:
+                    flight.followers += 1
+                self._stats["coalesced"] += 1
+        return flight, leader
+
+    def run(self, key, fn, on_token=None, deadline=None):
+        """
+        Return ``fn(on_chunk)``, or the result of the identical call already running.
+
+        ``fn`` streams through ``on_chunk`` when it is not None. A caller
+        that joins a running call waits for it until its own ``deadline``
+        and gets the chunks streamed so far followed by the rest. If that
+        call fails for a reason of its own caller before any chunk was
+        passed on, the joined caller runs the call again.
+        """
+        if not self.enabled:
+            return fn(on_token)
+
+        flight, leader = self._join(key)
+        if leader:
+            own_errors = []
+            result = error = None
+            try:
+                result = fn(self._publisher(flight, on_token, own_errors))
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._settle(key, flight, result, error, own_errors)
+            if own_errors:
+                raise own_errors[0]
+            return result
+
+        sent = 0
+        try:
+            while True:
+                with flight.cond:
+                    while not flight.done and len(flight.chunks) == sent:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise DeadlineExceeded()
+                        flight.cond.wait(remaining)
+                    chunks = flight.chunks[sent:]
+                    sent += len(chunks)
+                    done = flight.done
+                if on_token is not None:
+                    for chunk in chunks:
+                        on_token(chunk)
+                if done:
+                    break
+        finally:
+            with flight.cond:
+                flight.followers -= 1
+
+        if self._should_rerun(flight, on_token, sent):
+            return self.run(key, fn, on_token, deadline)
+        return self._outcome(flight, on_token)
+
+    async def run_async(self, key, fn, on_token=None, deadline=None):
+        """
+        Like ``run`` for a coroutine function ``fn``; waiting for a running
+        call doesn't block the event loop. Sync and async callers of one key
+        share the same call.
+        """
+        if not self.enabled:
+            return await fn(on_token)
+
+        flight, leader = self._join(key)
+        if leader:
+            own_errors = []
+            result = error = None
+            try:
+                result = await fn(self._publisher(flight, on_token, own_errors))
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._settle(key, flight, result, error, own_errors)
+            if own_errors:
+                raise own_errors[0]
+            return result
+
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+
+        def waiter():
+            loop.call_soon_threadsafe(wakeup.set)
+
+        sent = 0
+        with flight.cond:
+            flight.waiters.append(waiter)
+        try:
+            while True:
+                with flight.cond:
+                    chunks = flight.chunks[sent:]
+                    sent += len(chunks)
+                    done = flight.done
+                    if not chunks and not done:
+                        # Cleared under the lock, so no later notification is lost
+                        wakeup.clear()
+                if on_token is not None:
+                    for chunk in chunks:
+                        on_token(chunk)
+                if done:
+                    break
+                if not chunks:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise DeadlineExceeded()
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            with flight.cond:
+                flight.followers -= 1
+                flight.waiters.remove(waiter)
+
+        if self._should_rerun(flight, on_token, sent):
+            return await self.run_async(key, fn, on_token, deadline)
+        return self._outcome(flight, on_token)
+
+    def _publisher(self, flight, on_token, own_errors):
+        """The leader's ``on_chunk``: share each chunk, then pass it to the leader's own caller"""
+        if on_token is None:
+            return None
+
+        def publish(chunk):
+            with flight.cond:
+                flight.chunks.append(chunk)
+                flight.notify()
+                followers = flight.followers
+            if own_errors:
+                return
+            try:
+                on_token(chunk)
+            except Exception as e:
+                # e.g. this caller was cancelled; keep streaming for the others
+                own_errors.append(e)
+                if not followers:
+                    raise
+
+        return publish
+
+    def _settle(self, key, flight, result, error, own_errors):
+        """Finish the leader's flight and hand its outcome to the followers"""
+        with self._lock:
+            del self._flights[key]
+        with flight.cond:
+            flight.rerun = _caller_error(error)
+            if (own_errors and error is own_errors[0]) or isinstance(error, asyncio.CancelledError):
+                flight.rerun = True
+                error = ProviderError("The identical request this one joined was cancelled. Please try again.")
+            flight.result = result
+            flight.error = error
+            flight.done = True
+            flight.notify()
+
+    def _should_rerun(self, flight, on_token, sent):
+        """A follower calls again after the leader's own failure, unless it already passed chunks on"""
+        if flight.error is None or not flight.rerun or (on_token is not None and sent):
+            return False
+        with self._lock:
+            self._stats["reruns"] += 1
+        return True
+
+    def _outcome(self, flight, on_token):
+        if flight.error is not None:
+            raise flight.error
+        if on_token is not None and not flight.chunks and flight.result:
+            # The running call didn't stream; hand over its text at once
+            on_token(flight.result)
+        return flight.result
+
+    def get_stats(self):
+        """Provider calls made, callers that joined one instead (and had to call again), and calls running now."""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._flights))
+
+
+# Global instance
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Get or create the global single-flight registry."""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,220 @@
+"""
+Incremental removal of <think>...</think> reasoning blocks.
+ThinkTagFilter consumes a response chunk by chunk (tags may be split across
+chunk boundaries) and emits text that, once concatenated, is identical to
+what the old regex-based cleaner produced on the complete response:
+
+1. ``<think>.*?</think>`` blocks are dropped (case-insensitive)
+2. self-closing ``<think/>`` tags are dropped
+3. runs of three or more newlines collapse to a blank line, trailing
+   whitespace is stripped from every line and from both ends of the text
+
+Each stage is a small state machine fed by the previous one, so every
+character is scanned once per stage and only a few characters (or an
+unterminated think block) are ever held back. A response that is already
+complete goes through clean_thinking_tags, the plain regex passes, which
+are faster on a whole string.
+"""
+
+import re
+
+_THINK_OPEN = re.compile(r"<think>", re.IGNORECASE)
+_THINK_CLOSE = re.compile(r"</think>", re.IGNORECASE)
+_SELF_CLOSING_START = re.compile(r"<think", re.IGNORECASE)
+_SELF_CLOSING = re.compile(r"<think\s*/>", re.IGNORECASE)
+_SELF_CLOSING_PARTIAL = re.compile(r"\s*/?")
+_LEADING_WS = re.compile(r"\s*")
+_NEWLINE_RUN = re.compile(r"\s*\n\s*")
+
+# Whole-string cleaner (the original regex passes)
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.IGNORECASE | re.DOTALL)
+_BLANK_LINES = re.compile(r"\n\s*\n\s*\n+")
+
+# Characters held back so a tag split across chunks is still recognised
+_OPEN_HOLD = len("<think>") - 1
+_CLOSE_HOLD = len("</think>") - 1
+_SELF_CLOSING_HOLD = len("<think") - 1
+
+
+def _collapse_newline_run(match):
+    """Whitespace run containing newlines -> at most one blank line"""
+    run = match.group()
+    newlines = min(run.count("\n"), 2)
+    return "\n" * newlines + run[run.rfind("\n") + 1:]
+
+
+class _ThinkBlockStage:
+    """Drops <think>...</think> blocks; an unclosed block is kept verbatim."""
+
+    def __init__(self):
+        self._pending = ""
+        self._inside = False
+        self._block = []
+
+    def feed(self, text):
+        data = self._pending + text
+        out = []
+        pos = 0
+        while True:
+            if self._inside:
+                match = _THINK_CLOSE.search(data, pos)
+                if match is None:
+                    keep = max(pos, len(data) - _CLOSE_HOLD)
+                    self._block.append(data[pos:keep])
+                    self._pending = data[keep:]
+                    return "".join(out)
+                self._inside = False
+                self._block = []
+                pos = match.end()
+            else:
+                match = _THINK_OPEN.search(data, pos)
+                if match is None:
+                    keep = max(pos, len(data) - _OPEN_HOLD)
+                    out.append(data[pos:keep])
+                    self._pending = data[keep:]
+                    return "".join(out)
+                out.append(data[pos:match.start()])
+                self._inside = True
+                self._block = [match.group()]
+                pos = match.end()
+
+    def flush(self):
+        # With no closing tag left, the regex never matched: emit as is
+        text = "".join(self._block) + self._pending if self._inside else self._pending
+        self._pending = ""
+        self._inside = False
+        self._block = []
+        return text
+
+
+class _SelfClosingStage:
+    """Drops <think/> style tags (any whitespace before the slash)."""
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text):
+        data = self._pending + text
+        out = []
+        pos = 0
+        while True:
+            start = _SELF_CLOSING_START.search(data, pos)
+            if start is None:
+                keep = max(pos, len(data) - _SELF_CLOSING_HOLD)
+                out.append(data[pos:keep])
+                self._pending = data[keep:]
+                return "".join(out)
+
+            out.append(data[pos:start.start()])
+            match = _SELF_CLOSING.match(data, start.start())
+            if match is not None:
+                pos = match.end()
+            elif _SELF_CLOSING_PARTIAL.fullmatch(data, start.end()):
+                # Could still become <think /> once more text arrives
+                self._pending = data[start.start():]
+                return "".join(out)
+            else:
+                out.append(data[start.start()])
+                pos = start.start() + 1
+
+    def flush(self):
+        text = self._pending
+        self._pending = ""
+        return text
+
+
+class _WhitespaceStage:
+    """Collapses blank-line runs, strips line ends and both text ends."""
+
+    def __init__(self):
+        self._started = False
+        self._reset_run()
+
+    def _reset_run(self):
+        self._newlines = 0
+        self._lead = ""
+        self._trail = ""
+
+    def _add_whitespace(self, run):
+        newlines = run.count("\n")
+        if newlines:
+            self._newlines += newlines
+            self._trail = run[run.rfind("\n") + 1:]
+        elif self._newlines:
+            self._trail += run
+        else:
+            self._lead += run
+
+    def _pending_run(self):
+        if self._newlines:
+            return "\n" * min(self._newlines, 2) + self._trail
+        return self._lead
+
+    def feed(self, text):
+        # Leading whitespace extends the run carried over from the last chunk
+        start = _LEADING_WS.match(text).end()
+        if start:
+            self._add_whitespace(text[:start])
+        if start == len(text):
+            return ""
+
+        out = []
+        if self._started:
+            out.append(self._pending_run())
+        self._started = True
+        self._reset_run()
+
+        end = len(text.rstrip())
+        out.append(_NEWLINE_RUN.sub(_collapse_newline_run, text[start:end]))
+        if end < len(text):
+            self._add_whitespace(text[end:])
+        return "".join(out)
+
+    def flush(self):
+        # Trailing whitespace of the whole text is dropped
+        self._reset_run()
+        return ""
+
+
+class ThinkTagFilter:
+    """Streaming equivalent of the regex-based <think> tag cleaner."""
+
+    def __init__(self):
+        self._blocks = _ThinkBlockStage()
+        self._self_closing = _SelfClosingStage()
+        self._whitespace = _WhitespaceStage()
+
+    def feed(self, chunk):
+        """Consume a chunk and return the text that is now final."""
+        text = self._blocks.feed(chunk)
+        if text:
+            text = self._self_closing.feed(text)
+        if text:
+            text = self._whitespace.feed(text)
+        return text
+
+    def flush(self):
+        """Return whatever was held back once the stream has ended."""
+        text = self._self_closing.feed(self._blocks.flush()) + self._self_closing.flush()
+        return self._whitespace.feed(text) + self._whitespace.flush()
+
+
+def filter_think_stream(chunks):
+    """Wrap an iterator of chunks, yielding the cleaned text"""
+    think_filter = ThinkTagFilter()
+    for chunk in chunks:
+        text = think_filter.feed(chunk)
+        if text:
+            yield text
+    text = think_filter.flush()
+    if text:
+        yield text
+
+
+def clean_thinking_tags(text):
+    """Clean a complete response with the regex passes"""
+    cleaned_text = _THINK_BLOCK.sub("", text)
+    cleaned_text = _SELF_CLOSING.sub("", cleaned_text)
+    cleaned_text = _BLANK_LINES.sub("\n\n", cleaned_text)
+    lines = [line.rstrip() for line in cleaned_text.split("\n")]
+    return "\n".join(lines).strip()
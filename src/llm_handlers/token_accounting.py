@@ -0,0 +1,155 @@
+"""
+Token accounting for LLM calls.
+Counts prompt and completion tokens per provider/model with a character
+estimate, or with the ``tokenizers`` library when a tokenizer is
+configured or the model runs locally (nothing is downloaded otherwise,
+so offline installs never wait on the network), strips the indentation whitespace the generators'
+triple-quoted prompts carry, and derives an output-token cap per document
+type from what the teacher actually asked for.
+"""
+
+import os
+import re
+import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Tokenizer used for providers whose own tokenizer is not public: a local
+# tokenizer.json file or a Hugging Face Hub name (e.g. "gpt2", downloaded
+# once). Empty uses the character estimate.
+DEFAULT_TOKENIZER = os.getenv("EDUADOCS_TOKENIZER", "")
+
+# Bounds for the per-document output cap
+MIN_OUTPUT_TOKENS = int(os.getenv("EDUADOCS_MIN_OUTPUT_TOKENS", "512"))
+MAX_OUTPUT_TOKENS = int(os.getenv("EDUADOCS_MAX_OUTPUT_TOKENS", "8192"))
+
+# Reasoning models spend part of the output budget on hidden thinking
+REASONING_MODEL_PREFIXES = ("gpt-5", "o1", "o3", "o4", "gemini-2.5")
+REASONING_HEADROOM = 4
+
+# Rough characters-per-token ratio used when no tokenizer can be loaded
+CHARS_PER_TOKEN = 4
+
+_tokenizers_lock = threading.Lock()
+_tokenizers = {}
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+# Counting runs off the request path so it never adds latency
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="token-accounting")
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def compact_prompt(prompt):
+    """Remove indentation and trailing whitespace from a generator prompt"""
+    text = textwrap.dedent(prompt)
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def _get_tokenizer(name):
+    """Load a tokenizer once; remember failures so we don't retry them"""
+    with _tokenizers_lock:
+        if name in _tokenizers:
+            return _tokenizers[name]
+    try:
+        from tokenizers import Tokenizer
+        if os.path.isfile(name):
+            tokenizer = Tokenizer.from_file(name)
+        else:
+            tokenizer = Tokenizer.from_pretrained(name)
+    except Exception:
+        tokenizer = None
+    with _tokenizers_lock:
+        _tokenizers[name] = tokenizer
+    return tokenizer
+
+
+def count_tokens(text, llm_config=None):
+    """Count the tokens of ``text`` for the configured model"""
+    if not text:
+        return 0
+
+    tokenizer = None
+    if llm_config and llm_config.get("provider") == "huggingface" and llm_config.get("use_local"):
+        # Its files are already in the local Hugging Face cache
+        tokenizer = _get_tokenizer(llm_config.get("model"))
+    if tokenizer is None and DEFAULT_TOKENIZER:
+        tokenizer = _get_tokenizer(DEFAULT_TOKENIZER)
+
+    if tokenizer is None:
+        return max(1, len(text) // CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def _record(llm_config, prompt, completion):
+    """Add one call's token counts to the statistics"""
+    key = f"{llm_config.get('provider')}/{llm_config.get('model')}"
+    prompt_tokens = count_tokens(prompt, llm_config)
+    completion_tokens = count_tokens(completion, llm_config)
+    with _stats_lock:
+        entry = _stats.setdefault(key, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+
+
+def record_usage(llm_config, prompt, completion):
+    """Account a provider call in the background"""
+    _executor.submit(_record, dict(llm_config), prompt, completion or "")
+
+
+def get_token_stats():
+    """Return call and token totals per "provider/model"."""
+    with _stats_lock:
+        return {key: dict(entry) for key, entry in _stats.items()}
+
+
+def _option_index(value, markers):
+    """Position of a localized option, matched by its leading word"""
+    normalized = (value or "").lower()
+    for index, words in enumerate(markers):
+        if any(normalized.startswith(word) for word in words):
+            return index
+    return None
+
+
+def reasoning_headroom(llm_config):
+    """How many times the visible output a model's budget must allow for (its hidden thinking)"""
+    model = (llm_config or {}).get("model") or ""
+    return REASONING_HEADROOM if model.startswith(REASONING_MODEL_PREFIXES) else 1
+
+
+def output_token_limit(doc_type_key, params, llm_config=None):
+    """
+    Estimate how many output tokens a document needs.
+
+    Returns None for document types with no sizing parameters, in which
+    case providers keep their own default.
+    """
+    if doc_type_key == "exercise":
+        per_question = 150 if params.get("include_answer_key", True) else 100
+        limit = 250 + int(params.get("num_questions") or 10) * per_question
+    elif doc_type_key == "powerpoint":
+        limit = 150 + int(params.get("num_slides") or 10) * 120
+    elif doc_type_key == "lesson_plan":
+        limit = 800 + int(params.get("duration_minutes") or 50) * 15
+    elif doc_type_key == "lecture_notes":
+        detail = _option_index(params.get("detail_level"), [("brief", "breve"), ("standard", "padr"), ("detail", "detalh")])
+        limit = [1200, 2500, 5000][detail if detail is not None else 1]
+        if params.get("include_references"):
+            limit += 400
+    elif doc_type_key == "mind_map":
+        branches = int(params.get("main_branches") or 6)
+        depth = int(params.get("depth_levels") or 3)
+        limit = 150 + branches * depth * 70
+    elif doc_type_key == "summary":
+        length = _option_index(params.get("summary_length"), [("brief", "breve"), ("detail", "detalh"), ("compre", "abrang")])
+        limit = [1500, 3500, 6000][length if length is not None else 1]
+    else:
+        return None
+
+    headroom = reasoning_headroom(llm_config)
+    return max(MIN_OUTPUT_TOKENS, min(limit * headroom, MAX_OUTPUT_TOKENS * headroom))
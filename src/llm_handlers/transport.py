@@ -0,0 +1,119 @@
+"""
+Shared HTTP transport for the LLM providers.
+Keeps one pooled keep-alive connection pool per host so repeated
+generations reuse TCP/TLS connections instead of reconnecting every time.
+"""
+
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Number of distinct connection pools (one per scheme/host/port) kept per adapter
+POOL_CONNECTIONS = int(os.getenv("EDUADOCS_HTTP_POOL_CONNECTIONS", "4"))
+
+# Maximum number of idle keep-alive connections kept per host
+POOL_MAXSIZE = int(os.getenv("EDUADOCS_HTTP_POOL_MAXSIZE", "16"))
+
+_lock = threading.Lock()
+_adapters = {}
+_local = threading.local()
+
+
+def _host_key(url):
+    """Return the scheme://host:port key used to share a pool"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _get_adapter(host):
+    """Get or create the pooled adapter shared by every thread for a host"""
+    adapter = _adapters.get(host)
+    if adapter is None:
+        with _lock:
+            adapter = _adapters.get(host)
+            if adapter is None:
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_CONNECTIONS,
+                    pool_maxsize=POOL_MAXSIZE
+                )
+                _adapters[host] = adapter
+    return adapter
+
+
+def get_session(url):
+    """
+    Get a keep-alive session for the host of ``url``.
+
+    Sessions hold cookies and other mutable state, so each thread gets its
+    own session object. All of them mount the same per-host adapter, which
+    is where the (thread-safe) urllib3 connection pool lives, so connections
+    are still reused across threads.
+    """
+    host = _host_key(url)
+    sessions = getattr(_local, "sessions", None)
+    if sessions is None:
+        sessions = _local.sessions = {}
+
+    session = sessions.get(host)
+    if session is None:
+        session = requests.Session()
+        session.mount(host, _get_adapter(host))
+        sessions[host] = session
+    return session
+
+
+def request(method, url, **kwargs):
+    """Send a request through the pooled session for the URL's host"""
+    return get_session(url).request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    """Pooled equivalent of requests.get"""
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    """Pooled equivalent of requests.post"""
+    return request("POST", url, **kwargs)
+
+
+def get_transport_stats():
+    """
+    Return connection reuse counters per host.
+
+    ``connections_opened`` counts new TCP connections made by the pools and
+    ``requests`` counts requests sent over them, so ``connections_reused``
+    is how many requests were served on an already-open connection.
+    """
+    stats = {}
+    with _lock:
+        adapters = list(_adapters.items())
+
+    for host, adapter in adapters:
+        pools = adapter.poolmanager.pools
+        opened = 0
+        sent = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            sent += pool.num_requests
+        stats[host] = {
+            "requests": sent,
+            "connections_opened": opened,
+            "connections_reused": max(0, sent - opened)
+        }
+    return stats
+
+
+def close_all():
+    """Close every pooled connection (e.g. on shutdown)"""
+    with _lock:
+        adapters = list(_adapters.values())
+        _adapters.clear()
+    for adapter in adapters:
+        adapter.close()
@@ -0,0 +1,261 @@
+"""
+Content-addressed store for generated files (DOCX, PPTX, ZIP, ...).
+Artifacts are keyed by the SHA-256 of their bytes and written to a disk
+tier once; a bounded in-memory LRU tier keeps recently used ones hot.
+Each session may only keep a limited number of bytes in memory, so many
+open sessions don't pile megabytes of files into the server's RAM; what
+falls out of memory is read back from disk when it is downloaded.
+Identical files are shared between sessions, so an artifact leaves memory
+on a session's account only once no other session still holds it; idle
+sessions are forgotten after a while.
+"""
+
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ARTIFACT_DIR = Path(os.getenv(
+    "EDUADOCS_ARTIFACT_DIR",
+    str(Path(__file__).parent.parent.parent / ".cache" / "artifacts")
+))
+ARTIFACT_MEMORY_MB = float(os.getenv("EDUADOCS_ARTIFACT_MEMORY_MB", "64"))
+ARTIFACT_SESSION_MB = float(os.getenv("EDUADOCS_ARTIFACT_SESSION_MB", "16"))
+ARTIFACT_DISK_MB = float(os.getenv("EDUADOCS_ARTIFACT_DISK_MB", "512"))
+ARTIFACT_SESSION_TTL = float(os.getenv("EDUADOCS_ARTIFACT_SESSION_TTL", "3600"))
+ARTIFACT_MAX_SESSIONS = int(os.getenv("EDUADOCS_ARTIFACT_MAX_SESSIONS", "1000"))
+
+_MB = 1024 * 1024
+
+
+def artifact_key(data):
+    """Key of an artifact: the hash of its bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class _SessionShare:
+    """Keys one session holds in the memory tier, oldest first."""
+
+    __slots__ = ("keys", "bytes", "seen")
+
+    def __init__(self):
+        self.keys = OrderedDict()
+        self.bytes = 0
+        self.seen = time.monotonic()
+
+
+class ArtifactStore:
+    """Two-tier (memory LRU + disk) content-addressed byte store."""
+
+    def __init__(self, path=ARTIFACT_DIR, memory_bytes=int(ARTIFACT_MEMORY_MB * _MB),
+                 session_bytes=int(ARTIFACT_SESSION_MB * _MB), disk_bytes=int(ARTIFACT_DISK_MB * _MB),
+                 session_ttl=ARTIFACT_SESSION_TTL, max_sessions=ARTIFACT_MAX_SESSIONS):
+        """Create a store whose disk tier lives in ``path``."""
+        self.path = Path(path)
+        self.memory_bytes = memory_bytes
+        self.session_bytes = session_bytes
+        self.disk_bytes = disk_bytes
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        # session -> _SessionShare, least recently active first
+        self._sessions = OrderedDict()
+        # key -> sessions holding it in memory
+        self._holders = {}
+        self._disk = None
+        self._disk_used = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+    def _file(self, key):
+        return self.path / key[:2] / key
+
+    def _load_disk_index(self):
+        """Sizes and access times of what is already on disk, read once"""
+        if self._disk is not None:
+            return
+        self._disk = {}
+        if self.path.exists():
+            for directory in self.path.iterdir():
+                if not directory.is_dir():
+                    continue
+                for item in directory.iterdir():
+                    if item.name.startswith("."):
+                        continue
+                    stat = item.stat()
+                    self._disk[item.name] = [stat.st_size, stat.st_mtime]
+                    self._disk_used += stat.st_size
+
+    def _write_disk(self, key, data):
+        """Write an artifact atomically unless it is already there"""
+        target = self._file(key)
+        if target.exists():
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(handle, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, target)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _evict_disk(self):
+        """Delete least recently used files over the disk bound"""
+        if self._disk_used <= self.disk_bytes:
+            return
+        for key, (size, _) in sorted(self._disk.items(), key=lambda item: item[1][1]):
+            if self._disk_used <= self.disk_bytes:
+                break
+            try:
+                self._file(key).unlink()
+            except OSError:
+                pass
+            del self._disk[key]
+            self._disk_used -= size
+            self._stats["evictions"] += 1
+
+    def _drop_memory(self, key):
+        """Remove a key from the memory tier and from every session holding it"""
+        data = self._memory.pop(key, None)
+        if data is not None:
+            self._memory_used -= len(data)
+        for session_id in self._holders.pop(key, ()):
+            share = self._sessions[session_id]
+            share.bytes -= share.keys.pop(key)
+
+    def _unhold(self, session_id, key):
+        """A session lets go of a key; it leaves memory once nobody holds it"""
+        holders = self._holders[key]
+        holders.discard(session_id)
+        if not holders:
+            del self._holders[key]
+            self._drop_memory(key)
+
+    def _drop_session(self, session_id):
+        share = self._sessions.pop(session_id)
+        for key in share.keys:
+            self._unhold(session_id, key)
+
+    def _expire_sessions(self):
+        """Forget sessions idle for longer than the TTL or over the session cap"""
+        cutoff = time.monotonic() - self.session_ttl
+        while self._sessions:
+            session_id, share = next(iter(self._sessions.items()))
+            if share.seen >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            self._drop_session(session_id)
+
+    def _remember(self, key, data, session_id=None):
+        """Put an artifact in the memory tier within the global and session bounds"""
+        if len(data) > min(self.memory_bytes, self.session_bytes):
+            return
+        if key not in self._memory:
+            self._memory[key] = data
+            self._memory_used += len(data)
+        self._memory.move_to_end(key)
+
+        if session_id is not None:
+            share = self._sessions.get(session_id)
+            if share is None:
+                share = self._sessions[session_id] = _SessionShare()
+            share.seen = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            if key not in share.keys:
+                share.keys[key] = len(data)
+                share.bytes += len(data)
+                self._holders.setdefault(key, set()).add(session_id)
+            share.keys.move_to_end(key)
+            # Over the session's share: its oldest artifacts live on disk only
+            while share.bytes > self.session_bytes:
+                old_key, size = share.keys.popitem(last=False)
+                share.bytes -= size
+                self._unhold(session_id, old_key)
+            self._expire_sessions()
+
+        while self._memory_used > self.memory_bytes:
+            self._drop_memory(next(iter(self._memory)))
+
+    def put(self, data, session_id=None):
+        """Store bytes and return their key"""
+        key = artifact_key(data)
+        with self._lock:
+            self._load_disk_index()
+            if key not in self._disk:
+                try:
+                    self._write_disk(key, data)
+                    self._disk[key] = [len(data), time.time()]
+                    self._disk_used += len(data)
+                    self._stats["writes"] += 1
+                    self._evict_disk()
+                except OSError:
+                    # Without a disk tier the file lives in memory only;
+                    # callers rebuild it if it is evicted
+                    self._stats["errors"] += 1
+            self._remember(key, data, session_id)
+        return key
+
+    def get(self, key):
+        """Return an artifact's bytes, reading them from disk if needed, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return data
+            self._load_disk_index()
+
+        try:
+            data = self._file(key).read_bytes()
+        except OSError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        with self._lock:
+            entry = self._disk.get(key)
+            if entry is not None:
+                entry[1] = time.time()
+            self._stats["disk_hits"] += 1
+            self._remember(key, data)
+        return data
+
+    def release_session(self, session_id):
+        """Forget a session's share of the memory tier (its files stay on disk)"""
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop_session(session_id)
+
+    def get_stats(self):
+        """Hit counters and the size of both tiers."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_entries": len(self._disk or {}),
+                "disk_bytes": self._disk_used,
+                "sessions": len(self._sessions)
+            })
+        return stats
+
+
+# Global instance
+_artifact_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """Get or create the global artifact store."""
+    global _artifact_store
+    if _artifact_store is None:
+        with _store_lock:
+            if _artifact_store is None:
+                _artifact_store = ArtifactStore()
+    return _artifact_store
@@ -58,18 +58,19 @@ class LanguageManager:
                 return name
         return None
     
-    def get_text(self, key_path: str, default: str = "") -> str:
+    def get_text(self, key_path: str, default: str = "", lang_code: Optional[str] = None) -> str:
         """
         Get translated text by key path (e.g., "page.title").
         
         Args:
             key_path: Dot-separated path to the text (e.g., "page.title")
             default: Default text if key is not found
+            lang_code: Language to use instead of the session's (e.g. in background jobs)
             
         Returns:
             Translated text or default value
         """
-        lang_code = self.get_current_language()
+        lang_code = lang_code or self.get_current_language()
         lang_dict = self.languages.get(lang_code, {})
         
         keys = key_path.split(".")
@@ -152,13 +153,13 @@ def get_language_manager() -> LanguageManager:
     return _language_manager
 
 
-def i18n(key_path: str, default: str = "") -> str:
+def i18n(key_path: str, default: str = "", lang_code: Optional[str] = None) -> str:
     """
     Convenience function to get translated text.
     
     Usage: i18n("page.title")
     """
-    return get_language_manager().get_text(key_path, default)
+    return get_language_manager().get_text(key_path, default, lang_code)
 
 
 def i18n_list(key_path: str, default: list = None) -> list:
@@ -0,0 +1,98 @@
+"""
+Markdown parser shared by every exporter and the preview.
+Turns LLM output into a flat list of blocks in one linear pass, so the
+DOCX/PPTX builders and the Streamlit preview all work from the same
+structure instead of re-parsing the text line by line themselves.
+"""
+
+from collections import namedtuple
+
+# kind: "heading" | "bullet" | "number" | "paragraph" | "blank" | "rule"
+# level: heading level (1-4) or bullet nesting depth (0 = top level)
+# runs: tuple of (text, bold) inline runs
+Block = namedtuple("Block", ["kind", "level", "runs"])
+
+BULLET_MARKERS = ("- ", "* ", "• ")
+MAX_HEADING_LEVEL = 4
+
+_BLANK = Block("blank", 0, ())
+_RULE = Block("rule", 0, ())
+
+
+def parse_inline(text):
+    """Split ``**bold**`` markup into (text, bold) runs"""
+    if "**" not in text:
+        return ((text, False),) if text else ()
+
+    parts = text.split("**")
+    # An odd number of markers leaves the last one unmatched; keep it literal
+    if len(parts) % 2 == 0:
+        tail = parts.pop()
+        parts[-1] += "**" + tail
+
+    runs = []
+    for index, part in enumerate(parts):
+        if part:
+            runs.append((part, index % 2 == 1))
+    return tuple(runs)
+
+
+def plain_text(runs):
+    """Text of a block with inline markup removed"""
+    return "".join(text for text, _ in runs)
+
+
+def render_inline(runs):
+    """Inline runs back to Markdown text"""
+    return "".join(f"**{text}**" if bold else text for text, bold in runs)
+
+
+def _parse_line(raw_line):
+    """Parse one line into a Block"""
+    line = raw_line.strip()
+    if not line:
+        return _BLANK
+
+    if line.startswith("---"):
+        return _RULE
+
+    if line[0] == "#":
+        hash_count = len(line) - len(line.lstrip("#"))
+        # Malformed headings such as "### ## Title" keep only the text
+        heading_text = line[hash_count:].strip().lstrip("#").strip()
+        if heading_text:
+            return Block("heading", min(hash_count, MAX_HEADING_LEVEL), parse_inline(heading_text))
+
+    if line.startswith(BULLET_MARKERS):
+        indent = len(raw_line) - len(raw_line.lstrip())
+        return Block("bullet", indent // 2, parse_inline(line[2:].strip()))
+
+    if len(line) > 2 and line[0].isdigit() and line[1:3] in (". ", ") "):
+        return Block("number", 0, parse_inline(line[3:].strip()))
+
+    return Block("paragraph", 0, parse_inline(line))
+
+
+def parse_markdown(content):
+    """Parse Markdown content into a list of Blocks"""
+    if not content:
+        return []
+    return [_parse_line(line) for line in content.split("\n")]
+
+
+def render_markdown(blocks):
+    """Render Blocks back to clean Markdown (used for the preview)"""
+    lines = []
+    for block in blocks:
+        text = render_inline(block.runs)
+        if block.kind == "heading":
+            lines.append("#" * block.level + " " + text)
+        elif block.kind == "bullet":
+            lines.append("  " * block.level + "- " + text)
+        elif block.kind == "number":
+            lines.append("1. " + text)
+        elif block.kind == "paragraph":
+            lines.append(text)
+        elif block.kind == "blank":
+            lines.append("")
+    return "\n".join(lines)